@@ -0,0 +1,373 @@
+"""
+Local HTTP/JSON scoring service.
+
+Exposes duplicate groups, similarity scoring and diffs without the Shiny UI, for
+pipelines calling botmirror at high request rates. Embedding requests arriving
+concurrently are micro-batched into single ``encode`` calls through a bounded
+async queue; when the queue is full, requests are rejected with 503 and a
+Retry-After header instead of piling up.
+
+Endpoints:
+    GET  /health
+    GET  /dockets/{docket_id}/groups?top_n=20
+    POST /dockets/{docket_id}/similarities  {"reference_hash", "string_weight", "top_k"}
+    POST /embed                             {"texts": [...]}
+    POST /score                             {"reference", "texts": [...]}
+    POST /diff                              {"a", "b"}
+
+Usage:
+    python api.py --host 127.0.0.1 --port 8001
+"""
+
+import asyncio
+import contextlib
+from collections import OrderedDict
+
+import numpy as np
+import polars as pl
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from botmirror import (
+    STRING_SCORER,
+    get_duplicate_groups,
+    raw_similarities,
+    weight_similarities,
+    with_comments,
+)
+from data import fetch_comments_df
+from diff import word_diff_html
+from embeddings import DEFAULT_BACKEND, DEFAULT_MODEL, encode_texts, get_model
+from instrument import span
+
+# Loaded docket frames kept in memory by the service
+DOCKET_CACHE_SIZE = 4
+
+MAX_BATCH_TEXTS = 256
+MAX_WAIT_MS = 5
+MAX_QUEUED_REQUESTS = 1024
+MAX_TEXTS_PER_REQUEST = 1024
+
+
+class Overloaded(Exception):
+    """Raised when the embedding queue is full."""
+
+
+class MicroBatcher:
+    """
+    Collect concurrent embedding requests into single encode calls.
+
+    Requests are queued; a single worker task takes the first waiting request, then
+    keeps adding requests until the batch holds ``max_batch`` texts or
+    ``max_wait_ms`` have passed, and encodes the whole batch at once in a thread
+    (identical texts across requests are encoded once, see encode_texts).
+    """
+
+    def __init__(
+        self,
+        encode,
+        max_batch: int = MAX_BATCH_TEXTS,
+        max_wait_ms: float = MAX_WAIT_MS,
+        max_queued: int = MAX_QUEUED_REQUESTS,
+    ):
+        self.encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued)
+        self.batches = 0
+        self._worker: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._worker
+
+    async def submit(self, texts: list[str]) -> np.ndarray:
+        """Embed texts with the next batch; raises Overloaded when the queue is full."""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((texts, future))
+        except asyncio.QueueFull:
+            raise Overloaded from None
+        return await future
+
+    async def _next_batch(self) -> list[tuple[list[str], asyncio.Future]]:
+        batch = [await self.queue.get()]
+        n_texts = len(batch[0][0])
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while n_texts < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except TimeoutError:
+                break
+            batch.append(item)
+            n_texts += len(item[0])
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            # Skip requests whose client went away while queued
+            batch = [(texts, future) for texts, future in batch if not future.done()]
+            if not batch:
+                continue
+            texts = [text for request_texts, _ in batch for text in request_texts]
+            try:
+                with span("api_encode_batch", rows=len(texts), requests=len(batch)):
+                    vectors = await asyncio.to_thread(self.encode, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+
+            start = 0
+            for request_texts, future in batch:
+                stop = start + len(request_texts)
+                if not future.done():
+                    future.set_result(vectors[start:stop])
+                start = stop
+
+
+def encode(texts: list[str]) -> np.ndarray:
+    """Normalized embeddings with the default model and backend."""
+    return encode_texts(get_model(DEFAULT_MODEL, DEFAULT_BACKEND), texts)
+
+
+_dockets: OrderedDict[str, asyncio.Task] = OrderedDict()
+
+
+async def load_docket(docket_id: str) -> pl.DataFrame:
+    """
+    Docket frame, loaded once in a thread and kept in a small LRU.
+
+    Concurrent requests for a docket that is still loading await the same task.
+    """
+    task = _dockets.get(docket_id)
+    failed = task is not None and task.done() and (task.cancelled() or task.exception())
+    if task is None or failed:
+        task = asyncio.create_task(asyncio.to_thread(fetch_comments_df, docket_id))
+        _dockets[docket_id] = task
+        if len(_dockets) > DOCKET_CACHE_SIZE:
+            _dockets.popitem(last=False)
+    _dockets.move_to_end(docket_id)
+
+    df = await task
+    if df.is_empty():
+        raise HTTPException(404, f"Docket {docket_id} not found")
+    return df
+
+
+async def read_json(request: Request) -> dict:
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(400, "Request body must be JSON") from None
+    if not isinstance(body, dict):
+        raise HTTPException(400, "Request body must be a JSON object")
+    return body
+
+
+def read_texts(body: dict, field: str = "texts") -> list[str]:
+    texts = body.get(field)
+    if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+        raise HTTPException(400, f"'{field}' must be a list of strings")
+    if len(texts) > MAX_TEXTS_PER_REQUEST:
+        raise HTTPException(413, f"At most {MAX_TEXTS_PER_REQUEST} texts per request")
+    return texts
+
+
+def read_number(value, field: str, cast: type = int) -> int | float:
+    """Parses a numeric request parameter, raising a 400 for bad input."""
+    if isinstance(value, bool):
+        value = None
+    try:
+        number = cast(value)
+    except (TypeError, ValueError):
+        raise HTTPException(400, f"'{field}' must be a number") from None
+    if cast is int and number < 1:
+        raise HTTPException(400, f"'{field}' must be a positive integer")
+    return number
+
+
+async def embed_batched(request: Request, texts: list[str]) -> np.ndarray:
+    try:
+        return await request.app.state.batcher.submit(texts)
+    except Overloaded:
+        raise HTTPException(
+            503, "Embedding queue is full, retry later", headers={"Retry-After": "1"}
+        ) from None
+
+
+async def health(request: Request) -> JSONResponse:
+    batcher = request.app.state.batcher
+    return JSONResponse(
+        {
+            "status": "ok",
+            "queued": batcher.queue.qsize(),
+            "batches": batcher.batches,
+            "dockets_loaded": list(_dockets),
+        }
+    )
+
+
+async def groups(request: Request) -> JSONResponse:
+    docket_id = request.path_params["docket_id"]
+    top_n = read_number(request.query_params.get("top_n", 20), "top_n")
+
+    df = await load_docket(docket_id)
+    groups_df = await asyncio.to_thread(get_duplicate_groups, df)
+    rows = (
+        groups_df.head(top_n)
+        .select(
+            "content_hash",
+            pl.col("len").alias("count"),
+            "n_variants",
+            pl.col("comment").list.first().alias("comment"),
+        )
+        .to_dicts()
+    )
+    return JSONResponse({"docket_id": docket_id, "groups": rows})
+
+
+async def similarities(request: Request) -> JSONResponse:
+    docket_id = request.path_params["docket_id"]
+    body = await read_json(request)
+    reference_hash = body.get("reference_hash")
+    string_weight = read_number(body.get("string_weight", 0.3), "string_weight", float)
+    top_k = read_number(body.get("top_k", 50), "top_k")
+    if not isinstance(reference_hash, str):
+        raise HTTPException(400, "'reference_hash' is required")
+    if not 0 <= string_weight <= 1:
+        raise HTTPException(400, "'string_weight' must be between 0 and 1")
+
+    df = await load_docket(docket_id)
+    reference = df.filter(pl.col("content_hash") == reference_hash)
+    if reference.is_empty():
+        raise HTTPException(404, f"No comment with content_hash {reference_hash}")
+
+    # Shares the app's score cache and single-flight coalescing
+    raw_df = await asyncio.to_thread(
+        raw_similarities,
+        df=df,
+        reference_text=reference["comment"][0],
+        exclude_hash=reference_hash,
+        docket_id=docket_id,
+    )
+    scores = weight_similarities(
+        with_comments(df, raw_df, reference_hash),
+        string_weight=string_weight,
+        embedding_weight=1 - string_weight,
+    )
+    return JSONResponse(
+        {
+            "docket_id": docket_id,
+            "reference_hash": reference_hash,
+            "n_compared": len(scores),
+            "scores": scores.head(top_k).to_dicts(),
+        }
+    )
+
+
+async def embed(request: Request) -> JSONResponse:
+    texts = read_texts(await read_json(request))
+    vectors = await embed_batched(request, texts)
+    return JSONResponse({"model": DEFAULT_MODEL, "embeddings": vectors.tolist()})
+
+
+async def score(request: Request) -> JSONResponse:
+    """String and embedding similarity (0-100) of texts to a reference."""
+    body = await read_json(request)
+    reference = body.get("reference")
+    if not isinstance(reference, str):
+        raise HTTPException(400, "'reference' must be a string")
+    texts = read_texts(body)
+
+    vectors = await embed_batched(request, [reference, *texts])
+    embedding_similarity = (vectors[1:] @ vectors[0] + 1) * 50
+    return JSONResponse(
+        {
+            "scores": [
+                {
+                    "similarity": STRING_SCORER(text, reference),
+                    "embedding_similarity": float(e),
+                }
+                for text, e in zip(texts, embedding_similarity)
+            ]
+        }
+    )
+
+
+async def diff(request: Request) -> JSONResponse:
+    body = await read_json(request)
+    a, b = body.get("a"), body.get("b")
+    if not isinstance(a, str) or not isinstance(b, str):
+        raise HTTPException(400, "'a' and 'b' must be strings")
+    a_html, b_html = await asyncio.to_thread(word_diff_html, a, b)
+    return JSONResponse({"a_html": a_html, "b_html": b_html})
+
+
+async def http_error(request: Request, exc: HTTPException) -> JSONResponse:
+    return JSONResponse(
+        {"error": exc.detail}, status_code=exc.status_code, headers=exc.headers
+    )
+
+
+def create_app(encode_fn=encode, **batcher_kwargs) -> Starlette:
+    """
+    Build the service.
+
+    Args:
+        encode_fn: Function embedding a list of texts into normalized vectors
+        **batcher_kwargs: MicroBatcher settings (max_batch, max_wait_ms, max_queued)
+    """
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app: Starlette):
+        app.state.batcher = MicroBatcher(encode_fn, **batcher_kwargs)
+        app.state.batcher.start()
+        yield
+        await app.state.batcher.stop()
+
+    return Starlette(
+        routes=[
+            Route("/health", health),
+            Route("/dockets/{docket_id}/groups", groups),
+            Route("/dockets/{docket_id}/similarities", similarities, methods=["POST"]),
+            Route("/embed", embed, methods=["POST"]),
+            Route("/score", score, methods=["POST"]),
+            Route("/diff", diff, methods=["POST"]),
+        ],
+        exception_handlers={HTTPException: http_error},
+        lifespan=lifespan,
+    )
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+
+    args = parser.parse_args()
+
+    uvicorn.run(app, host=args.host, port=args.port)
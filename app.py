@@ -1,16 +1,41 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
 import polars as pl
 import numpy as np
 import faicons as fa
-from shiny import App, reactive, render, ui
+from shiny import App, reactive, render, req, ui
 from shinywidgets import output_widget, render_widget
-import plotly.express as px
 from plotly import graph_objects as go
-import difflib
+from pathlib import Path
 from data import (
-    get_unique_docket_ids,
+    CONTENT_HASH_INDEX,
+    EXPLORER_PAGE_SIZE,
+    EXPLORER_SORTS,
+    comments_page,
+    get_docket_partitions,
     fetch_comments_df,
+    other_docket_counts,
 )
-from botmirror import get_duplicate_groups, calculate_similarities
+from bursts import burst_scores
+from botmirror import (
+    get_duplicate_groups,
+    group_key,
+    cached_raw_similarities,
+    raw_similarities,
+    weight_similarities,
+    with_comments,
+)
+from embedding_map import MAP_MAX_POINTS, bin_points, docket_map_frame
+from embedding_store import EMBEDDING_CACHE_DIR
+from diff import DIFF_CSS, MATCH_CLASS, DELETE_CLASS, INSERT_CLASS, word_diff_html
+from instrument import span, spans_frame
+from sketches import load_docket_sketch
+from slots import FAMILY_MIN_SIMILARITY, detect_slots, near_duplicate_family
+
+# Pipeline spans are logged as JSON lines on the "botmirror" logger
+logging.basicConfig(level=logging.INFO, format="%(message)s")
 
 
 ICONS = {
@@ -21,96 +46,78 @@ ICONS = {
 
 DEFAULT_AGENCIES = ["DEA"]
 
+# Characters of each comment shown in the comment explorer
+PREVIEW_CHARS = 300
+
 df = None
-all_docket_labels, agency_codes, years = get_unique_docket_ids()
 
 
-def create_word_diff_html(text1, text2):
-    """Create HTML with word-level diff highlighting between two texts, highlighting whitespace changes."""
-    if not text1 or not text2:
-        return text1 or text2, text2 or text1
+def in_background(name: str, fn) -> Future:
+    """Run fn once in a daemon thread; the returned future holds its result."""
+    future = Future()
 
-    # Split text into tokens that preserve whitespace structure
-    import re
+    def run():
+        try:
+            with span(name):
+                future.set_result(fn())
+        except Exception as e:
+            future.set_exception(e)
 
-    def tokenize_with_whitespace(text):
-        """Split text into tokens while preserving line breaks and spacing."""
-        # Split on whitespace but keep the whitespace as separate tokens
-        tokens = re.split(r"(\s+)", text)
-        return [token for token in tokens if token]  # Remove empty strings
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return future
 
-    tokens1 = tokenize_with_whitespace(text1)
-    tokens2 = tokenize_with_whitespace(text2)
 
-    matcher = difflib.SequenceMatcher(None, tokens1, tokens2)
-    opcodes = matcher.get_opcodes()
+def _warm_model():
+    # Imports sentence_transformers/torch and loads the model
+    from botmirror import get_model
 
-    def highlight_whitespace(token, color):
-        """Highlight whitespace tokens to make them visible."""
-        if "\n" in token:
-            # Replace newlines with visible symbol and highlight
-            visible_token = token.replace("\n", "↵\n")
-            return f'<span style="background-color: {color}; padding: 0px 1px; border-radius: 2px; font-size: 0.8em;">{visible_token}</span>'
-        else:
-            # Regular spaces - make them visible with a subtle background
-            return f'<span style="background-color: {color}; padding: 0px 1px; border-radius: 2px;">{token}</span>'
-
-    def build_html_for_text1(tokens1, tokens2, opcodes):
-        html_parts = []
-        for tag, i1, i2, j1, j2 in opcodes:
-            segment_tokens = tokens1[i1:i2]
-
-            if tag == "equal":
-                # Matching tokens
-                for token in segment_tokens:
-                    if token.strip():  # Non-whitespace token
-                        html_parts.append(
-                            f'<span style="background-color: #d4edda; padding: 1px 2px; border-radius: 2px;">{token}</span>'
-                        )
-                    else:  # Whitespace token - show as matching
-                        html_parts.append(
-                            f'<span style="background-color: #d4edda; padding: 0px 1px; border-radius: 2px;">{token}</span>'
-                        )
-            elif tag in ["delete", "replace"]:
-                # Tokens only in first text
-                for token in segment_tokens:
-                    if token.strip():  # Non-whitespace token
-                        html_parts.append(
-                            f'<span style="background-color: #f8d7da; padding: 1px 2px; border-radius: 2px;">{token}</span>'
-                        )
-                    else:  # Whitespace token - highlight as deleted
-                        html_parts.append(highlight_whitespace(token, "#f8d7da"))
-        return "".join(html_parts)
-
-    def build_html_for_text2(tokens1, tokens2, opcodes):
-        html_parts = []
-        for tag, i1, i2, j1, j2 in opcodes:
-            if tag == "equal":
-                segment_tokens = tokens2[j1:j2]
-                for token in segment_tokens:
-                    if token.strip():  # Non-whitespace token
-                        html_parts.append(
-                            f'<span style="background-color: #d4edda; padding: 1px 2px; border-radius: 2px;">{token}</span>'
-                        )
-                    else:  # Whitespace token - show as matching
-                        html_parts.append(
-                            f'<span style="background-color: #d4edda; padding: 0px 1px; border-radius: 2px;">{token}</span>'
-                        )
-            elif tag in ["insert", "replace"]:
-                segment_tokens = tokens2[j1:j2]
-                for token in segment_tokens:
-                    if token.strip():  # Non-whitespace token
-                        html_parts.append(
-                            f'<span style="background-color: #d1ecf1; padding: 1px 2px; border-radius: 2px;">{token}</span>'
-                        )
-                    else:  # Whitespace token - highlight as inserted
-                        html_parts.append(highlight_whitespace(token, "#d1ecf1"))
-        return "".join(html_parts)
+    return get_model()
+
+
+# Scan the parquet hive for the docket catalog while the server starts, so the
+# shell page is served right away; sessions fill the pickers once it is ready
+catalog = in_background("catalog", get_docket_partitions)
 
-    html1 = build_html_for_text1(tokens1, tokens2, opcodes)
-    html2 = build_html_for_text2(tokens1, tokens2, opcodes)
+_model_lock = threading.Lock()
+_model_warmup: Future | None = None
 
-    return html1, html2
+
+def warm_model() -> Future:
+    """Start loading the embedding model in the background (once per process)."""
+    global _model_warmup
+
+    with _model_lock:
+        if _model_warmup is None:
+            _model_warmup = in_background("warm_model", _warm_model)
+        return _model_warmup
+
+
+def filter_catalog(
+    partitions: pl.DataFrame, agency_codes: list[str] = [], years: list[int] = []
+) -> list[str]:
+    """Docket ids of the catalog, restricted to the given agencies and years."""
+    if agency_codes:
+        partitions = partitions.filter(pl.col("agency_code").is_in(agency_codes))
+    if years:
+        partitions = partitions.filter(pl.col("year").is_in(years))
+
+    return partitions["docket_id"].unique().sort().to_list()
+
+
+def create_word_diff_html(text1, text2, ref_hash=None, compared_hash=None):
+    """
+    Create HTML with word-level diff highlighting between two texts, highlighting whitespace changes.
+
+    Adjacent tokens with the same diff state are merged into one span styled via the
+    CSS classes in ``diff.DIFF_CSS``. Results are cached per (ref_hash, compared_hash).
+    """
+    if not text1 or not text2:
+        return text1 or text2, text2 or text1
+
+    with span("render_diff", chars=len(text1) + len(text2)):
+        return word_diff_html(
+            text1, text2, ref_hash=ref_hash, compared_hash=compared_hash
+        )
 
 
 def _placeholder_fig(annotation_text: str = ""):
@@ -135,23 +142,77 @@ def _placeholder_fig(annotation_text: str = ""):
     return fig
 
 
+def with_burst_scores(df: pl.DataFrame, duplicates_df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Add each duplicate group's burst_score (share of its copies received in its
+    busiest hour) to the output of get_duplicate_groups.
+
+    Bursts are scored over every raw variant of a group, keyed like the groups.
+    """
+    if "receive_date" not in df.columns:
+        return duplicates_df.with_columns(
+            pl.lit(None, dtype=pl.Float64).alias("burst_score")
+        )
+
+    key_col = group_key(df)
+    bursts_df = burst_scores(df, group_col=key_col).select(key_col, "burst_score")
+    if key_col != "content_hash":
+        # Groups are identified by the content_hash of their first variant
+        bursts_df = (
+            df.select("content_hash", key_col)
+            .unique("content_hash")
+            .join(bursts_df, on=key_col)
+            .select("content_hash", "burst_score")
+        )
+    return duplicates_df.join(
+        bursts_df, on="content_hash", how="left", maintain_order="left"
+    )
+
+
+def _sketch_fig(estimates: dict):
+    """Bar chart of a docket sketch's most copied texts, shown while it loads."""
+    top = estimates["top"].filter(pl.col("count") > 1)
+    if top.is_empty():
+        return _placeholder_fig("Loading docket…")
+
+    fig = go.Figure(
+        go.Bar(
+            x=np.arange(len(top)) + 1,
+            y=top["count"].to_list(),
+            customdata=top.select("error", "comment").rows(),
+            hovertemplate="<b>Count:</b> ~%{y} (+%{customdata[0]} at most)<br>%{customdata[1]}<extra></extra>",
+            marker_color="lightgray",
+        )
+    )
+    fig.update_layout(
+        title="Most copied comments (estimated from the ingest sketch, loading docket…)",
+        yaxis_title="Count",
+        yaxis_type="log",
+        xaxis_title="Comment ID",
+        template="plotly_white",
+    )
+    return fig
+
+
 main_pannel = ui.page_sidebar(
     ui.sidebar(
+        ui.output_ui(id="readiness"),
         ui.input_checkbox_group(
             id="agency_picker",
             label="Select Agency Code",
-            choices=agency_codes,
-            selected=agency_codes,
+            choices=[],
         ),
         ui.input_selectize(
-            id="year_picker", label="Select Year", choices=years, multiple=True
+            id="year_picker", label="Select Year", choices=[], multiple=True
         ),
         ui.input_select(
             id="docket_picker",
             label="Select Docket ID",
-            choices=all_docket_labels,
+            choices=[],
         ),
+        ui.input_switch(id="show_diagnostics", label="Show diagnostics"),
     ),
+    ui.head_content(ui.tags.style(DIFF_CSS)),
     ui.card(
         ui.card_header("Overview"),
         ui.layout_columns(
@@ -175,10 +236,65 @@ main_pannel = ui.page_sidebar(
             ),
             fill=False,
         ),
-        # ui.output_data_frame(id="preview"),
+        ui.output_ui(id="sketch_summary"),
         output_widget(id="duplicates_plot"),
     ),
     ui.br(),
+    ui.card(
+        ui.card_header("Comments"),
+        ui.layout_columns(
+            ui.input_radio_buttons(
+                id="explorer_scope",
+                label="Show",
+                choices={
+                    "docket": "Whole docket",
+                    "group": "Selected group",
+                    "family": "Similarity range",
+                },
+                selected="docket",
+                inline=True,
+            ),
+            ui.input_text(
+                id="explorer_search",
+                label="Contains",
+                placeholder="Press Enter to search",
+                update_on="blur",
+            ),
+            ui.input_select(
+                id="explorer_sort",
+                label="Sort by",
+                choices=EXPLORER_SORTS,
+            ),
+            ui.input_switch(id="explorer_descending", label="Descending"),
+        ),
+        ui.layout_columns(
+            ui.input_action_button(id="explorer_prev", label="Previous"),
+            ui.output_text(id="explorer_status"),
+            ui.input_action_button(id="explorer_next", label="Next"),
+            col_widths=[2, 8, 2],
+        ),
+        ui.output_data_frame(id="preview"),
+    ),
+    ui.br(),
+    ui.card(
+        ui.card_header("Embedding map"),
+        ui.layout_columns(
+            ui.input_action_button(
+                id="compute_map",
+                label="Build embedding map",
+                style="max-width: 300px;",
+            ),
+            ui.input_radio_buttons(
+                id="map_color",
+                label="Color by",
+                choices={"group": "Duplicate group", "cluster": "Cluster"},
+                selected="group",
+                inline=True,
+            ),
+        ),
+        output_widget(id="embedding_map"),
+    ),
+    ui.br(),
     ui.card(
         ui.card_header("Similarity analysis"),
         ui.output_text(id="selected_docket"),
@@ -200,6 +316,14 @@ main_pannel = ui.page_sidebar(
             },
             selected="similarity_w",
         ),
+        ui.input_slider(
+            id="string_weight",
+            label="Weight of string similarity (embedding weight = 1 - string weight)",
+            min=0,
+            max=1,
+            value=0.3,
+            step=0.05,
+        ),
         ui.input_slider(
             id="similarity_range",
             label="Similarity Score Range",
@@ -214,15 +338,18 @@ main_pannel = ui.page_sidebar(
                 "Color legend: ",
                 ui.span(
                     "Matching",
-                    style="background-color: #d4edda; padding: 2px 4px; margin: 0 4px; border-radius: 3px;",
+                    class_=MATCH_CLASS,
+                    style="padding: 2px 4px; margin: 0 4px; border-radius: 3px;",
                 ),
                 ui.span(
                     "Reference only",
-                    style="background-color: #f8d7da; padding: 2px 4px; margin: 0 4px; border-radius: 3px;",
+                    class_=DELETE_CLASS,
+                    style="padding: 2px 4px; margin: 0 4px; border-radius: 3px;",
                 ),
                 ui.span(
                     "Compared only",
-                    style="background-color: #d1ecf1; padding: 2px 4px; margin: 0 4px; border-radius: 3px;",
+                    class_=INSERT_CLASS,
+                    style="padding: 2px 4px; margin: 0 4px; border-radius: 3px;",
                 ),
                 " (includes words and whitespace/line breaks)",
                 style="font-size: 0.9em; margin-bottom: 10px; text-align: center;",
@@ -236,21 +363,129 @@ main_pannel = ui.page_sidebar(
                 ui.output_ui(id="compared_comment"),
             ),
         ),
+        ui.card(
+            ui.card_header(
+                f"Template slots (comments at least {FAMILY_MIN_SIMILARITY}% "
+                "similar to the reference)"
+            ),
+            ui.output_ui(id="template_slots"),
+        ),
+    ),
+    ui.panel_conditional(
+        "input.show_diagnostics",
+        ui.card(
+            ui.card_header("Diagnostics (recent pipeline spans)"),
+            ui.output_data_frame(id="diagnostics"),
+        ),
     ),
 )
 
 
 def server(input, output, session):
+    catalog_df = reactive.value(None)
+
+    # The first session starts loading the model, ahead of any similarity click
+    model_warmup = warm_model()
+
+    @reactive.effect
+    def populate_catalog():
+        """Fill the pickers once the background catalog scan has finished."""
+        if not catalog.done():
+            reactive.invalidate_later(0.5)
+            return
+        if catalog.exception() is not None:
+            return
+
+        with reactive.isolate():
+            if catalog_df.get() is not None:
+                return
+
+        partitions = catalog.result()
+        agency_codes = partitions["agency_code"].unique().sort().to_list()
+        years = partitions["year"].unique().sort().to_list()
+
+        ui.update_checkbox_group(
+            id="agency_picker", choices=agency_codes, selected=agency_codes
+        )
+        ui.update_selectize(id="year_picker", choices=years)
+        ui.update_select(id="docket_picker", choices=filter_catalog(partitions))
+        catalog_df.set(partitions)
+
+    @render.ui
+    def readiness():
+        """Readiness of the docket catalog and the embedding model."""
+        if not (catalog.done() and model_warmup.done()):
+            reactive.invalidate_later(1)
+
+        def status(future, label):
+            if not future.done():
+                return ui.span(f"{label}: loading…", class_="badge bg-secondary")
+            if future.exception() is not None:
+                return ui.span(
+                    f"{label}: unavailable",
+                    class_="badge bg-danger",
+                    title=repr(future.exception()),
+                )
+            return ui.span(f"{label}: ready", class_="badge bg-success")
+
+        return ui.div(
+            status(catalog, "Dockets"),
+            " ",
+            status(model_warmup, "Model"),
+        )
+
+    docket_load = reactive.value(None)
+
+    @reactive.effect
+    def start_load():
+        """Load the picked docket in a worker thread; the overview shows its sketch meanwhile."""
+        docket_id = input.docket_picker()
+        req(docket_id)
+        docket_load.set(
+            in_background(
+                f"load_docket:{docket_id}",
+                lambda: fetch_comments_df(docket_id=docket_id),
+            )
+        )
+
+    @reactive.calc
+    def loaded_frame() -> pl.DataFrame | None:
+        """The picked docket once loaded, None while it is loading."""
+        future = docket_load.get()
+        req(future)
+        if not future.done():
+            reactive.invalidate_later(0.25)
+            return None
+        return future.result()
+
     @reactive.calc
     def load_data():
         global df
 
-        df = fetch_comments_df(docket_id=input.docket_picker())
+        df = loaded_frame()
+        req(df is not None)
 
         return df
 
+    @reactive.calc
+    def docket_sketch():
+        """Estimates from the picked docket's ingest sketch (None without one)."""
+        req(input.docket_picker())
+        return load_docket_sketch(input.docket_picker())
+
+    def estimated(key: str, approximate: bool = True):
+        """A sketch estimate for a value box until the docket is loaded."""
+        estimates = docket_sketch()
+        req(estimates)
+        value = f"{estimates[key]:,}"
+        if not approximate:
+            return value
+        return ui.span(
+            f"~{value}", title="Estimated from the ingest sketch; loading the docket…"
+        )
+
     @reactive.effect
-    def compute_similarities():
+    async def compute_similarities():
         current_count = input.compute_similarity()
         old_count = last_button_count.get()
         clicked_data = clicked_bar.get()
@@ -260,13 +495,10 @@ def server(input, output, session):
             with ui.Progress() as p:
                 comments_df = load_data()
 
-                # Get the point index to access customdata
-                point_index = clicked_data["points"].point_inds[0]
-                trace = clicked_data["trace"]
-
-                # Access customdata from the trace
-                ref_text = trace.customdata[point_index][0]
-                content_hash = trace.customdata[point_index][1]
+                # Set by a click on the duplicates plot or the embedding map
+                with reactive.isolate():
+                    ref_text = reference_text.get()
+                    content_hash = reference_hash.get()
 
                 n_comments_to_compare = len(
                     comments_df.filter(pl.col("content_hash") != content_hash)
@@ -276,28 +508,68 @@ def server(input, output, session):
                     message=f"Computing similarities over {n_comments_to_compare:,} comments. Hang on..."
                 )
 
-                similarity_df = calculate_similarities(
-                    df=comments_df, reference_text=ref_text, exclude_hash=content_hash
-                )
-
-                print(f"Similarity results shape: {similarity_df.shape}")
-                print(f"Top 5 similar comments:\n{similarity_df.head()}")
-
-                # Store the results
-                similarity_results.set(similarity_df)
+                docket_id = input.docket_picker()
+                with span(
+                    "compute_similarities",
+                    docket_id=docket_id,
+                    reference_hash=content_hash,
+                ) as s:
+                    # Scored in a worker thread so other sessions stay responsive;
+                    # sessions requesting the same (docket, reference) concurrently
+                    # share one computation (see raw_similarities)
+                    raw_df = await asyncio.to_thread(
+                        raw_similarities,
+                        df=comments_df,
+                        reference_text=ref_text,
+                        exclude_hash=content_hash,
+                        docket_id=docket_id,
+                    )
+                    s["rows"] = len(raw_df)
 
-                print(f"old_count: {old_count}")
-                print(f"current_count: {current_count}")
+                # Store the raw scores; weights are applied in similarity_scores()
+                similarity_results.set(with_comments(comments_df, raw_df, content_hash))
 
                 # Update the stored count
                 last_button_count.set(current_count)
 
+    @reactive.effect
+    def show_cached_similarities():
+        """Show scores right away when the clicked reference was scored before."""
+        clicked_data = clicked_bar.get()
+        if not clicked_data:
+            return
+
+        with reactive.isolate():
+            content_hash = reference_hash.get()
+            docket_id = input.docket_picker()
+            raw_df = cached_raw_similarities(docket_id, content_hash)
+            if raw_df is not None:
+                similarity_results.set(with_comments(load_data(), raw_df, content_hash))
+
+    @reactive.calc
+    def similarity_scores():
+        """Raw scores combined with the current weights."""
+        similarity_df = similarity_results.get()
+        if similarity_df is None:
+            return None
+
+        string_weight = input.string_weight()
+        return weight_similarities(
+            similarity_df,
+            string_weight=string_weight,
+            embedding_weight=1 - string_weight,
+        )
+
     @reactive.effect
     def _():
+        partitions = catalog_df.get()
+        if partitions is None:
+            return
+
         years_new = [int(v) for v in input.year_picker()]
 
-        docket_ids_new, _, _ = get_unique_docket_ids(
-            agency_codes=input.agency_picker(), years=years_new
+        docket_ids_new = filter_catalog(
+            partitions, agency_codes=list(input.agency_picker()), years=years_new
         )
 
         ui.update_select(
@@ -309,7 +581,7 @@ def server(input, output, session):
     @reactive.effect
     def update_similarity_range():
         """Update similarity range slider based on selected metric and available data."""
-        similarity_df = similarity_results.get()
+        similarity_df = similarity_scores()
         selected_metric = input.similarity_metric()
 
         if similarity_df is not None and not similarity_df.is_empty():
@@ -341,14 +613,21 @@ def server(input, output, session):
 
     @render.ui
     def total_comments():
+        if loaded_frame() is None:
+            # The sketch's row count is exact as of the ingest
+            return estimated("n_comments", approximate=False)
         return f"{len(load_data()):,}"
 
     @render.ui
     def unique_comments():
+        if loaded_frame() is None:
+            return estimated("unique_comments")
         return f"{len(load_data()['content_hash'].unique()):,}"
 
     @render.ui
     def total_duplicates():
+        if loaded_frame() is None:
+            return estimated("duplicate_groups")
         df = load_data()
 
         if df.is_empty():
@@ -357,12 +636,30 @@ def server(input, output, session):
             duplicates_df = get_duplicate_groups(load_data())
         return f"{len(duplicates_df):,}"
 
+    @render.ui
+    def sketch_summary():
+        """Share of sampled comments close to a top template, from the sketch."""
+        estimates = docket_sketch()
+        req(estimates and estimates["similarity"])
+        histogram = estimates["similarity"]
+        counts = np.array(histogram["counts"])
+        near = counts[np.array(histogram["edges"][:-1]) >= 80].sum()
+        share = near / max(counts.sum(), 1)
+        return ui.p(
+            f"~{share:.0%} of comments are at least 80% similar to one of the "
+            f"most copied texts (sample of {histogram['sample_size']:,} distinct "
+            "comments at ingest).",
+            class_="text-muted small",
+        )
+
     clicked_bar = reactive.value(None)
     clicked_line = reactive.value(None)
     similarity_results = reactive.value(None)
     last_button_count = reactive.value(0)
     reference_text = reactive.value("")
     compared_text = reactive.value("")
+    reference_hash = reactive.value(None)
+    compared_hash = reactive.value(None)
 
     def clear_markers(fig_widget, marker_color, marker_type):
         # Remove existing red bar traces
@@ -391,6 +688,7 @@ def server(input, output, session):
         point_index = points.point_inds[0]
         ref_text = trace.customdata[point_index][0]
         reference_text.set(ref_text)
+        reference_hash.set(trace.customdata[point_index][1])
 
         # Get the parent figure widget from the trace
         fig_widget = trace.parent
@@ -413,6 +711,12 @@ def server(input, output, session):
 
     @render_widget
     def duplicates_plot():
+        if loaded_frame() is None:
+            estimates = docket_sketch()
+            if estimates is None:
+                return _placeholder_fig("Loading docket…")
+            return _sketch_fig(estimates)
+
         df = load_data()
 
         if df.is_empty():
@@ -422,15 +726,19 @@ def server(input, output, session):
 
         if len(duplicates_df) == 0:
             return _placeholder_fig("No duplicate comments found")
-        else:
-            duplicates_df = get_duplicate_groups(load_data())
+
+        duplicates_df = with_burst_scores(df, duplicates_df)
+
+        # Imported here so the app module loads without plotly.express
+        import plotly.express as px
+
+        with span("render_duplicates", rows=len(duplicates_df)):
             x_vals = np.arange(0, len(duplicates_df)) + 1
 
             # Extract first comment from each row for customdata
             first_comments = duplicates_df["comment"].list.get(0).to_list()
             content_hashes = duplicates_df["content_hash"].to_list()
-
-            print(f"duplicates_df: {duplicates_df.head()}")
+            burst_values = duplicates_df["burst_score"].to_list()
 
             fig = px.bar(
                 data_frame=duplicates_df,
@@ -438,11 +746,18 @@ def server(input, output, session):
                 y="len",
                 log_y=True,
                 color_discrete_sequence=px.colors.qualitative.D3,
-                custom_data=[first_comments, content_hashes],
+                custom_data=[first_comments, content_hashes, burst_values],
             )
 
             fig.update_traces(
-                hovertemplate="<b>Comment ID:</b> %{x}<br><b>Count:</b>%{y}<extra></extra>",
+                hovertemplate="<b>Comment ID:</b> %{x}<br><b>Count:</b>%{y}<br><b>In busiest hour:</b> %{customdata[2]:.0f}%<extra></extra>",
+                marker=dict(
+                    color=duplicates_df["burst_score"].fill_null(0).to_list(),
+                    colorscale="Blues",
+                    cmin=0,
+                    cmax=100,
+                    colorbar=dict(title="Burst %"),
+                ),
             )
 
             fig.update_layout(
@@ -457,6 +772,134 @@ def server(input, output, session):
 
             return fig_widget
 
+    map_points = reactive.value(None)
+
+    @reactive.effect
+    def reset_map():
+        input.docket_picker()
+        map_points.set(None)
+
+    @reactive.effect
+    @reactive.event(input.compute_map)
+    async def compute_map():
+        if not EMBEDDING_CACHE_DIR:
+            ui.notification_show(
+                "Set EMBEDDING_CACHE_DIR in .env to build embedding maps",
+                type="warning",
+            )
+            return
+
+        docket_id = input.docket_picker()
+        comments_df = load_data()
+        with ui.Progress() as p:
+            p.set(message="Embedding and projecting the docket. Hang on...")
+            # Projection and clusters are cached next to the docket's embeddings
+            map_points.set(
+                await asyncio.to_thread(docket_map_frame, comments_df, docket_id)
+            )
+
+    def on_map_click(trace, points, state):
+        # Every trace of the map gets the click; only one has the clicked point
+        if not points.point_inds:
+            return
+
+        point_index = points.point_inds[0]
+        content_hash = trace.customdata[point_index][0]
+        point = map_points.get().filter(pl.col("content_hash") == content_hash)
+        clicked_bar.set({"points": points, "trace": trace, "source": "map"})
+        reference_text.set(point["comment"][0])
+        reference_hash.set(content_hash)
+
+        fig_widget = trace.parent
+        with fig_widget.batch_update():
+            fig_widget.data[-1].x = [points.xs[0]]
+            fig_widget.data[-1].y = [points.ys[0]]
+
+    @render_widget
+    def embedding_map():
+        points = map_points.get()
+        if points is None:
+            return _placeholder_fig(
+                "Click 'Build embedding map' to project the docket's comments"
+            )
+
+        color_col = input.map_color()
+        labels = points[color_col].unique(maintain_order=True).to_list()
+
+        import plotly.express as px
+
+        palette = px.colors.qualitative.D3
+        fig_widget = go.FigureWidget()
+        for i, label in enumerate(labels):
+            color = "lightgray" if label in ("Unique", "Other duplicates") else None
+            fig_widget.add_scattergl(
+                name=label,
+                mode="markers",
+                marker=dict(color=color or palette[i % len(palette)], opacity=0.7),
+                hovertemplate="%{hovertext}<br><b>Copies:</b> %{customdata[1]:,}<extra>%{fullData.name}</extra>",
+            )
+        # Marker of the selected point
+        fig_widget.add_scattergl(
+            mode="markers",
+            marker=dict(size=14, color="red", symbol="x"),
+            hoverinfo="skip",
+            showlegend=False,
+        )
+        fig_widget.update_layout(
+            template="plotly_white",
+            xaxis=dict(showticklabels=False, title=None),
+            yaxis=dict(showticklabels=False, title=None),
+            legend=dict(itemsizing="constant"),
+        )
+
+        def show(x_range=None, y_range=None):
+            """Draw the points in view, binned when there are too many."""
+            in_view = [
+                pl.col(axis).is_between(*sorted(bounds))
+                for axis, bounds in (("x", x_range), ("y", y_range))
+                if bounds is not None
+            ]
+            visible = points.filter(*in_view) if in_view else points
+            binned = len(visible) > MAP_MAX_POINTS
+            with span("render_embedding_map", rows=len(visible), binned=binned):
+                if binned:
+                    visible = bin_points(
+                        visible, color_col, x_range=x_range, y_range=y_range
+                    )
+                visible = visible.with_columns(
+                    pl.col("comment").str.slice(0, 80).alias("hover")
+                )
+                with fig_widget.batch_update():
+                    fig_widget.layout.title = (
+                        f"{len(visible):,} bins of {len(points):,} comments (zoom in for points)"
+                        if binned
+                        else f"{len(visible):,} of {len(points):,} distinct comments"
+                    )
+                    for trace in fig_widget.data[: len(labels)]:
+                        part = visible.filter(pl.col(color_col) == trace.name)
+                        trace.x = part["x"].to_numpy()
+                        trace.y = part["y"].to_numpy()
+                        trace.hovertext = part["hover"].to_list()
+                        trace.customdata = list(
+                            zip(part["content_hash"].to_list(), part["n"].to_list())
+                        )
+                        trace.marker.size = (
+                            np.clip(np.sqrt(part["points"].to_numpy()) * 2, 3, 20)
+                            if binned
+                            else 5
+                        )
+
+        show()
+        fig_widget.layout.on_change(
+            lambda layout, x_range, y_range: show(x_range, y_range),
+            "xaxis.range",
+            "yaxis.range",
+        )
+        for trace in fig_widget.data[: len(labels)]:
+            trace.on_click(on_map_click)
+
+        return fig_widget
+
     def on_line_click(trace, points, state):
         # Store both points and trace for accessing customdata
         clicked_data = {"points": points, "trace": trace}
@@ -466,6 +909,7 @@ def server(input, output, session):
         point_index = points.point_inds[0]
         comp_text = trace.customdata[point_index][0]
         compared_text.set(comp_text)
+        compared_hash.set(trace.customdata[point_index][1])
 
         # Get the parent figure widget from the trace
         fig_widget = trace.parent
@@ -488,7 +932,7 @@ def server(input, output, session):
 
     @render_widget
     def similarity_plot():
-        similarity_df = similarity_results.get()
+        similarity_df = similarity_scores()
 
         if similarity_df is None or similarity_df.is_empty():
             return _placeholder_fig(
@@ -519,47 +963,74 @@ def server(input, output, session):
         # Sort by selected metric for consistent ordering
         filtered_df = filtered_df.sort(by=selected_metric, descending=True)
 
-        # Create x values for the line plot
-        x_vals = np.arange(0, len(filtered_df)) + 1
+        import plotly.express as px
 
-        # Extract text content for customdata
-        compared_texts = filtered_df["comment"].to_list()
+        with span("render_similarity", rows=len(filtered_df)):
+            # Create x values for the line plot
+            x_vals = np.arange(0, len(filtered_df)) + 1
 
-        fig = px.line(
-            data_frame=filtered_df,
-            x=x_vals,
-            y=selected_metric,
-            color_discrete_sequence=px.colors.qualitative.D3,
-            markers=True,
-            custom_data=[compared_texts],
-        )
+            # Extract text content for customdata
+            compared_texts = filtered_df["comment"].to_list()
+            compared_hashes = filtered_df["content_hash"].to_list()
 
-        fig.update_traces(
-            hovertemplate=f"<b>Comment ID:</b> %{{x}}<br><b>{metric_names[selected_metric]}:</b> %{{y:.1f}}<extra></extra>"
-        )
+            fig = px.line(
+                data_frame=filtered_df,
+                x=x_vals,
+                y=selected_metric,
+                color_discrete_sequence=px.colors.qualitative.D3,
+                markers=True,
+                custom_data=[compared_texts, compared_hashes],
+            )
 
-        fig.update_layout(
-            title=f"Similar Comments (sorted by {metric_names[selected_metric]})",
-            yaxis_title=f"{metric_names[selected_metric]} Score",
-            xaxis_title="Comment Rank",
-            template="plotly_white",
-        )
+            fig.update_traces(
+                hovertemplate=f"<b>Comment ID:</b> %{{x}}<br><b>{metric_names[selected_metric]}:</b> %{{y:.1f}}<extra></extra>"
+            )
 
-        fig_widget = go.FigureWidget(fig.data, fig.layout)
-        fig_widget.data[0].on_click(on_line_click)
+            fig.update_layout(
+                title=f"Similar Comments (sorted by {metric_names[selected_metric]})",
+                yaxis_title=f"{metric_names[selected_metric]} Score",
+                xaxis_title="Comment Rank",
+                template="plotly_white",
+            )
 
-        return fig_widget
+            fig_widget = go.FigureWidget(fig.data, fig.layout)
+            fig_widget.data[0].on_click(on_line_click)
+
+            return fig_widget
 
     @render.text
     def selected_docket():
         clicked_data = clicked_bar.get()
-        if clicked_data:
+        if not clicked_data:
+            return "No comment selected"
+
+        if clicked_data.get("source") == "map":
+            point_index = clicked_data["points"].point_inds[0]
+            n_copies = clicked_data["trace"].customdata[point_index][1]
+            selected = f"Selected map point ({n_copies:,} copies)"
+        else:
             comment_id = clicked_data["points"].xs[0]
             n_duplicates = clicked_data["points"].ys[0]
-        else:
-            return "No comment selected"
+            selected = (
+                f"Selected Comment ID: {comment_id} (nr. duplicates: {n_duplicates})"
+            )
 
-        return f"Selected Comment ID: {comment_id} (nr. duplicates: {n_duplicates})"
+        # Point lookup in the ingest-time content_hash index
+        if CONTENT_HASH_INDEX and Path(CONTENT_HASH_INDEX).exists():
+            content_hash = reference_hash.get()
+            others = other_docket_counts(content_hash, input.docket_picker())
+            if others["other_dockets"]:
+                selected += (
+                    f" — this text also appears in {others['other_dockets']:,} other"
+                    f" docket(s) ({others['other_copies']:,} copies)"
+                )
+                if others["first_date"] is not None:
+                    selected += (
+                        f", first received {others['first_date']:%Y-%m-%d},"
+                        f" last {others['last_date']:%Y-%m-%d}"
+                    )
+
+        return selected
 
     @render.ui
     def ref_text():
@@ -569,7 +1040,12 @@ def server(input, output, session):
         if ref_text_value:
             if comp_text_value:
                 # Both texts available - show diff
-                diff_ref, _ = create_word_diff_html(ref_text_value, comp_text_value)
+                diff_ref, _ = create_word_diff_html(
+                    ref_text_value,
+                    comp_text_value,
+                    ref_hash=reference_hash.get(),
+                    compared_hash=compared_hash.get(),
+                )
                 return ui.div(
                     ui.HTML(
                         f'<div style="white-space: pre-wrap; font-family: monospace; padding: 10px; background-color: #f8f9fa; border-radius: 5px; margin: 0; line-height: 1.6;">{diff_ref}</div>'
@@ -596,7 +1072,12 @@ def server(input, output, session):
         if comp_text_value:
             if ref_text_value:
                 # Both texts available - show diff
-                _, diff_comp = create_word_diff_html(ref_text_value, comp_text_value)
+                _, diff_comp = create_word_diff_html(
+                    ref_text_value,
+                    comp_text_value,
+                    ref_hash=reference_hash.get(),
+                    compared_hash=compared_hash.get(),
+                )
                 return ui.div(
                     ui.HTML(
                         f'<div style="white-space: pre-wrap; font-family: monospace; padding: 10px; background-color: #f8f9fa; border-radius: 5px; margin: 0; line-height: 1.6;">{diff_comp}</div>'
@@ -615,12 +1096,190 @@ def server(input, output, session):
             style="font-style: italic; color: #666;",
         )
 
-    # @render.data_frame
-    # def preview():
-    #
-    #    df = load_data()
-    #    print(df.head())
-    #    return render.DataGrid(df.head())
+    slots_job = reactive.value(None)
+
+    @reactive.effect
+    def start_slots():
+        """Detect the reference family's slots in a worker thread once it is scored."""
+        ref_text_value = reference_text.get()
+        req(similarity_results.get() is not None and ref_text_value)
+        comments_df = load_data()
+
+        def detect():
+            # All near-duplicates of the reference, including single copies that
+            # the duplicate-only similarity table leaves out
+            family = near_duplicate_family(comments_df, ref_text_value)
+            return detect_slots(
+                ref_text_value, family["comment"].to_list(), family["count"].to_list()
+            )
+
+        slots_job.set(in_background("template_slots", detect))
+
+    @reactive.calc
+    def detected_slots():
+        """The latest slot detection once done, None while it is running."""
+        future = slots_job.get()
+        req(future)
+        if not future.done():
+            reactive.invalidate_later(0.25)
+            return None
+        return future.result()
+
+    @render.ui
+    def template_slots():
+        if similarity_results.get() is None or not reference_text.get():
+            return ui.p(
+                "Compute similarities to see which words vary across the family",
+                style="font-style: italic; color: #666;",
+            )
+
+        result = detected_slots()
+        if result is None:
+            return ui.p(
+                "Detecting slots across the family…",
+                style="font-style: italic; color: #666;",
+            )
+        skeleton, slots, values = result
+        if slots.is_empty():
+            return ui.p(
+                "No variable slots: the family only differs in rare, scattered edits",
+                style="font-style: italic; color: #666;",
+            )
+
+        parts = [
+            ui.span(f"{{{{{value}}}}}", class_="badge bg-primary")
+            if kind == "slot"
+            else f" {value} "
+            for kind, value in skeleton
+        ]
+        tables = []
+        for row in slots.iter_rows(named=True):
+            top = values.filter(pl.col("slot") == row["slot"]).head(10)
+            tables.append(
+                ui.div(
+                    ui.h6(
+                        f"Slot {row['slot']}: {row['n_values']:,} values, "
+                        f"{row['varying_share']:.0%} differ from the reference"
+                    ),
+                    ui.tags.table(
+                        *(
+                            ui.tags.tr(
+                                ui.tags.td(value["value"] or "(empty)"),
+                                ui.tags.td(
+                                    f"{value['count']:,} ({value['share']:.1%})",
+                                    style="text-align: right; padding-left: 10px;",
+                                ),
+                            )
+                            for value in top.iter_rows(named=True)
+                        ),
+                        class_="table table-sm",
+                    ),
+                )
+            )
+        return ui.div(
+            ui.div(
+                *parts,
+                style="white-space: pre-wrap; font-family: monospace; padding: 10px; background-color: #f8f9fa; border-radius: 5px; margin-bottom: 10px; line-height: 1.8;",
+            ),
+            ui.layout_column_wrap(*tables, width=1 / 3),
+        )
+
+    @render.data_frame
+    def diagnostics():
+        if not input.show_diagnostics():
+            return None
+
+        # Refresh while the panel is open
+        reactive.invalidate_later(2)
+        return render.DataGrid(spans_frame(200), height="300px")
+
+    explorer_offset = reactive.value(0)
+
+    @reactive.calc
+    def explorer_hashes() -> list[str] | None:
+        """content_hashes of the comments in scope (None: the whole docket)."""
+        scope = input.explorer_scope()
+        if scope == "docket":
+            return None
+
+        content_hash = reference_hash.get()
+        req(content_hash)
+        if scope == "group":
+            # Every raw variant of the clicked text's duplicate group
+            df = load_data()
+            key_col = group_key(df)
+            key = df.filter(pl.col("content_hash") == content_hash)[key_col][0]
+            return df.filter(pl.col(key_col) == key)["content_hash"].unique().to_list()
+
+        similarity_df = similarity_scores()
+        req(similarity_df is not None)
+        min_sim, max_sim = input.similarity_range()
+        family = similarity_df.filter(
+            pl.col(input.similarity_metric()).is_between(min_sim, max_sim)
+        )
+        return [content_hash, *family["content_hash"].unique().to_list()]
+
+    @reactive.effect
+    def reset_explorer():
+        input.docket_picker()
+        explorer_hashes()
+        input.explorer_search()
+        input.explorer_sort()
+        input.explorer_descending()
+        explorer_offset.set(0)
+
+    @reactive.calc
+    def explorer_page() -> tuple[pl.DataFrame, int]:
+        """The current page, read from the docket's partition files."""
+        docket_id = input.docket_picker()
+        req(docket_id)
+        return comments_page(
+            docket_id,
+            content_hashes=explorer_hashes(),
+            search=input.explorer_search() or None,
+            sort=input.explorer_sort(),
+            descending=input.explorer_descending(),
+            offset=explorer_offset.get(),
+            limit=EXPLORER_PAGE_SIZE,
+        )
+
+    @reactive.effect
+    @reactive.event(input.explorer_prev)
+    def explorer_prev():
+        explorer_offset.set(max(explorer_offset.get() - EXPLORER_PAGE_SIZE, 0))
+
+    @reactive.effect
+    @reactive.event(input.explorer_next)
+    def explorer_next():
+        _, total = explorer_page()
+        offset = explorer_offset.get() + EXPLORER_PAGE_SIZE
+        if offset < total:
+            explorer_offset.set(offset)
+
+    @render.text
+    def explorer_status():
+        if input.explorer_scope() != "docket" and not reference_hash.get():
+            return "Click a duplicate group or a map point to browse its comments"
+        page, total = explorer_page()
+        if total == 0:
+            return "No matching comments"
+        first = explorer_offset.get() + 1
+        return f"Comments {first:,}–{first + len(page) - 1:,} of {total:,}"
+
+    @render.data_frame
+    def preview():
+        page, _ = explorer_page()
+        if page.is_empty():
+            return None
+        return render.DataGrid(
+            page.with_columns(
+                pl.col("comment").str.slice(0, PREVIEW_CHARS),
+                pl.col("content_hash").str.slice(0, 12),
+            ),
+            width="100%",
+            height="400px",
+            summary=False,
+        )
 
 
 app = App(main_pannel, server)
@@ -0,0 +1,384 @@
+"""
+Headless batch scoring: score every docket against its duplicate-group
+representatives and write the results as a hive-partitioned parquet dataset.
+
+Usage:
+    python batch.py OUT_DIR --agency DEA --year 2024 --top-n 10 --workers 4
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import polars as pl
+from rich.console import Console
+from rich.table import Table
+
+from botmirror import (
+    cascade_similarities,
+    get_duplicate_groups,
+    score_references,
+)
+from data import fetch_comments_df, get_docket_partitions
+from embeddings import BACKENDS, DEFAULT_BACKEND, check_backend_parity
+
+console = Console()
+
+OUTPUT_FILENAME = "similarities.parquet"
+
+
+def output_path(out_dir: str, agency_code: str, year: int, docket_id: str) -> Path:
+    """Path of a docket's output file, partitioned like the input hive."""
+    return Path(
+        out_dir,
+        f"agency_code={agency_code}",
+        f"year={year}",
+        f"docket_id={docket_id}",
+        OUTPUT_FILENAME,
+    )
+
+
+def score_docket(
+    df: pl.DataFrame,
+    top_n: int | None = None,
+    backend: str = DEFAULT_BACKEND,
+    threads: int | None = None,
+    docket_id: str | None = None,
+    score_cutoff: float | None = None,
+) -> pl.DataFrame:
+    """
+    Score a docket against its duplicate-group representatives.
+
+    Comments are deduplicated by content_hash before scoring, so each distinct
+    text is scored once per reference and carries its number of copies. The
+    docket is embedded once and scored against all references together (see
+    botmirror.score_references). With a score_cutoff, scoring runs through the
+    cascade (see botmirror.cascade_similarities) and only comments reaching the
+    cutoff are kept.
+
+    Args:
+        df: Docket comments as returned by fetch_comments_df
+        top_n: Only use the top_n largest duplicate groups as references (default: all)
+        backend: Embedding inference backend
+        threads: Intra-op thread count for the embedding backend
+        docket_id: Docket being scored, used to key the on-disk embedding store
+        score_cutoff: Minimum string score (0-100) for the scoring cascade
+                      (default: score every comment fully)
+
+    Returns:
+        DataFrame with reference_hash, content_hash, count and similarity scores
+    """
+    groups = get_duplicate_groups(df)
+    if top_n is not None:
+        groups = groups.head(top_n)
+
+    normalized = [
+        pl.col(c).first()
+        for c in ("normalized_comment", "normalized_hash")
+        if c in df.columns
+    ]
+    unique_df = df.group_by("content_hash").agg(
+        pl.col("comment").first(),
+        pl.col("is_duplicate").first(),
+        *normalized,
+        pl.len().alias("count"),
+    )
+
+    references = [
+        (h, text)
+        for h, text in zip(
+            groups["content_hash"].to_list(), groups["comment"].list.first().to_list()
+        )
+        if h is not None
+    ]
+
+    results = []
+    if score_cutoff is None:
+        if references:
+            results.append(
+                score_references(
+                    unique_df,
+                    [h for h, _ in references],
+                    backend=backend,
+                    threads=threads,
+                    docket_id=docket_id,
+                )
+            )
+    else:
+        for reference_hash, reference_text in references:
+            scores, _ = cascade_similarities(
+                df=unique_df,
+                reference_text=reference_text,
+                exclude_hash=reference_hash,
+                backend=backend,
+                threads=threads,
+                docket_id=docket_id,
+                score_cutoff=score_cutoff,
+            )
+            results.append(
+                scores.drop("comment").with_columns(
+                    pl.lit(reference_hash).alias("reference_hash")
+                )
+            )
+
+    if not results:
+        return pl.DataFrame(
+            schema={
+                "reference_hash": pl.String,
+                "content_hash": pl.String,
+                "count": pl.UInt32,
+                "similarity": pl.Float64,
+                "embedding_similarity": pl.Float64,
+                "similarity_w": pl.Float64,
+            }
+        )
+
+    return (
+        pl.concat(results)
+        .join(unique_df.select("content_hash", "count"), on="content_hash")
+        .select(
+            "reference_hash",
+            "content_hash",
+            "count",
+            "similarity",
+            "embedding_similarity",
+            "similarity_w",
+        )
+    )
+
+
+def run_docket(
+    out_dir: str,
+    agency_code: str,
+    year: int,
+    docket_id: str,
+    top_n: int | None = None,
+    overwrite: bool = False,
+    backend: str = DEFAULT_BACKEND,
+    threads: int | None = None,
+    parity_sample: int = 0,
+    score_cutoff: float | None = None,
+) -> dict:
+    """
+    Score one docket and write its parquet output.
+
+    Dockets whose output already exists are skipped unless overwrite is set, which
+    makes interrupted runs resumable. Output is written to a temporary file and
+    renamed, so a partially written file is never mistaken for a finished docket.
+    With parity_sample > 0 and a non-default backend, the backend's embeddings are
+    first compared against torch FP32 on a sample of the docket.
+
+    Returns:
+        dict: Per-docket summary (status, comments, references, rows, seconds)
+    """
+    path = output_path(out_dir, agency_code, year, docket_id)
+    summary = {"docket_id": docket_id, "comments": 0, "references": 0, "rows": 0}
+
+    if path.exists() and not overwrite:
+        return {**summary, "status": "skipped", "seconds": 0.0}
+
+    start = time.perf_counter()
+    df = fetch_comments_df(docket_id=docket_id)
+
+    if parity_sample and backend != "torch":
+        parity = check_backend_parity(
+            df["comment"].to_list(), backend, sample_size=parity_sample, threads=threads
+        )
+        summary["parity_min_cosine"] = parity.get("min_cosine")
+
+    scores = score_docket(
+        df,
+        top_n=top_n,
+        backend=backend,
+        threads=threads,
+        docket_id=docket_id,
+        score_cutoff=score_cutoff,
+    )
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".parquet.tmp")
+    scores.write_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+    return {
+        **summary,
+        "status": "done",
+        "comments": len(df),
+        "references": scores["reference_hash"].n_unique(),
+        "rows": len(scores),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def _failed_summary(docket_id: str, error: Exception) -> dict:
+    """Summary entry for a docket that raised, so the batch can carry on."""
+    console.print(f"[red]Failed {docket_id}: {error}[/red]")
+    return {
+        "docket_id": docket_id,
+        "status": "failed",
+        "comments": 0,
+        "references": 0,
+        "rows": 0,
+        "seconds": 0.0,
+    }
+
+
+def print_summary(summaries: list[dict], elapsed: float) -> None:
+    """Print a throughput summary for a batch run."""
+    done = [s for s in summaries if s["status"] == "done"]
+    n_comments = sum(s["comments"] for s in done)
+    n_rows = sum(s["rows"] for s in done)
+
+    table = Table(title="Batch scoring summary")
+    table.add_column("Metric")
+    table.add_column("Value", justify="right")
+    for status in ["done", "skipped", "failed"]:
+        count = sum(s["status"] == status for s in summaries)
+        table.add_row(f"Dockets {status}", f"{count:,}")
+    table.add_row("Comments loaded", f"{n_comments:,}")
+    table.add_row("Scores written", f"{n_rows:,}")
+    table.add_row("Wall time (s)", f"{elapsed:,.1f}")
+    table.add_row("Comments / s", f"{n_comments / elapsed:,.1f}" if elapsed else "-")
+    table.add_row("Scores / s", f"{n_rows / elapsed:,.1f}" if elapsed else "-")
+    parities = [s["parity_min_cosine"] for s in done if s.get("parity_min_cosine")]
+    if parities:
+        table.add_row("Backend parity (min cosine)", f"{min(parities):.4f}")
+
+    console.print(table)
+
+
+def run_batch(
+    out_dir: str,
+    agency_codes: list[str] = [],
+    years: list[int] = [],
+    docket_ids: list[str] = [],
+    top_n: int | None = None,
+    workers: int = 1,
+    overwrite: bool = False,
+    backend: str = DEFAULT_BACKEND,
+    threads: int | None = None,
+    parity_sample: int = 0,
+    score_cutoff: float | None = None,
+) -> list[dict]:
+    """
+    Score all matching dockets, in parallel across worker processes.
+
+    Args:
+        out_dir: Root of the output hive
+        agency_codes: Restrict to these agencies (default: all)
+        years: Restrict to these years (default: all)
+        docket_ids: Restrict to these dockets (default: all)
+        top_n: References per docket, largest duplicate groups first (default: all)
+        workers: Number of worker processes, one docket per worker at a time
+        overwrite: Recompute dockets that already have output
+        backend: Embedding inference backend, one of embeddings.BACKENDS
+        threads: Intra-op threads per worker (default: cores split across workers)
+        parity_sample: Texts per docket to compare against torch FP32 (0: off)
+        score_cutoff: Score through the cascade, keeping string scores >= cutoff
+
+    Returns:
+        list: Per-docket summaries
+    """
+    partitions = get_docket_partitions(agency_codes=agency_codes, years=years)
+    if docket_ids:
+        partitions = partitions.filter(pl.col("docket_id").is_in(docket_ids))
+
+    jobs = [
+        dict(
+            out_dir=out_dir,
+            agency_code=row["agency_code"],
+            year=row["year"],
+            docket_id=row["docket_id"],
+            top_n=top_n,
+            overwrite=overwrite,
+            backend=backend,
+            threads=threads or max(1, (os.cpu_count() or 1) // workers),
+            parity_sample=parity_sample,
+            score_cutoff=score_cutoff,
+        )
+        for row in partitions.iter_rows(named=True)
+    ]
+    console.print(f"Scoring {len(jobs):,} dockets with {workers} worker(s)")
+
+    start = time.perf_counter()
+    summaries = []
+
+    def record(summary: dict) -> None:
+        summaries.append(summary)
+        console.print(
+            f"[{len(summaries)}/{len(jobs)}] {summary['docket_id']}: "
+            f"{summary['status']} ({summary['seconds']:.1f}s)"
+        )
+
+    if workers <= 1:
+        for job in jobs:
+            try:
+                record(run_docket(**job))
+            except Exception as e:
+                record(_failed_summary(job["docket_id"], e))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = {executor.submit(run_docket, **job): job for job in jobs}
+            for future in as_completed(futures):
+                try:
+                    record(future.result())
+                except Exception as e:
+                    record(_failed_summary(futures[future]["docket_id"], e))
+
+    print_summary(summaries, time.perf_counter() - start)
+
+    return summaries
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("out_dir", type=str)
+    parser.add_argument("--agency", type=str, nargs="*", default=[])
+    parser.add_argument("--year", type=int, nargs="*", default=[])
+    parser.add_argument("--docket", type=str, nargs="*", default=[])
+    parser.add_argument(
+        "--top-n",
+        type=int,
+        default=None,
+        help="Use only the N largest duplicate groups per docket as references",
+    )
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--overwrite", action="store_true")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument(
+        "--parity-sample",
+        type=int,
+        default=0,
+        help="Check the backend against torch FP32 on N texts per docket",
+    )
+
+    parser.add_argument(
+        "--score-cutoff",
+        type=float,
+        default=None,
+        help="Skip embeddings for comments whose string score is below this (0-100)",
+    )
+
+    args = parser.parse_args()
+
+    run_batch(
+        out_dir=args.out_dir,
+        agency_codes=args.agency,
+        years=args.year,
+        docket_ids=args.docket,
+        top_n=args.top_n,
+        workers=args.workers,
+        overwrite=args.overwrite,
+        backend=args.backend,
+        threads=args.threads,
+        parity_sample=args.parity_sample,
+        score_cutoff=args.score_cutoff,
+    )
@@ -0,0 +1,665 @@
+"""
+Benchmarks for the loading and similarity hot paths.
+
+Every (case, size) pair runs in a fresh spawned process so peak RSS is measured per
+case. Results are written as JSON so runs from different commits can be compared.
+
+Usage:
+    python bench.py run --sizes 1000 10000 100000 -o bench_results.json
+    python bench.py compare base.json new.json --threshold 0.1
+    python bench.py recall --size 100000
+"""
+
+import json
+import multiprocessing
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+# Cases that need the sentence transformer model
+EMBEDDING_CASES = {
+    "get_embedding_similarity_pl",
+    "calculate_similarities",
+    "assign_references",
+    "score_references_loop",
+    "cascade_similarities",
+}
+
+
+def make_vocabulary(n_words: int = 5000, seed: int = 0) -> np.ndarray:
+    """Random lowercase pseudo-words."""
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    lengths = rng.integers(2, 10, size=n_words)
+    return np.array(["".join(rng.choice(letters, size=n)) for n in lengths])
+
+
+def make_synthetic_docket(
+    n_comments: int,
+    template_ratio: float = 0.8,
+    edit_rate: float = 0.2,
+    text_length: int = 1000,
+    n_templates: int = 20,
+    docket_id: str = "BENCH-2024-0001",
+    seed: int = 0,
+) -> pl.DataFrame:
+    """
+    Generate a docket in the shape of the parquet hive.
+
+    Args:
+        n_comments: Number of comments
+        template_ratio: Fraction of comments copied from a template (Zipf-distributed
+                        over templates, so a few templates dominate)
+        edit_rate: Fraction of template copies that are edited (~5% of their words
+                   replaced); unedited copies are exact duplicates
+        text_length: Approximate length of each comment in characters
+        n_templates: Number of distinct templates
+        docket_id: Docket id to assign
+        seed: Random seed
+
+    Returns:
+        pl.DataFrame: Comments with the columns written by data2parquet.py
+    """
+    rng = np.random.default_rng(seed)
+    vocab = make_vocabulary(seed=seed)
+    n_words = max(1, text_length // 6)
+
+    templates = [rng.choice(vocab, size=n_words) for _ in range(n_templates)]
+    weights = 1 / np.arange(1, n_templates + 1)
+    weights /= weights.sum()
+
+    is_template = rng.random(n_comments) < template_ratio
+    template_ids = rng.choice(n_templates, size=n_comments, p=weights)
+    is_edited = rng.random(n_comments) < edit_rate
+
+    comments = []
+    for i in range(n_comments):
+        if not is_template[i]:
+            words = rng.choice(vocab, size=n_words)
+        elif is_edited[i]:
+            words = templates[template_ids[i]].copy()
+            mask = rng.random(n_words) < 0.05
+            words[mask] = rng.choice(vocab, size=int(mask.sum()))
+        else:
+            words = templates[template_ids[i]]
+        comments.append(" ".join(words))
+
+    start = datetime(2024, 1, 1)
+    offsets = np.sort(rng.integers(0, 30 * 24 * 3600, size=n_comments))
+    dates = [start + timedelta(seconds=int(s)) for s in offsets]
+
+    agency_code, year = docket_id.split("-")[:2]
+    return pl.DataFrame(
+        {
+            "agency_code": agency_code,
+            "year": int(year),
+            "docket_id": docket_id,
+            "comment_id": [f"{docket_id}-{i:07d}" for i in range(n_comments)],
+            "category": None,
+            "comment": comments,
+            "document_type": "Public Submission",
+            "modify_date": dates,
+            "posted_date": dates,
+            "receive_date": dates,
+            "subtype": None,
+            "title": "Comment",
+            "withdrawn": False,
+            "raw_json": "{}",
+        },
+        # Typed like the VARCHAR columns data2parquet.py writes, not as Null
+        schema_overrides={"category": pl.String, "subtype": pl.String},
+    )
+
+
+def write_synthetic_hive(df: pl.DataFrame, root: str) -> str:
+    """Write a synthetic docket as a hive partition and return the scan glob."""
+    df.write_parquet(
+        Path(root, "comments"), partition_by=["agency_code", "year", "docket_id"]
+    )
+    return str(Path(root, "comments", "**", "*.parquet"))
+
+
+def _prepared_df(size: int, params: dict) -> pl.DataFrame:
+    """Synthetic docket with the columns added by fetch_comments_df."""
+    import hashlib
+
+    from data import with_normalized_columns
+
+    # Normalized text and group key, so cases run the app's normalized path
+    return with_normalized_columns(
+        make_synthetic_docket(size, **params)
+        .drop("raw_json")
+        .with_columns(
+            pl.col("comment")
+            .map_elements(
+                lambda x: hashlib.sha256(x.encode()).hexdigest(),
+                return_dtype=pl.String,
+            )
+            .alias("content_hash"),
+        )
+    )
+
+
+def _reference(df: pl.DataFrame) -> tuple[str, str]:
+    """Largest duplicate group's text and hash."""
+    from botmirror import get_duplicate_groups
+
+    top = get_duplicate_groups(df).row(0, named=True)
+    return top["comment"][0], top["content_hash"]
+
+
+def setup_case(name: str, size: int, params: dict, tmp_dir: str):
+    """
+    Prepare inputs for a benchmark case.
+
+    Returns:
+        tuple: (callable to time, number of rows it processes)
+    """
+    if name == "fetch_comments_df":
+        import data
+
+        data.MIRRULATIONS_PARQUET = write_synthetic_hive(
+            make_synthetic_docket(size, **params), tmp_dir
+        )
+        data.FRAME_CACHE_DIR = None
+        return lambda: data.fetch_comments_df("BENCH-2024-0001"), size
+
+    if name == "fetch_comments_df_cached":
+        import data
+
+        data.MIRRULATIONS_PARQUET = write_synthetic_hive(
+            make_synthetic_docket(size, **params), tmp_dir
+        )
+        data.FRAME_CACHE_DIR = str(Path(tmp_dir, "frames"))
+        data.fetch_comments_df("BENCH-2024-0001")  # populate the cache
+        return lambda: data.fetch_comments_df("BENCH-2024-0001"), size
+
+    if name == "create_word_diff_html":
+        # size is the text length in characters for this case
+        df = make_synthetic_docket(
+            2, template_ratio=1.0, edit_rate=0.0, text_length=size, n_templates=1
+        )
+        reference = df["comment"][0]
+        words = reference.split(" ")
+        rng = np.random.default_rng(1)
+        for k in rng.choice(len(words), size=max(1, len(words) // 20), replace=False):
+            words[k] = "edited"
+        compared = " ".join(words)
+
+        # Time the engine behind app.create_word_diff_html without importing the app
+        import diff
+        from diff import word_diff_html
+
+        def run():
+            diff._diff_cache.clear()
+            return word_diff_html(reference, compared)
+
+        return run, 1
+
+    df = _prepared_df(size, params)
+
+    if name == "embedding_store_scores":
+        # Memory-mapped scoring over synthetic vectors; no model needed
+        from embedding_store import EMBEDDING_STORE_DTYPE, EmbeddingStore
+
+        vectors = make_clustered_vectors(size)
+        store = EmbeddingStore.write(
+            Path(tmp_dir, "store"),
+            [str(i) for i in range(size)],
+            vectors,
+            dtype=params.get("store_dtype", EMBEDDING_STORE_DTYPE),
+        )
+        return lambda: store.scores(vectors[0]), size
+
+    if name == "embedding_map":
+        # Uncached 2D projection and clustering of synthetic vectors
+        from embedding_map import get_docket_map, map_path
+        from embedding_store import EmbeddingStore
+
+        vectors = make_clustered_vectors(size)
+        store = EmbeddingStore.write(
+            Path(tmp_dir, "store"), [str(i) for i in range(size)], vectors
+        )
+
+        def run():
+            map_path(store, "pca").unlink(missing_ok=True)
+            return get_docket_map(store)
+
+        return run, size
+
+    if name == "get_duplicate_groups":
+        from botmirror import get_duplicate_groups
+
+        return lambda: get_duplicate_groups(df), size
+
+    if name == "burst_scores":
+        from bursts import burst_scores
+
+        return lambda: burst_scores(df), size
+
+    reference_text, reference_hash = _reference(df)
+
+    if name == "find_partials_pl":
+        from botmirror import find_partials_pl  # noqa: F401 - needed for monkey patching
+
+        return (
+            lambda: df.select(pl.col("comment").find_partials_pl(ref=reference_text)),
+            size,
+        )
+
+    if name == "get_embedding_similarity_pl":
+        from botmirror import get_model
+
+        get_model()  # load outside the timed region
+
+        return (
+            lambda: df.select(
+                pl.col("comment").get_embedding_similarity_pl(ref=reference_text)
+            ),
+            size,
+        )
+
+    if name == "calculate_similarities":
+        from botmirror import calculate_similarities, get_model
+
+        get_model()
+
+        return (
+            lambda: calculate_similarities(
+                df=df, reference_text=reference_text, exclude_hash=reference_hash
+            ),
+            size,
+        )
+
+    if name in ("assign_references", "score_references_loop"):
+        from botmirror import (
+            assign_references,
+            calculate_similarities,
+            get_duplicate_groups,
+            get_model,
+        )
+
+        get_model()
+        groups = get_duplicate_groups(df).head(params.get("n_references", 10))
+        reference_hashes = groups["content_hash"].to_list()
+
+        if name == "assign_references":
+            return lambda: assign_references(df, reference_hashes), size
+
+        # Baseline: one calculate_similarities pass per reference over the same
+        # comments (assign_references scores every comment, not only duplicates)
+        reference_texts = groups["comment"].list.first().to_list()
+        all_rows = df.with_columns(pl.lit(True).alias("is_duplicate"))
+        return (
+            lambda: [
+                calculate_similarities(all_rows, text, h)
+                for text, h in zip(reference_texts, reference_hashes)
+            ],
+            size,
+        )
+
+    if name == "cascade_similarities":
+        from botmirror import cascade_similarities, get_model
+
+        get_model()
+
+        return (
+            lambda: cascade_similarities(
+                df=df, reference_text=reference_text, exclude_hash=reference_hash
+            ),
+            size,
+        )
+
+    raise ValueError(f"Unknown benchmark case: {name}")
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(name: str, size: int, params: dict, repeat: int) -> dict:
+    """Run one case in the current process and return its measurements."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fn, n_rows = setup_case(name, size, params, tmp_dir)
+        rss_before = _peak_rss_mb()
+
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+
+    return {
+        "case": name,
+        "size": size,
+        "rows": n_rows,
+        "repeat": repeat,
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "rows_per_s": n_rows / min(timings),
+        "peak_rss_mb": _peak_rss_mb(),
+        "peak_rss_delta_mb": _peak_rss_mb() - rss_before,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+    cases: list[str],
+    sizes: list[int],
+    params: dict,
+    repeat: int = 3,
+    diff_lengths: list[int] = [1_000, 10_000, 50_000],
+) -> dict:
+    """
+    Run every case at every size, each in a fresh process.
+
+    Returns:
+        dict: Run metadata and a list of per-case results
+    """
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+
+    for name in cases:
+        for size in diff_lengths if name == "create_word_diff_html" else sizes:
+            console.print(f"{name} @ {size:,}...")
+            with ctx.Pool(1) as pool:
+                try:
+                    result = pool.apply(run_case, (name, size, params, repeat))
+                except Exception as e:
+                    console.print(f"[red]{name} @ {size:,} failed: {e}[/red]")
+                    continue
+            results.append(result)
+            console.print(
+                f"  {result['min_s'] * 1000:,.1f} ms, "
+                f"peak RSS {result['peak_rss_mb']:,.0f} MB "
+                f"(+{result['peak_rss_delta_mb']:,.0f} MB)"
+            )
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "polars": pl.__version__,
+        "machine": platform.machine(),
+        "params": params,
+        "results": results,
+    }
+
+
+def compare_results(base: dict, new: dict, threshold: float = 0.1) -> list[dict]:
+    """
+    Compare two benchmark runs case by case.
+
+    Returns:
+        list: One entry per (case, size) present in both runs, with the ratio of
+              new to base min time and whether it regressed beyond the threshold
+    """
+    base_index = {(r["case"], r["size"]): r for r in base["results"]}
+    rows = []
+    for r in new["results"]:
+        key = (r["case"], r["size"])
+        if key not in base_index:
+            continue
+        b = base_index[key]
+        ratio = r["min_s"] / b["min_s"] if b["min_s"] else float("inf")
+        rows.append(
+            {
+                "case": r["case"],
+                "size": r["size"],
+                "base_s": b["min_s"],
+                "new_s": r["min_s"],
+                "ratio": ratio,
+                "base_rss_mb": b["peak_rss_mb"],
+                "new_rss_mb": r["peak_rss_mb"],
+                "regression": ratio > 1 + threshold,
+            }
+        )
+    return rows
+
+
+def print_comparison(rows: list[dict], base_commit: str, new_commit: str) -> None:
+    table = Table(title=f"{base_commit} -> {new_commit}")
+    for column in ["Case", "Size", "Base (ms)", "New (ms)", "Ratio", "RSS (MB)"]:
+        table.add_column(column, justify="left" if column == "Case" else "right")
+    for row in rows:
+        style = "red" if row["regression"] else None
+        table.add_row(
+            row["case"],
+            f"{row['size']:,}",
+            f"{row['base_s'] * 1000:,.1f}",
+            f"{row['new_s'] * 1000:,.1f}",
+            f"{row['ratio']:.2f}x",
+            f"{row['base_rss_mb']:,.0f} -> {row['new_rss_mb']:,.0f}",
+            style=style,
+        )
+    console.print(table)
+
+
+def make_clustered_vectors(
+    n: int, dim: int = 384, n_clusters: int = 50, noise: float = 0.3, seed: int = 0
+) -> np.ndarray:
+    """
+    Normalized float32 vectors scattered around random centroids.
+
+    Stand-in for sentence embeddings of a docket with template campaigns, used
+    when the model is not available.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    vectors = centroids[rng.integers(n_clusters, size=n)] + noise * rng.standard_normal(
+        (n, dim)
+    ).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def run_recall(
+    size: int, k: int = 10, n_queries: int = 200, docket_id: str | None = None
+) -> list[dict]:
+    """
+    Recall@k of each store dtype against float32.
+
+    Uses the docket's real embeddings when docket_id is given, otherwise
+    synthetic clustered vectors.
+    """
+    from embedding_store import STORE_DTYPES, recall_at_k
+
+    if docket_id is not None:
+        from data import fetch_comments_df
+        from embeddings import encode_texts, get_model
+
+        texts = fetch_comments_df(docket_id)["comment"].drop_nulls().unique()
+        vectors = encode_texts(get_model(), texts.head(size).to_list())
+    else:
+        vectors = make_clustered_vectors(size)
+
+    return [
+        recall_at_k(vectors, dtype, n_queries=n_queries, k=k) for dtype in STORE_DTYPES
+    ]
+
+
+def print_recall(rows: list[dict], n: int) -> None:
+    table = Table(title=f"Store dtype vs float32 ({n:,} vectors)")
+    for column in ["dtype", "recall@k", "mean |score error|", "bytes / vector"]:
+        table.add_column(column, justify="left" if column == "dtype" else "right")
+    for row in rows:
+        table.add_row(
+            row["dtype"],
+            f"{row['recall_at_k']:.4f} (k={row['k']})",
+            f"{row['mean_abs_error']:.5f}",
+            f"{row['bytes_per_vector']:,}",
+        )
+    console.print(table)
+
+
+def run_cascade(
+    size: int, docket_id: str | None = None, **cascade_kwargs
+) -> pl.DataFrame:
+    """Per-stage stats of the scoring cascade for the largest group's reference."""
+    from botmirror import cascade_similarities
+
+    if docket_id is not None:
+        from data import fetch_comments_df
+
+        df = fetch_comments_df(docket_id)
+    else:
+        # Compare every synthetic comment, not only exact duplicates, so edited
+        # copies of the reference's template reach the later stages
+        df = _prepared_df(size, {}).with_columns(pl.lit(True).alias("is_duplicate"))
+
+    reference_text, reference_hash = _reference(df)
+    _, stats = cascade_similarities(
+        df, reference_text, reference_hash, docket_id=docket_id, **cascade_kwargs
+    )
+    return stats
+
+
+def print_cascade_stats(stats: pl.DataFrame) -> None:
+    table = Table(title="Scoring cascade")
+    table.add_column("Stage")
+    for column in ["Rows in", "Rows out", "Kept", "ms"]:
+        table.add_column(column, justify="right")
+    for row in stats.iter_rows(named=True):
+        kept = row["rows_out"] / row["rows_in"] if row["rows_in"] else 1.0
+        table.add_row(
+            row["stage"],
+            f"{row['rows_in']:,}",
+            f"{row['rows_out']:,}",
+            f"{kept:.1%}",
+            f"{row['seconds'] * 1000:,.1f}",
+        )
+    console.print(table)
+
+
+ALL_CASES = [
+    "fetch_comments_df",
+    "fetch_comments_df_cached",
+    "get_duplicate_groups",
+    "burst_scores",
+    "find_partials_pl",
+    "get_embedding_similarity_pl",
+    "calculate_similarities",
+    "assign_references",
+    "score_references_loop",
+    "cascade_similarities",
+    "create_word_diff_html",
+    "embedding_store_scores",
+    "embedding_map",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("--cases", nargs="*", default=ALL_CASES, choices=ALL_CASES)
+    run_parser.add_argument("--sizes", type=int, nargs="*", default=DEFAULT_SIZES)
+    run_parser.add_argument(
+        "--diff-lengths", type=int, nargs="*", default=[1_000, 10_000, 50_000]
+    )
+    run_parser.add_argument("--template-ratio", type=float, default=0.8)
+    run_parser.add_argument("--edit-rate", type=float, default=0.2)
+    run_parser.add_argument("--text-length", type=int, default=1000)
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--skip-embedding", action="store_true")
+    run_parser.add_argument("-o", "--output", type=str, default="bench_results.json")
+
+    compare_parser = subparsers.add_parser("compare")
+    compare_parser.add_argument("base", type=str)
+    compare_parser.add_argument("new", type=str)
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+
+    recall_parser = subparsers.add_parser("recall")
+    recall_parser.add_argument("--size", type=int, default=100_000)
+    recall_parser.add_argument("--k", type=int, default=10)
+    recall_parser.add_argument("--queries", type=int, default=200)
+    recall_parser.add_argument(
+        "--docket", type=str, default=None, help="Use this docket's embeddings"
+    )
+
+    cascade_parser = subparsers.add_parser("cascade")
+    cascade_parser.add_argument("--size", type=int, default=100_000)
+    cascade_parser.add_argument(
+        "--docket", type=str, default=None, help="Use this docket instead"
+    )
+    cascade_parser.add_argument("--min-word-overlap", type=float, default=None)
+    cascade_parser.add_argument("--score-cutoff", type=float, default=None)
+
+    args = parser.parse_args()
+
+    if args.command == "cascade":
+        cascade_kwargs = {
+            k: v
+            for k, v in [
+                ("min_word_overlap", args.min_word_overlap),
+                ("score_cutoff", args.score_cutoff),
+            ]
+            if v is not None
+        }
+        print_cascade_stats(
+            run_cascade(args.size, docket_id=args.docket, **cascade_kwargs)
+        )
+    elif args.command == "recall":
+        rows = run_recall(
+            args.size, k=args.k, n_queries=args.queries, docket_id=args.docket
+        )
+        print_recall(rows, args.size)
+    elif args.command == "run":
+        cases = [
+            c for c in args.cases if not (args.skip_embedding and c in EMBEDDING_CASES)
+        ]
+        run = run_benchmarks(
+            cases=cases,
+            sizes=args.sizes,
+            params={
+                "template_ratio": args.template_ratio,
+                "edit_rate": args.edit_rate,
+                "text_length": args.text_length,
+            },
+            repeat=args.repeat,
+            diff_lengths=args.diff_lengths,
+        )
+        with open(args.output, "w") as fh:
+            json.dump(run, fh, indent=2)
+        console.print(f"Wrote {args.output}")
+    else:
+        with open(args.base) as fh:
+            base = json.load(fh)
+        with open(args.new) as fh:
+            new = json.load(fh)
+        rows = compare_results(base, new, threshold=args.threshold)
+        print_comparison(rows, base["commit"], new["commit"])
+        if any(row["regression"] for row in rows):
+            sys.exit(1)
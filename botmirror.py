@@ -1,5 +1,45 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
 import polars as pl
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
+
+from embeddings import (
+    DEFAULT_BACKEND,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_MAX_CHUNKS,
+    DEFAULT_MODEL,
+    DEFAULT_THREADS,
+    DEFAULT_WINDOW_WORDS,
+    encode_texts,
+    get_model,
+)
+from data import normalize_comment
+from embedding_store import EMBEDDING_CACHE_DIR, EMBEDDING_STORE_DTYPE, get_docket_store
+from instrument import span
+
+# Raw scores of the most recently scored (docket, reference) pairs
+SCORE_CACHE_SIZE = 32
+# Scoring cascade (cascade_similarities): minimum share of distinct words shared
+# with the reference, and the rapidfuzz score below which comments are dropped
+CASCADE_MIN_WORD_OVERLAP = 0.2
+CASCADE_SCORE_CUTOFF = 40.0
+
+# Comments per block in assign_references; bounds the (block x references) matrices
+ASSIGN_BLOCK_SIZE = 16384
+# String similarity scorer; its name labels cached scores
+STRING_SCORER = fuzz.ratio
+STRING_METRIC = STRING_SCORER.__name__
+
+_score_cache: OrderedDict = OrderedDict()
+# Computations in progress per score cache key; identical concurrent requests wait
+# on the first one instead of recomputing (single flight)
+_in_flight: dict[tuple, Future] = {}
+_score_lock = threading.Lock()
 
 
 def find_partials_pl(self, ref: str) -> pl.Expr:
@@ -15,18 +55,25 @@ def find_partials_pl(self, ref: str) -> pl.Expr:
     """
 
     def compute_similarity(series: pl.Series) -> pl.Series:
-        # Convert to list for rapidfuzz processing
-        strings = series.to_list()
-        # Calculate similarity scores
-        scores = [fuzz.ratio(s, ref) if s is not None else None for s in strings]
-        return pl.Series(scores, dtype=pl.Float64)
+        with span("string_score", rows=len(series)):
+            # Convert to list for rapidfuzz processing
+            strings = series.to_list()
+            # Calculate similarity scores
+            scores = [STRING_SCORER(s, ref) if s is not None else None for s in strings]
+            return pl.Series(scores, dtype=pl.Float64)
 
     # Use map_batches to apply the function and return an expression
     return self.map_batches(compute_similarity, return_dtype=pl.Float64)
 
 
 def get_embedding_similarity_pl(
-    self, ref: str, model_name: str = "all-MiniLM-L6-v2"
+    self,
+    ref: str,
+    model_name: str = "all-MiniLM-L6-v2",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    backend: str = DEFAULT_BACKEND,
+    threads: int | None = DEFAULT_THREADS,
 ) -> pl.Expr:
     """
     Calculate semantic similarity using sentence embeddings.
@@ -37,38 +84,38 @@ def get_embedding_similarity_pl(
         model_name: Sentence transformer model to use (default: all-MiniLM-L6-v2)
                    - 22MB model, 384-dim embeddings
                    - Good balance of speed vs quality
+        batch_size: Batch size for the encoder
+        chunk_size: Maximum number of texts per encoder call (bounds memory)
+        backend: Inference backend, one of embeddings.BACKENDS
+        threads: Intra-op thread count for the backend
 
     Returns:
-        pl.Expr: Expression that computes similarity scores (0-100 scale)
+        pl.Expr: Expression that computes similarity scores (0-100 scale),
+                 null where the comment is null
     """
 
     def compute_similarity(series: pl.Series) -> pl.Series:
-        # Import here to avoid loading if not used
-        from sentence_transformers import SentenceTransformer, util
-
-        # Load model (this happens each time - we'll optimize later)
-        model = SentenceTransformer(model_name)
-
-        # Convert series to list for processing
-        comments: list[str] = series.to_list()
+        with span("embedding", rows=len(series)):
+            # Model is loaded once per process and cached
+            model = get_model(model_name, backend, threads)
 
-        # Embed reference text
-        ref_embedding = model.encode([ref])
+            # Embed reference text and comments (normalized, nulls kept as NaN rows)
+            ref_embedding = encode_texts(model, [ref])[0]
+            comment_embeddings = encode_texts(
+                model, series.to_list(), batch_size=batch_size, chunk_size=chunk_size
+            )
 
-        # Embed all comments in one batch call
-        comment_embeddings = model.encode([s for s in comments if s is not None])
+            # Cosine similarity is the dot product of normalized vectors
+            # Educational: Cosine similarity measures angle between vectors
+            # - 1.0 = identical meaning, 0 = orthogonal, -1 = opposite
+            similarities = comment_embeddings @ ref_embedding
 
-        # Calculate cosine similarities using built-in utility
-        # Educational: Cosine similarity measures angle between vectors
-        # - 1.0 = identical meaning, 0 = orthogonal, -1 = opposite
-        similarities = util.cos_sim(ref_embedding, comment_embeddings)[0]
+            # Convert from [-1, 1] to [0, 100] scale to match rapidfuzz output
+            # Educational: (sim + 1) * 50 converts [-1,1] -> [0,100]
+            # This makes embedding similarity comparable with string similarity
+            scaled_similarities = (similarities.astype(np.float64) + 1) * 50
 
-        # Convert from [-1, 1] to [0, 100] scale to match rapidfuzz output
-        # Educational: (sim + 1) * 50 converts [-1,1] -> [0,100]
-        # This makes embedding similarity comparable with string similarity
-        scaled_similarities = [(float(sim) + 1) * 50 for sim in similarities]
-
-        return pl.Series(scaled_similarities, dtype=pl.Float64)
+            return pl.Series(scaled_similarities, dtype=pl.Float64).fill_nan(None)
 
     # Use map_batches to apply function, matching existing pattern
     return self.map_batches(compute_similarity, return_dtype=pl.Float64)
@@ -79,13 +126,54 @@ pl.Expr.find_partials_pl = find_partials_pl
 pl.Expr.get_embedding_similarity_pl = get_embedding_similarity_pl
 
 
+def group_key(df: pl.DataFrame) -> str:
+    """Column that identifies a duplicate group: normalized_hash when available."""
+    return "normalized_hash" if "normalized_hash" in df.columns else "content_hash"
+
+
+def text_column(df: pl.DataFrame) -> str:
+    """Column to score: normalized_comment when available."""
+    return "normalized_comment" if "normalized_comment" in df.columns else "comment"
+
+
 def get_duplicate_groups(df: pl.DataFrame) -> pl.DataFrame:
-    """Group by content_hash and filter for duplicates."""
-    return (
-        df.group_by("content_hash")
-        .agg(pl.len(), pl.col("comment"), pl.col("modify_date"))
-        .filter(pl.col("len") > 1)
-        .sort(by="len", descending=True)
+    """
+    Group by normalized_hash (or content_hash) and filter for duplicates.
+
+    content_hash of a group is the hash of its first raw variant; n_variants counts
+    the raw texts that normalize to the same text.
+    """
+    key_col = group_key(df)
+    representative = (
+        [pl.col("content_hash").first()] if key_col != "content_hash" else []
+    )
+    with span("group", rows=len(df)):
+        return (
+            df.group_by(key_col)
+            .agg(
+                *representative,
+                pl.len(),
+                pl.col("comment"),
+                pl.col("modify_date"),
+                pl.col("content_hash").n_unique().alias("n_variants"),
+            )
+            .filter(pl.col("len") > 1)
+            .sort(by="len", descending=True)
+            .select("content_hash", "len", "comment", "modify_date", "n_variants")
+        )
+
+
+def compared_rows(df: pl.DataFrame, exclude_hash: str) -> pl.DataFrame:
+    """
+    Rows to compare against a reference: comments with duplicates (i.e. templates)
+    outside the reference's own group.
+    """
+    key = group_key(df)
+    excluded = df.filter(pl.col("content_hash") == exclude_hash)[key].unique().to_list()
+    return df.filter(
+        pl.col("content_hash") != exclude_hash,
+        ~pl.col(key).is_in(excluded),
+        pl.col("is_duplicate"),
     )
 
 
@@ -105,12 +193,251 @@ def get_reference_text(df_filt: pl.DataFrame, content_hash: str) -> str:
     ).to_series()[0][0]
 
 
+def get_cached_embedding_similarity(
+    df: pl.DataFrame,
+    ref: str,
+    docket_id: str,
+    model_name: str = "all-MiniLM-L6-v2",
+    backend: str = DEFAULT_BACKEND,
+    threads: int | None = DEFAULT_THREADS,
+    dtype: str = EMBEDDING_STORE_DTYPE,
+    cache_dir: str | None = EMBEDDING_CACHE_DIR,
+    text_col: str = "comment",
+) -> pl.Series:
+    """
+    Embedding similarity (0-100 scale) scored from the docket's on-disk store.
+
+    Comments missing from the store are encoded and added first; the scores are
+    NumPy dot products over the memory-mapped float32/float16/int8 vectors.
+
+    Args:
+        df: DataFrame with comment and content_hash columns
+        ref: Reference string to compare against
+        docket_id: Docket the store belongs to
+        model_name: Sentence transformer model
+        backend: Embedding inference backend
+        threads: Intra-op thread count for the backend
+        dtype: Storage dtype (float32, float16 or int8)
+        cache_dir: Root directory of the embedding cache
+        text_col: Column holding the text to embed
+
+    Returns:
+        pl.Series: Scores aligned with df, null where the comment is null
+    """
+    hashes = df["content_hash"].to_list()
+
+    with span("embedding", rows=len(df), docket_id=docket_id, dtype=dtype):
+        store = get_docket_store(
+            docket_id,
+            hashes,
+            df[text_col].to_list(),
+            model_name=model_name,
+            backend=backend,
+            dtype=dtype,
+            root=cache_dir,
+            threads=threads,
+            text_col=text_col,
+        )
+        ref_embedding = encode_texts(get_model(model_name, backend, threads), [ref])[0]
+
+        rows = store.rows(hashes)
+        similarities = np.full(len(rows), np.nan)
+        similarities[rows >= 0] = store.scores(ref_embedding, rows[rows >= 0])
+
+    # Same [-1, 1] -> [0, 100] scaling as get_embedding_similarity_pl
+    return pl.Series(
+        "embedding_similarity", (similarities + 1) * 50, dtype=pl.Float64
+    ).fill_nan(None)
+
+
+def _score_key(
+    docket_id: str, reference_hash: str, backend: str, use_store: bool
+) -> tuple:
+    """Score cache key: (docket, reference, string metric, embedding model)."""
+    model = (
+        DEFAULT_MODEL,
+        backend,
+        DEFAULT_WINDOW_WORDS,
+        DEFAULT_MAX_CHUNKS,
+        EMBEDDING_STORE_DTYPE if use_store else "float32",
+    )
+    return (docket_id, reference_hash, STRING_METRIC, model)
+
+
+def cached_raw_similarities(
+    docket_id: str, reference_hash: str, backend: str = DEFAULT_BACKEND
+) -> pl.DataFrame | None:
+    """Raw scores of a (docket, reference) pair if they are in the score cache."""
+    key = _score_key(
+        docket_id, reference_hash, backend, use_store=bool(EMBEDDING_CACHE_DIR)
+    )
+    with _score_lock:
+        if key in _score_cache:
+            _score_cache.move_to_end(key)
+            return _score_cache[key]
+    return None
+
+
+def raw_similarities(
+    df: pl.DataFrame,
+    reference_text: str,
+    exclude_hash: str,
+    backend: str = DEFAULT_BACKEND,
+    threads: int | None = DEFAULT_THREADS,
+    docket_id: str | None = None,
+) -> pl.DataFrame:
+    """
+    String and embedding similarity of each distinct comment to the reference.
+
+    Each duplicate group (normalized_hash, or content_hash for frames without
+    normalized columns) is scored once, on its normalized text when available,
+    and the reference's own group is excluded. With a docket_id the result is kept in an LRU
+    cache keyed by (docket, reference hash, string metric, embedding model), so
+    scoring the same reference again is a dictionary lookup, and concurrent calls
+    with the same key (e.g. from several app sessions, each in its own thread) wait
+    for the first one and share its result.
+
+    Args:
+        df: DataFrame with comment, content_hash and is_duplicate columns
+        reference_text: Text to compare against
+        exclude_hash: Content hash of the reference, excluded from the comparison
+        backend: Embedding inference backend, one of embeddings.BACKENDS
+        threads: Intra-op thread count for the embedding backend
+        docket_id: Docket being scored; enables the score cache and, when
+                   EMBEDDING_CACHE_DIR is configured, the on-disk embedding store
+
+    Returns:
+        DataFrame with the group key column (see group_key), similarity and
+        embedding_similarity
+    """
+    use_store = docket_id is not None and bool(EMBEDDING_CACHE_DIR)
+    score = dict(
+        df=df,
+        reference_text=reference_text,
+        exclude_hash=exclude_hash,
+        backend=backend,
+        threads=threads,
+        docket_id=docket_id,
+        use_store=use_store,
+    )
+    if docket_id is None:
+        return _score_candidates(**score)
+
+    key = _score_key(docket_id, exclude_hash, backend, use_store)
+    with _score_lock:
+        if key in _score_cache:
+            _score_cache.move_to_end(key)
+            return _score_cache[key]
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = _in_flight[key] = Future()
+
+    if not leader:
+        with span("similarities_coalesced", reference_hash=exclude_hash):
+            return future.result()
+
+    try:
+        scores = _score_candidates(**score)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        with _score_lock:
+            _score_cache[key] = scores
+            if len(_score_cache) > SCORE_CACHE_SIZE:
+                _score_cache.popitem(last=False)
+        future.set_result(scores)
+    finally:
+        with _score_lock:
+            del _in_flight[key]
+
+    return scores
+
+
+def _score_candidates(
+    df: pl.DataFrame,
+    reference_text: str,
+    exclude_hash: str,
+    backend: str,
+    threads: int | None,
+    docket_id: str | None,
+    use_store: bool,
+) -> pl.DataFrame:
+    """Score every duplicate group of df outside the reference's group (uncached)."""
+    key_col = group_key(df)
+    text_col = text_column(df)
+    if text_col == "normalized_comment":
+        reference_text = normalize_comment(reference_text)
+
+    with span("similarities", reference_hash=exclude_hash) as s:
+        candidates = compared_rows(df, exclude_hash).unique(
+            subset=key_col, keep="first", maintain_order=True
+        )
+
+        if use_store:
+            embedding_similarity = pl.lit(
+                get_cached_embedding_similarity(
+                    candidates,
+                    ref=reference_text,
+                    docket_id=docket_id,
+                    backend=backend,
+                    threads=threads,
+                    cache_dir=EMBEDDING_CACHE_DIR,
+                    text_col=text_col,
+                )
+            )
+        else:
+            embedding_similarity = pl.col(text_col).get_embedding_similarity_pl(
+                ref=reference_text, backend=backend, threads=threads
+            )
+
+        scores = candidates.select(
+            pl.col(key_col),
+            pl.col(text_col).find_partials_pl(ref=reference_text).alias("similarity"),
+            embedding_similarity.alias("embedding_similarity"),
+        )
+        s["rows"] = len(scores)
+
+    return scores
+
+
+def weight_similarities(
+    scores: pl.DataFrame, string_weight: float = 0.3, embedding_weight: float = 0.7
+) -> pl.DataFrame:
+    """
+    Add the weighted combination of raw scores and sort by it.
+
+    Cheap column arithmetic, so weights can change without rescoring.
+
+    Args:
+        scores: DataFrame with similarity and embedding_similarity columns
+        string_weight: Weight for string-based similarity (0.0-1.0)
+        embedding_weight: Weight for embedding-based similarity (0.0-1.0)
+
+    Returns:
+        DataFrame with similarity_w, sorted by it (descending)
+    """
+    with span("sort", rows=len(scores)):
+        return scores.with_columns(
+            # Create weighted similarity combination
+            # Educational: Weighted average allows balancing different similarity types
+            (
+                pl.col("similarity") * string_weight
+                + pl.col("embedding_similarity") * embedding_weight
+            ).alias("similarity_w")
+        ).sort(by="similarity_w", descending=True)
+
+
 def calculate_similarities(
     df: pl.DataFrame,
     reference_text: str,
     exclude_hash: str,
     string_weight: float = 0.3,
     embedding_weight: float = 0.7,
+    backend: str = DEFAULT_BACKEND,
+    threads: int | None = DEFAULT_THREADS,
+    docket_id: str | None = None,
 ) -> pl.DataFrame:
     """
     Calculate similarity scores against reference text using both string and embedding similarity.
@@ -126,43 +453,481 @@ def calculate_similarities(
         exclude_hash: Content hash to exclude from comparison
         string_weight: Weight for string-based similarity (0.0-1.0)
         embedding_weight: Weight for embedding-based similarity (0.0-1.0)
+        backend: Embedding inference backend, one of embeddings.BACKENDS
+        threads: Intra-op thread count for the embedding backend
+        docket_id: Docket being scored; enables the raw score cache (see
+                   raw_similarities) and the on-disk embedding store
 
     Returns:
         DataFrame with comment, similarity scores, and weighted combination
 
     Note: Weights should sum to 1.0 for intuitive interpretation
     """
+    raw = raw_similarities(
+        df,
+        reference_text=reference_text,
+        exclude_hash=exclude_hash,
+        backend=backend,
+        threads=threads,
+        docket_id=docket_id,
+    )
+    scores = with_comments(df, raw, exclude_hash)
+
+    return weight_similarities(scores, string_weight, embedding_weight)
+
+
+def with_comments(
+    df: pl.DataFrame, raw: pl.DataFrame, exclude_hash: str
+) -> pl.DataFrame:
+    """Attach per-group raw scores to every compared comment row of df."""
+    key_col = group_key(df)
     return (
-        df.filter(
-            pl.col("content_hash") != exclude_hash,
-            pl.col(
-                "is_duplicate"
-            ),  # only do similarity for those that have duplicates (i.e. templates)
+        compared_rows(df, exclude_hash)
+        .select(list(dict.fromkeys(["comment", "content_hash", key_col])))
+        .join(raw, on=key_col, how="left", maintain_order="left")
+        .select("comment", "content_hash", "similarity", "embedding_similarity")
+    )
+
+
+def cascade_similarities(
+    df: pl.DataFrame,
+    reference_text: str,
+    exclude_hash: str,
+    min_word_overlap: float = CASCADE_MIN_WORD_OVERLAP,
+    score_cutoff: float = CASCADE_SCORE_CUTOFF,
+    certain_score: float | None = None,
+    string_weight: float = 0.3,
+    embedding_weight: float = 0.7,
+    backend: str = DEFAULT_BACKEND,
+    threads: int | None = DEFAULT_THREADS,
+    docket_id: str | None = None,
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Score a docket against a reference with cheap stages gating the expensive ones.
+
+    Stages, each run only on the survivors of the previous one:
+
+    1. length: drop comments whose length alone caps ``fuzz.ratio`` below
+       score_cutoff (200 * min(len) / (len_a + len_b); lossless)
+    2. ngram: drop comments where fewer than min_word_overlap of the words (of
+       the shorter text) are found in the reference's word set
+    3. string: ``fuzz.ratio`` with score_cutoff; lower scores are dropped
+    4. embedding: transformer similarity, skipped for comments whose string score
+       is at least certain_score (when set)
+
+    Comments without an embedding score get their string score as similarity_w.
+
+    Args:
+        df: DataFrame with comment, content_hash and is_duplicate columns
+        reference_text: Text to compare against
+        exclude_hash: Content hash of the reference, excluded from the comparison
+        min_word_overlap: Stage 2 threshold (0 disables the stage)
+        score_cutoff: Stage 3 threshold on the 0-100 string score
+        certain_score: String score above which embeddings are skipped
+        string_weight: Weight for string-based similarity (0.0-1.0)
+        embedding_weight: Weight for embedding-based similarity (0.0-1.0)
+        backend: Embedding inference backend, one of embeddings.BACKENDS
+        threads: Intra-op thread count for the embedding backend and rapidfuzz
+        docket_id: Docket being scored; enables the on-disk embedding store
+
+    Returns:
+        tuple: (scores, stats). scores has the columns of calculate_similarities
+        for surviving comments; stats has stage, rows_in, rows_out and seconds.
+    """
+    key_col = group_key(df)
+    text_col = text_column(df)
+    if text_col == "normalized_comment":
+        reference_text = normalize_comment(reference_text)
+
+    candidates = (
+        compared_rows(df, exclude_hash)
+        .filter(pl.col(text_col).is_not_null())
+        .unique(subset=key_col, keep="first", maintain_order=True)
+        .select(list(dict.fromkeys([key_col, "content_hash", text_col])))
+    )
+    stats = []
+
+    def run_stage(name: str, frame: pl.DataFrame, fn) -> pl.DataFrame:
+        start = time.perf_counter()
+        with span(f"cascade_{name}", rows=len(frame)) as s:
+            out = fn(frame)
+            s["rows_out"] = len(out)
+        stats.append(
+            {
+                "stage": name,
+                "rows_in": len(frame),
+                "rows_out": len(out),
+                "seconds": time.perf_counter() - start,
+            }
         )
-        .select(
-            pl.col("comment"),
-            pl.col("comment").find_partials_pl(ref=reference_text).alias("similarity"),
-            pl.col("comment")
-            .get_embedding_similarity_pl(ref=reference_text)
-            .alias("embedding_similarity"),
+        return out
+
+    ref_length = len(reference_text)
+    n_chars = pl.col(text_col).str.len_chars()
+    survivors = run_stage(
+        "length",
+        candidates,
+        lambda frame: frame.filter(
+            200 * pl.min_horizontal(n_chars, ref_length) / (n_chars + ref_length)
+            >= score_cutoff
+        ),
+    )
+
+    if min_word_overlap > 0:
+        ref_words = reference_text.split(" ")
+        words = pl.col(text_col).str.split(" ")
+        # Words found in the reference's vocabulary (a hash set lookup per word)
+        shared = words.list.eval(
+            pl.element().is_in(pl.Series(ref_words).unique().implode())
+        ).list.sum()
+        survivors = run_stage(
+            "ngram",
+            survivors,
+            lambda frame: frame.filter(
+                shared
+                / pl.min_horizontal(
+                    pl.col(text_col).str.count_matches(" ", literal=True) + 1,
+                    len(ref_words),
+                )
+                >= min_word_overlap
+            ),
         )
+
+    def string_stage(frame: pl.DataFrame) -> pl.DataFrame:
+        scores = process.cdist(
+            [reference_text],
+            frame[text_col].to_list(),
+            scorer=STRING_SCORER,
+            score_cutoff=score_cutoff,
+            dtype=np.float32,
+            workers=threads or -1,
+        )[0]
+        return frame.with_columns(
+            pl.Series("similarity", scores, dtype=pl.Float64)
+        ).filter(pl.col("similarity") >= score_cutoff)
+
+    survivors = run_stage("string", survivors, string_stage)
+
+    def embedding_stage(frame: pl.DataFrame) -> pl.DataFrame:
+        if certain_score is not None:
+            frame = frame.filter(pl.col("similarity") < certain_score)
+        if not len(frame):
+            return frame.with_columns(
+                pl.lit(None, pl.Float64).alias("embedding_similarity")
+            )
+        if docket_id is not None and EMBEDDING_CACHE_DIR:
+            embedding_similarity = get_cached_embedding_similarity(
+                frame,
+                ref=reference_text,
+                docket_id=docket_id,
+                backend=backend,
+                threads=threads,
+                cache_dir=EMBEDDING_CACHE_DIR,
+                text_col=text_col,
+            )
+        else:
+            embedding_similarity = frame.select(
+                pl.col(text_col).get_embedding_similarity_pl(
+                    ref=reference_text, backend=backend, threads=threads
+                )
+            ).to_series()
+        return frame.with_columns(embedding_similarity.alias("embedding_similarity"))
+
+    embedded = run_stage("embedding", survivors, embedding_stage)
+    scored = survivors.join(
+        embedded.select(key_col, "embedding_similarity"), on=key_col, how="left"
+    ).select(key_col, "similarity", "embedding_similarity")
+
+    scores = (
+        with_comments(df, scored, exclude_hash)
+        .filter(pl.col("similarity").is_not_null())
         .with_columns(
-            # Create weighted similarity combination
-            # Educational: Weighted average allows balancing different similarity types
-            (
+            pl.when(pl.col("embedding_similarity").is_not_null())
+            .then(
                 pl.col("similarity") * string_weight
                 + pl.col("embedding_similarity") * embedding_weight
-            ).alias("similarity_w")
+            )
+            .otherwise(pl.col("similarity"))
+            .alias("similarity_w")
         )
         .sort(by="similarity_w", descending=True)
     )
 
+    return scores, pl.DataFrame(
+        stats,
+        schema={
+            "stage": pl.String,
+            "rows_in": pl.Int64,
+            "rows_out": pl.Int64,
+            "seconds": pl.Float64,
+        },
+    )
+
+
+def _reference_texts(
+    df: pl.DataFrame, reference_hashes: list[str], text_col: str
+) -> list[str]:
+    """Text of each reference hash in df, raising if one is not found."""
+    references = (
+        df.filter(pl.col("content_hash").is_in(reference_hashes))
+        .unique(subset="content_hash", keep="first")
+        .select("content_hash", text_col)
+    )
+    ref_texts = dict(references.iter_rows())
+    missing = [h for h in reference_hashes if h not in ref_texts]
+    if missing:
+        raise ValueError(f"Reference hashes not found in df: {missing}")
+    return [ref_texts[h] for h in reference_hashes]
+
+
+def _reference_score_blocks(
+    candidates: pl.DataFrame,
+    ref_texts: list[str],
+    text_col: str,
+    string_weight: float,
+    embedding_weight: float,
+    backend: str,
+    threads: int | None,
+    docket_id: str | None,
+):
+    """
+    Score candidates against every reference, ASSIGN_BLOCK_SIZE candidates at a time.
+
+    The candidates and the references are each embedded once (the candidates from
+    the on-disk store when docket_id is set and EMBEDDING_CACHE_DIR is configured).
+
+    Yields:
+        tuple: (start, stop, string, embedding, combined), each score a
+        (stop - start, references) matrix on the 0-100 scale
+    """
+    texts = candidates[text_col].to_list()
+    n = len(texts)
+
+    model = get_model(DEFAULT_MODEL, backend, threads)
+    ref_vectors = encode_texts(model, ref_texts)
+    use_store = docket_id is not None and bool(EMBEDDING_CACHE_DIR)
+    if use_store:
+        store = get_docket_store(
+            docket_id,
+            candidates["content_hash"].to_list(),
+            texts,
+            backend=backend,
+            threads=threads,
+            text_col=text_col,
+        )
+        store_rows = store.rows(candidates["content_hash"].to_list())
+    else:
+        vectors = encode_texts(model, texts)
+
+    for start in range(0, n, ASSIGN_BLOCK_SIZE):
+        stop = min(start + ASSIGN_BLOCK_SIZE, n)
+        block_vectors = (
+            store.to_float32(store_rows[start:stop])
+            if use_store
+            else vectors[start:stop]
+        )
+        # Same [-1, 1] -> [0, 100] scaling as get_embedding_similarity_pl
+        embedding = (block_vectors @ ref_vectors.T + 1) * 50
+        string = process.cdist(
+            texts[start:stop],
+            ref_texts,
+            scorer=STRING_SCORER,
+            dtype=np.float32,
+            workers=threads or -1,
+        )
+        combined = string_weight * string + embedding_weight * embedding
+        yield start, stop, string, embedding, combined
+
+
+def assign_references(
+    df: pl.DataFrame,
+    reference_hashes: list[str],
+    string_weight: float = 0.3,
+    embedding_weight: float = 0.7,
+    backend: str = DEFAULT_BACKEND,
+    threads: int | None = DEFAULT_THREADS,
+    docket_id: str | None = None,
+) -> pl.DataFrame:
+    """
+    Score every distinct comment against many references and keep the best one.
+
+    The docket is embedded once (from the on-disk store when docket_id is set and
+    EMBEDDING_CACHE_DIR is configured) and R references x N comments are scored
+    with one normalized matmul and one rapidfuzz ``cdist`` call per block of
+    ASSIGN_BLOCK_SIZE comments, instead of one full pass per reference.
+
+    Args:
+        df: DataFrame with comment and content_hash columns
+        reference_hashes: content_hash of each reference (e.g. group representatives)
+        string_weight: Weight for string-based similarity (0.0-1.0)
+        embedding_weight: Weight for embedding-based similarity (0.0-1.0)
+        backend: Embedding inference backend, one of embeddings.BACKENDS
+        threads: Intra-op thread count for the embedding backend and rapidfuzz
+        docket_id: Docket being scored; enables the on-disk embedding store
+
+    Returns:
+        DataFrame with content_hash, reference_hash (best match) and the
+        similarity, embedding_similarity and similarity_w of that reference,
+        sorted by similarity_w (descending)
+    """
+    key_col = group_key(df)
+    text_col = text_column(df)
+    ref_texts = _reference_texts(df, reference_hashes, text_col)
+
+    candidates = (
+        df.filter(pl.col(text_col).is_not_null())
+        .unique(subset=key_col, keep="first", maintain_order=True)
+        .select(list(dict.fromkeys([key_col, "content_hash", text_col])))
+    )
+    n = len(candidates)
+
+    with span("assign_references", rows=n, references=len(reference_hashes)) as s:
+        best = np.empty(n, dtype=np.int64)
+        best_scores = np.empty((3, n), dtype=np.float64)
+        for start, stop, string, embedding, combined in _reference_score_blocks(
+            candidates,
+            ref_texts,
+            text_col,
+            string_weight,
+            embedding_weight,
+            backend,
+            threads,
+            docket_id,
+        ):
+            block_best = combined.argmax(axis=1)
+            rows = np.arange(stop - start)
+            best[start:stop] = block_best
+            best_scores[0, start:stop] = string[rows, block_best]
+            best_scores[1, start:stop] = embedding[rows, block_best]
+            best_scores[2, start:stop] = combined[rows, block_best]
+        s["blocks"] = -(-n // ASSIGN_BLOCK_SIZE)
+
+    scores = candidates.select(key_col).with_columns(
+        pl.Series("reference_hash", reference_hashes, dtype=pl.String).gather(best),
+        pl.Series("similarity", best_scores[0]),
+        pl.Series("embedding_similarity", best_scores[1]),
+        pl.Series("similarity_w", best_scores[2]),
+    )
+    return (
+        df.filter(pl.col(text_col).is_not_null())
+        .select(list(dict.fromkeys(["content_hash", key_col])))
+        .unique(subset="content_hash", keep="first", maintain_order=True)
+        .join(scores, on=key_col)
+        .select(
+            "content_hash",
+            "reference_hash",
+            "similarity",
+            "embedding_similarity",
+            "similarity_w",
+        )
+        .sort("similarity_w", descending=True)
+    )
+
+
+def score_references(
+    df: pl.DataFrame,
+    reference_hashes: list[str],
+    string_weight: float = 0.3,
+    embedding_weight: float = 0.7,
+    backend: str = DEFAULT_BACKEND,
+    threads: int | None = DEFAULT_THREADS,
+    docket_id: str | None = None,
+) -> pl.DataFrame:
+    """
+    Score the duplicate groups of a docket against each of many references.
+
+    Gives the scores calculate_similarities gives for each reference (comments
+    with duplicates, outside the reference's own group), but the docket is
+    embedded once and scored in the blocks of assign_references instead of once
+    per reference.
+
+    Args:
+        df: DataFrame with comment, content_hash and is_duplicate columns
+        reference_hashes: content_hash of each reference (e.g. group representatives)
+        string_weight: Weight for string-based similarity (0.0-1.0)
+        embedding_weight: Weight for embedding-based similarity (0.0-1.0)
+        backend: Embedding inference backend, one of embeddings.BACKENDS
+        threads: Intra-op thread count for the embedding backend and rapidfuzz
+        docket_id: Docket being scored; enables the on-disk embedding store
+
+    Returns:
+        DataFrame with reference_hash, content_hash, similarity,
+        embedding_similarity and similarity_w, one row per compared row of df
+    """
+    key_col = group_key(df)
+    text_col = text_column(df)
+    ref_texts = _reference_texts(df, reference_hashes, text_col)
+    ref_keys = (
+        df.filter(pl.col("content_hash").is_in(reference_hashes))
+        .unique(subset="content_hash", keep="first")
+        .select("content_hash", pl.col(key_col).alias("reference_key"))
+    )
+    references = (
+        pl.DataFrame(
+            {"reference_hash": reference_hashes}, schema={"reference_hash": pl.String}
+        )
+        .with_row_index("reference")
+        .join(ref_keys, left_on="reference_hash", right_on="content_hash", how="left")
+    )
+
+    rows = df.filter(pl.col("is_duplicate"), pl.col(text_col).is_not_null())
+    candidates = rows.unique(subset=key_col, keep="first", maintain_order=True).select(
+        list(dict.fromkeys([key_col, "content_hash", text_col]))
+    )
+    n_refs = len(reference_hashes)
+
+    blocks = []
+    with span("score_references", rows=len(candidates), references=n_refs):
+        for start, stop, string, embedding, combined in _reference_score_blocks(
+            candidates,
+            ref_texts,
+            text_col,
+            string_weight,
+            embedding_weight,
+            backend,
+            threads,
+            docket_id,
+        ):
+            pairs = np.arange((stop - start) * n_refs)
+            blocks.append(
+                pl.DataFrame(
+                    {
+                        key_col: candidates[key_col]
+                        .slice(start, stop - start)
+                        .gather(pairs // n_refs),
+                        "reference": pl.Series(pairs % n_refs, dtype=pl.UInt32),
+                        "similarity": string.ravel().astype(np.float64),
+                        "embedding_similarity": embedding.ravel().astype(np.float64),
+                        "similarity_w": combined.ravel().astype(np.float64),
+                    }
+                )
+            )
+
+    if not blocks:
+        return pl.DataFrame(
+            schema={
+                "reference_hash": pl.String,
+                "content_hash": pl.String,
+                "similarity": pl.Float64,
+                "embedding_similarity": pl.Float64,
+                "similarity_w": pl.Float64,
+            }
+        )
 
-def get_template_df(df_filt: pl.DataFrame, content_hash: str) -> pl.DataFrame:
-    """Format selected text with dates for display."""
     return (
-        df_filt.filter(pl.col("content_hash") == content_hash)
-        .explode(pl.col("modify_date"), pl.col("comment"))
-        .sort(by="modify_date")
-        .with_columns(pl.col("modify_date").dt.strftime("%B %d, %Y at %I:%M %p UTC"))
+        pl.concat(blocks)
+        .join(references, on="reference")
+        # A reference is not compared with its own group
+        .filter(pl.col(key_col) != pl.col("reference_key"))
+        .join(
+            rows.select(list(dict.fromkeys(["content_hash", key_col]))),
+            on=key_col,
+        )
+        .select(
+            "reference_hash",
+            "content_hash",
+            "similarity",
+            "embedding_similarity",
+            "similarity_w",
+        )
     )
@@ -0,0 +1,5 @@
+"""Settings from .env, read once and shared by all modules."""
+
+from dotenv import dotenv_values
+
+settings = dotenv_values()
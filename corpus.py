@@ -0,0 +1,516 @@
+"""
+Corpus-wide campaign search across every docket of the parquet hive.
+
+Exact copies are looked up in the ingest-time content_hash index written by
+data2parquet.py (CONTENT_HASH_INDEX). For near-duplicate (templated, lightly
+edited) text, MinHash signatures of word shingles and their LSH band buckets are
+built once over the hive and persisted as parquet (signatures.parquet,
+lsh.parquet), sorted by their lookup key so queries only read the row groups
+that can match.
+
+Usage:
+    python corpus.py build --workers 4
+    python corpus.py search --hash CONTENT_HASH
+    python corpus.py search --text "I am writing to oppose..."
+"""
+
+import hashlib
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+from rich.console import Console
+from rich.table import Table
+
+from config import settings
+from data import (
+    CONTENT_HASH_INDEX,
+    fetch_comments_df,
+    get_docket_partitions,
+    lookup_content_hashes,
+    read_matching,
+)
+from instrument import span
+
+console = Console()
+
+CORPUS_INDEX_DIR = settings.get("CORPUS_INDEX_DIR") or "corpus_index"
+
+SHINGLE_WORDS = 5
+NUM_PERM = 64
+BANDS = 16  # 16 bands of 4 rows: candidates from a Jaccard similarity of about 0.5
+ROWS_PER_BAND = NUM_PERM // BANDS
+MIN_JACCARD = 0.5
+ROW_GROUP_SIZE = 100_000
+# Bump when signatures change; search refuses indexes of another version
+INDEX_VERSION = 2
+
+_rng = np.random.default_rng(20240101)
+# Multiply-shift hash family over 64-bit shingle hashes (odd multipliers)
+_PERM_A = _rng.integers(1, 2**63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64)
+
+
+def stable_hashes(values: pl.Series) -> pl.Series:
+    """64-bit blake2b hashes of strings, stable across Python and Polars versions."""
+    return pl.Series(
+        [
+            int.from_bytes(
+                hashlib.blake2b(v.encode(), digest_size=8).digest(), "little"
+            )
+            for v in values
+        ],
+        dtype=pl.UInt64,
+    )
+
+
+def shingle_hashes(
+    df: pl.DataFrame, text_col: str = "comment", k: int = SHINGLE_WORDS
+) -> pl.DataFrame:
+    """
+    Distinct hashed word k-shingles per content_hash.
+
+    Text is lowercased and reduced to word characters, so punctuation and
+    whitespace edits do not change the shingles. Texts shorter than k words
+    become a single shingle. Shingles are hashed with stable_hashes, since the
+    index stores signatures that query signatures are compared against.
+
+    Returns:
+        DataFrame with content_hash and shingle (UInt64), sorted by content_hash
+    """
+    words = (
+        df.select("content_hash", text_col)
+        .drop_nulls()
+        .unique(subset="content_hash")
+        .with_columns(
+            pl.col(text_col).str.to_lowercase().str.extract_all(r"\w+").alias("words")
+        )
+        .select("content_hash", "words")
+        .explode("words")
+        .drop_nulls()
+        .with_columns(pl.int_range(pl.len()).over("content_hash").alias("pos"))
+    )
+    shingle = pl.concat_str(
+        [pl.col("words").shift(-i).over("content_hash") for i in range(k)],
+        separator=" ",
+    )
+    n_words = pl.len().over("content_hash")
+    whole_text = pl.col("words").implode().over("content_hash").list.join(" ")
+    shingles = (
+        words.with_columns(
+            pl.when(n_words < k).then(whole_text).otherwise(shingle).alias("shingle"),
+            n_words.alias("n_words"),
+        )
+        # One shingle per full k-gram, or the whole text when it is shorter than k
+        .filter((pl.col("pos") <= pl.col("n_words") - k) | (pl.col("pos") == 0))
+        .select("content_hash", "shingle")
+        .unique()
+    )
+    # Templated dockets repeat most shingles; hash each distinct one once
+    distinct = shingles["shingle"].unique()
+    hashed = pl.DataFrame({"shingle": distinct, "hash": stable_hashes(distinct)})
+    return (
+        shingles.join(hashed, on="shingle")
+        .select("content_hash", pl.col("hash").alias("shingle"))
+        .sort("content_hash")
+    )
+
+
+def minhash_signatures(shingles: pl.DataFrame) -> tuple[list[str], np.ndarray]:
+    """
+    MinHash signatures from hashed shingles.
+
+    Args:
+        shingles: Output of shingle_hashes (sorted by content_hash)
+
+    Returns:
+        tuple: (content hashes, (n, NUM_PERM) uint32 signature matrix)
+    """
+    if shingles.is_empty():
+        return [], np.empty((0, NUM_PERM), dtype=np.uint32)
+
+    groups = shingles["content_hash"]
+    starts = np.flatnonzero(
+        np.concatenate([[True], (groups[1:] != groups[:-1]).to_numpy()])
+    )
+    values = shingles["shingle"].to_numpy()
+
+    signatures = np.empty((len(starts), NUM_PERM), dtype=np.uint32)
+    with np.errstate(over="ignore"):
+        for p in range(NUM_PERM):
+            permuted = (values * _PERM_A[p] + _PERM_B[p]) >> np.uint64(32)
+            signatures[:, p] = np.minimum.reduceat(permuted, starts)
+
+    return groups.gather(starts).to_list(), signatures
+
+
+def band_buckets(signatures: np.ndarray) -> np.ndarray:
+    """(n, BANDS) uint64 LSH bucket per band; the band number is mixed in."""
+    n = len(signatures)
+    bands = signatures.reshape(n, BANDS, ROWS_PER_BAND).astype(np.uint64)
+    buckets = np.zeros((n, BANDS), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for r in range(ROWS_PER_BAND):
+            buckets = buckets * np.uint64(0x100000001B3) ^ bands[:, :, r]
+        buckets ^= np.arange(BANDS, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    return buckets
+
+
+def _parts_dir(index_dir: str) -> Path:
+    # Parts of older index versions are ignored, so resumed builds redo them
+    return Path(index_dir, "parts", f"v{INDEX_VERSION}")
+
+
+def _part_path(index_dir: str, kind: str, docket_id: str) -> Path:
+    return _parts_dir(index_dir) / kind / f"{docket_id}.parquet"
+
+
+def index_docket(index_dir: str, docket_id: str, overwrite: bool = False) -> dict:
+    """
+    Write one docket's signatures and LSH buckets as index parts.
+
+    Dockets whose parts exist are skipped, so interrupted builds resume.
+    """
+    parts = {k: _part_path(index_dir, k, docket_id) for k in ["lsh", "sig"]}
+    if all(p.exists() for p in parts.values()) and not overwrite:
+        return {"docket_id": docket_id, "status": "skipped"}
+
+    df = fetch_comments_df(docket_id=docket_id)
+
+    with span("minhash", rows=len(df), docket_id=docket_id):
+        content_hashes, signatures = minhash_signatures(shingle_hashes(df))
+        buckets = band_buckets(signatures)
+
+    sig = pl.DataFrame(
+        {
+            "content_hash": content_hashes,
+            "signature": pl.Series(signatures, dtype=pl.Array(pl.UInt32, NUM_PERM)),
+        }
+    )
+    lsh = pl.DataFrame(
+        {
+            "bucket": buckets.ravel(),
+            "content_hash": np.repeat(np.asarray(content_hashes, dtype=str), BANDS),
+        },
+        schema={"bucket": pl.UInt64, "content_hash": pl.String},
+    )
+
+    for kind, frame in [("sig", sig), ("lsh", lsh)]:
+        parts[kind].parent.mkdir(parents=True, exist_ok=True)
+        frame.write_parquet(parts[kind])
+
+    return {"docket_id": docket_id, "status": "done", "comments": len(df)}
+
+
+def build_index(
+    index_dir: str = CORPUS_INDEX_DIR,
+    agency_codes: list[str] = [],
+    years: list[int] = [],
+    workers: int = 1,
+    overwrite: bool = False,
+) -> list[dict]:
+    """
+    Index every docket of the hive, then merge the parts into sorted files.
+
+    A docket that fails is recorded as failed and left out of the merged index;
+    the other dockets are still indexed. Rerunning the build retries it.
+
+    Args:
+        index_dir: Output directory
+        agency_codes: Restrict to these agencies (default: all)
+        years: Restrict to these years (default: all)
+        workers: Worker processes, one docket per worker at a time
+        overwrite: Re-index dockets that already have parts
+
+    Returns:
+        list: Per-docket summaries (docket_id, status)
+    """
+    docket_ids = get_docket_partitions(agency_codes=agency_codes, years=years)[
+        "docket_id"
+    ].to_list()
+    console.print(f"Indexing {len(docket_ids):,} dockets with {workers} worker(s)")
+
+    summaries = []
+
+    def record(summary: dict) -> None:
+        summaries.append(summary)
+        console.print(summary)
+
+    if workers <= 1:
+        for docket_id in docket_ids:
+            try:
+                record(index_docket(index_dir, docket_id, overwrite))
+            except Exception as e:
+                record(_failed_summary(docket_id, e))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = {
+                executor.submit(
+                    index_docket, index_dir, docket_id, overwrite
+                ): docket_id
+                for docket_id in docket_ids
+            }
+            for future in as_completed(futures):
+                try:
+                    record(future.result())
+                except Exception as e:
+                    record(_failed_summary(futures[future], e))
+
+    failed = [s["docket_id"] for s in summaries if s["status"] == "failed"]
+    if failed:
+        console.print(
+            f"[red]{len(failed):,} docket(s) failed and are not in the index: "
+            f"{', '.join(failed)}[/red]"
+        )
+
+    merge_index(index_dir)
+
+    return summaries
+
+
+def _failed_summary(docket_id: str, error: Exception) -> dict:
+    """Summary entry for a docket that raised, so the build can carry on."""
+    console.print(f"[red]Failed {docket_id}: {error}[/red]")
+    return {"docket_id": docket_id, "status": "failed", "error": repr(error)}
+
+
+def merge_index(index_dir: str = CORPUS_INDEX_DIR) -> None:
+    """Merge per-docket parts into lookup files sorted by their key."""
+    root = Path(index_dir)
+    merges = [
+        ("sig", "signatures.parquet", ["content_hash"], "content_hash", ROW_GROUP_SIZE),
+        (
+            "lsh",
+            "lsh.parquet",
+            ["bucket", "content_hash"],
+            ["bucket", "content_hash"],
+            ROW_GROUP_SIZE,
+        ),
+    ]
+    for kind, filename, sort_by, unique_by, row_group_size in merges:
+        parts = _parts_dir(index_dir) / kind
+        if not any(parts.glob("*.parquet")):
+            continue
+        with span("merge_index", kind=kind):
+            pl.scan_parquet(parts / "*.parquet").unique(subset=unique_by).sort(
+                sort_by
+            ).sink_parquet(
+                root / filename, row_group_size=row_group_size, statistics=True
+            )
+
+    with open(root / "meta.json", "w") as fh:
+        json.dump({"version": INDEX_VERSION}, fh)
+
+
+def _check_version(root: Path) -> None:
+    """Refuse indexes whose signatures were computed differently."""
+    meta = root / "meta.json"
+    # Indexes from before meta.json hashed shingles with Polars' unstable hash
+    version = json.loads(meta.read_text())["version"] if meta.exists() else 1
+    if version != INDEX_VERSION:
+        raise ValueError(
+            f"{root} is a version {version} corpus index, expected "
+            f"{INDEX_VERSION}; rebuild it with `python corpus.py build`"
+        )
+
+
+def _signature_of(text: str) -> np.ndarray | None:
+    """MinHash signature of a query text."""
+    shingles = shingle_hashes(
+        pl.DataFrame({"content_hash": ["query"], "comment": [text]})
+    )
+    _, signatures = minhash_signatures(shingles)
+    return signatures[0] if len(signatures) else None
+
+
+def search(
+    text: str | None = None,
+    content_hash: str | None = None,
+    index_dir: str = CORPUS_INDEX_DIR,
+    min_jaccard: float = MIN_JACCARD,
+    hash_index: str | None = CONTENT_HASH_INDEX,
+) -> pl.DataFrame:
+    """
+    Find exact and near-duplicate copies of a text across the corpus.
+
+    Exact hits come from the content_hash index. Near duplicates are texts sharing at
+    least one LSH bucket with the query, kept when their estimated Jaccard
+    similarity (fraction of equal MinHash values) is at least min_jaccard.
+
+    Args:
+        text: Query text
+        content_hash: Query by hash instead (its signature is read from the index)
+        index_dir: Directory written by build_index
+        min_jaccard: Minimum estimated Jaccard similarity for near duplicates
+        hash_index: content_hash index written by data2parquet.py (default:
+            CONTENT_HASH_INDEX from .env)
+
+    Returns:
+        DataFrame with match ("exact"/"near"), content_hash, jaccard,
+        agency_code, year, docket_id and count
+    """
+    if text is None and content_hash is None:
+        raise ValueError("Pass a text or a content_hash")
+    if hash_index is None:
+        raise ValueError(
+            "Set CONTENT_HASH_INDEX in .env to the index written by data2parquet.py"
+        )
+
+    root = Path(index_dir)
+    _check_version(root)
+    with span("corpus_search", content_hash=content_hash) as s:
+        if content_hash is None:
+            content_hash = hashlib.sha256(text.encode()).hexdigest()
+
+        if text is not None:
+            signature = _signature_of(text)
+        else:
+            found = (
+                pl.scan_parquet(root / "signatures.parquet")
+                .filter(pl.col("content_hash") == content_hash)
+                .collect()
+            )
+            signature = found["signature"][0].to_numpy() if len(found) else None
+
+        near = pl.DataFrame(schema={"content_hash": pl.String, "jaccard": pl.Float64})
+        if signature is not None:
+            buckets = band_buckets(signature[None, :])[0].tolist()
+            candidates = read_matching(root / "lsh.parquet", "bucket", buckets)
+            candidate_sigs = read_matching(
+                root / "signatures.parquet",
+                "content_hash",
+                candidates["content_hash"].to_list(),
+            )
+            if len(candidate_sigs):
+                matrix = candidate_sigs["signature"].to_numpy()
+                near = pl.DataFrame(
+                    {
+                        "content_hash": candidate_sigs["content_hash"],
+                        "jaccard": (matrix == signature).mean(axis=1),
+                    }
+                ).filter(pl.col("jaccard") >= min_jaccard)
+
+        matched = pl.concat(
+            [
+                near,
+                pl.DataFrame({"content_hash": [content_hash], "jaccard": [1.0]}),
+            ]
+        ).unique(subset="content_hash", keep="last")
+
+        hits = (
+            lookup_content_hashes(
+                matched["content_hash"].to_list(), index_path=hash_index
+            )
+            .join(matched, on="content_hash")
+            .with_columns(
+                pl.when(pl.col("content_hash") == content_hash)
+                .then(pl.lit("exact"))
+                .otherwise(pl.lit("near"))
+                .alias("match")
+            )
+            .select(
+                "match",
+                "content_hash",
+                "jaccard",
+                "agency_code",
+                "year",
+                "docket_id",
+                "count",
+            )
+            .sort("jaccard", "count", descending=True)
+        )
+        s["rows"] = len(hits)
+
+    return hits
+
+
+def group_hits(hits: pl.DataFrame) -> pl.DataFrame:
+    """Summarize search hits per docket (agency, year, docket), most copies first."""
+    return (
+        hits.group_by("agency_code", "year", "docket_id")
+        .agg(
+            pl.col("count").filter(pl.col("match") == "exact").sum().alias("exact"),
+            pl.col("count").filter(pl.col("match") == "near").sum().alias("near"),
+            pl.col("content_hash")
+            .filter(pl.col("match") == "near")
+            .n_unique()
+            .alias("near_variants"),
+            pl.col("jaccard")
+            .filter(pl.col("match") == "near")
+            .max()
+            .alias("best_jaccard"),
+        )
+        .with_columns((pl.col("exact") + pl.col("near")).alias("copies"))
+        .sort("copies", descending=True)
+    )
+
+
+def print_hits(grouped: pl.DataFrame) -> None:
+    """Print per-docket search results."""
+    table = Table(title="Campaign search results")
+    for column in ["Agency", "Year", "Docket", "Exact", "Near", "Variants", "Best J"]:
+        table.add_column(column, justify="left" if column == "Docket" else "right")
+    for row in grouped.iter_rows(named=True):
+        best = row["best_jaccard"]
+        table.add_row(
+            row["agency_code"],
+            str(row["year"]),
+            row["docket_id"],
+            f"{row['exact']:,}",
+            f"{row['near']:,}",
+            f"{row['near_variants']:,}",
+            "-" if best is None else f"{best:.2f}",
+        )
+    console.print(table)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build")
+    build_parser.add_argument("--index-dir", type=str, default=CORPUS_INDEX_DIR)
+    build_parser.add_argument("--agency", type=str, nargs="*", default=[])
+    build_parser.add_argument("--year", type=int, nargs="*", default=[])
+    build_parser.add_argument("--workers", type=int, default=1)
+    build_parser.add_argument("--overwrite", action="store_true")
+
+    search_parser = subparsers.add_parser("search")
+    search_parser.add_argument("--index-dir", type=str, default=CORPUS_INDEX_DIR)
+    query = search_parser.add_mutually_exclusive_group(required=True)
+    query.add_argument("--text", type=str)
+    query.add_argument("--hash", type=str)
+    search_parser.add_argument("--min-jaccard", type=float, default=MIN_JACCARD)
+    search_parser.add_argument(
+        "--hash-index",
+        type=str,
+        default=CONTENT_HASH_INDEX,
+        help="content_hash index written by data2parquet.py",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_index(
+            index_dir=args.index_dir,
+            agency_codes=args.agency,
+            years=args.year,
+            workers=args.workers,
+            overwrite=args.overwrite,
+        )
+    else:
+        hits = search(
+            text=args.text,
+            content_hash=args.hash,
+            index_dir=args.index_dir,
+            min_jaccard=args.min_jaccard,
+            hash_index=args.hash_index,
+        )
+        print_hits(group_hits(hits))
@@ -1,18 +1,113 @@
+from datetime import datetime
 from pathlib import Path
 from rich.console import Console
+import duckdb
 import json
+import os
+import tempfile
 import polars as pl
 from glob import glob
 import hashlib
-from dotenv import dotenv_values
-
-MIRRULATIONS_FOLDER = dotenv_values()["MIRRULATIONS_FOLDER"]
-MIRRULATIONS_PARQUET = dotenv_values()["MIRRULATIONS_PARQUET_HIVE"]
+from config import settings
+from instrument import span
+
+MIRRULATIONS_FOLDER = settings.get("MIRRULATIONS_FOLDER")
+MIRRULATIONS_PARQUET = settings.get("MIRRULATIONS_PARQUET_HIVE")
+# Ingest-time content_hash -> docket index written by data2parquet.py
+CONTENT_HASH_INDEX = settings.get("CONTENT_HASH_INDEX")
+
+# Trivial differences removed by normalize_text
+HTML_ENTITIES = {
+    "&nbsp;": " ",
+    "&amp;": "&",
+    "&lt;": "<",
+    "&gt;": ">",
+    "&quot;": '"',
+    "&#39;": "'",
+    "&apos;": "'",
+    "\u201c": '"',
+    "\u201d": '"',
+    "\u2018": "'",
+    "\u2019": "'",
+}
+
+# Set FRAME_CACHE_DIR in .env to share loaded docket frames between app workers
+FRAME_CACHE_DIR = settings.get("FRAME_CACHE_DIR") or None
+# Bump when the columns derived by fetch_comments_df change
+FRAME_CACHE_VERSION = 1
+
+# Small row groups keep point lookups in the sorted hash index to a single read
+HASH_INDEX_ROW_GROUP_SIZE = 10_000
+
+# Columns shown by the app's comment explorer (see comments_page)
+EXPLORER_COLUMNS = [
+    "comment_id",
+    "modify_date",
+    "receive_date",
+    "title",
+    "content_hash",
+    "comment",
+]
+EXPLORER_SORTS = ["modify_date", "receive_date", "comment_id", "content_hash"]
+EXPLORER_PAGE_SIZE = 50
 
 console = Console()
 
 
-def get_unique_docket_ids(agency_codes: list[str] = [], years: list[int] = []) -> list:
+def normalize_text(expr: pl.Expr) -> pl.Expr:
+    """
+    Normalize comment text with Polars string expressions (no Python UDFs).
+
+    Line-break and paragraph tags become spaces, other HTML tags are removed,
+    common HTML entities and typographic quotes are decoded, text is lowercased
+    and runs of whitespace are collapsed.
+    """
+    return (
+        expr.str.replace_all(r"(?i)<br\s*/?>|</?p\s*/?>", " ")
+        .str.replace_all(r"<[a-zA-Z/][^<>]{0,200}>", "")
+        .str.replace_many(list(HTML_ENTITIES), list(HTML_ENTITIES.values()))
+        .str.to_lowercase()
+        .str.replace_all(r"\s+", " ")
+        .str.strip_chars()
+    )
+
+
+def normalize_comment(text: str) -> str:
+    """normalize_text for a single string (e.g. a reference text)."""
+    return pl.select(normalize_text(pl.lit(text, dtype=pl.String))).item()
+
+
+def with_normalized_columns(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Add normalized_comment, normalized_hash and is_duplicate to a docket frame.
+
+    Copies differing only in case, whitespace or HTML markup share a
+    normalized_hash. The hash is Polars' 64-bit hash, stable for a given Polars
+    version; content_hash stays the persistent identifier.
+    """
+    with span("normalize", rows=len(df)):
+        df = df.with_columns(
+            normalize_text(pl.col("comment")).alias("normalized_comment")
+        ).with_columns(
+            pl.when(pl.col("normalized_comment").is_not_null())
+            .then(pl.col("normalized_comment").hash())
+            .alias("normalized_hash")
+        )
+
+    # Find duplicate comments (up to normalization)
+    with span("duplicates", rows=len(df)):
+        return df.with_columns(
+            (
+                pl.col("normalized_hash").is_duplicated()
+                & pl.col("normalized_hash").is_not_null()
+            ).alias("is_duplicate")
+        )
+
+
+def get_docket_partitions(
+    agency_codes: list[str] = [], years: list[int] = []
+) -> pl.DataFrame:
+    """List the (agency_code, year, docket_id) hive partitions, optionally filtered."""
     lf = pl.scan_parquet(MIRRULATIONS_PARQUET, hive_partitioning=True)
 
     if agency_codes:
@@ -20,27 +115,73 @@ def get_unique_docket_ids(agency_codes: list[str] = [], years: list[int] = []) -
     if years:
         lf = lf.filter(pl.col("year").is_in(years))
 
-    df = lf.select(["docket_id", "agency_code", "year"]).collect()
+    return (
+        lf.select(["agency_code", "year", "docket_id"])
+        .unique()
+        .sort(by=["agency_code", "year", "docket_id"])
+        .collect()
+    )
+
+
+def read_matching(source: str | Path, column: str, values: list) -> pl.DataFrame:
+    """
+    Rows of a parquet file whose column equals one of the given values.
+
+    Polars skips row groups using their min/max statistics for equality filters,
+    but not for is_in with values spread over the file, so each value gets its own
+    equality-filtered scan. On a file sorted by column, each scan reads only the
+    row groups whose range contains its value.
+    """
+    lf = pl.scan_parquet(source)
+    values = list(dict.fromkeys(values))
+    if not values:
+        return lf.head(0).collect()
+    return pl.concat(pl.collect_all([lf.filter(pl.col(column) == v) for v in values]))
+
+
+def lookup_content_hashes(
+    content_hashes: list[str], index_path: str | None = CONTENT_HASH_INDEX
+) -> pl.DataFrame:
+    """
+    Dockets in which each content_hash appears, from the content_hash index.
+
+    The index is sorted by content_hash with min/max statistics per row group, and
+    each hash is looked up with its own equality scan (read_matching), so a lookup
+    only reads the row groups that can contain the hashes.
 
-    docket_ids = (df.select(pl.col("docket_id").unique()).sort(by="docket_id"))[
-        "docket_id"
-    ].to_list()
+    Args:
+        content_hashes: Hashes to look up
+        index_path: Index parquet file (default: CONTENT_HASH_INDEX from .env)
 
-    if not agency_codes:
-        agency_codes_out = (
-            df.select(pl.col("agency_code").unique()).sort(by="agency_code")
-        )["agency_code"].to_list()
-    else:
-        agency_codes_out = agency_codes
+    Returns:
+        DataFrame with content_hash, agency_code, year, docket_id, count,
+        first_date and last_date
+    """
+    with span("hash_lookup", rows=len(content_hashes)) as s:
+        hits = read_matching(index_path, "content_hash", content_hashes)
+        s["hits"] = len(hits)
 
-    if not years:
-        years_out = (df.select(pl.col("year").unique()).sort(by="year"))[
-            "year"
-        ].to_list()
-    else:
-        years_out = years
+    return hits
 
-    return docket_ids, agency_codes_out, years_out
+
+def other_docket_counts(
+    content_hash: str, docket_id: str, index_path: str | None = CONTENT_HASH_INDEX
+) -> dict:
+    """
+    How often a comment appears outside the given docket.
+
+    Returns:
+        dict: other_dockets, other_copies, first_date and last_date across all dockets
+    """
+    hits = lookup_content_hashes([content_hash], index_path=index_path)
+    others = hits.filter(pl.col("docket_id") != docket_id)
+
+    return {
+        "other_dockets": others["docket_id"].n_unique(),
+        "other_copies": int(others["count"].sum()),
+        "first_date": hits["first_date"].min(),
+        "last_date": hits["last_date"].max(),
+    }
 
 
 def load_data_json_attributes(json_fname: str) -> dict:
@@ -62,8 +203,206 @@ def load_mirrulations_parquet(docket_id: str) -> pl.DataFrame:
     return lf.collect()
 
 
-def fetch_comments_df(docket_id: str, is_parquet=True):
-    """Load comments json and populate a polars data frame"""
+def _comment_conditions(
+    hash_expr: str,
+    content_hashes: list[str] | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    search: str | None = None,
+) -> tuple[list[str], list]:
+    """SQL conditions and their parameters for the comment filters."""
+    conditions = []
+    params = []
+    if content_hashes is not None:
+        # Bloom filters are only consulted for equality with a single value
+        if len(content_hashes) == 1:
+            conditions.append(f"{hash_expr} = ?")
+            params.append(content_hashes[0])
+        else:
+            conditions.append(f"{hash_expr} IN (SELECT unnest(?))")
+            params.append(list(content_hashes))
+    if start is not None:
+        conditions.append("modify_date >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("modify_date < ?")
+        params.append(end)
+    if search:
+        conditions.append("contains(lower(comment), lower(?))")
+        params.append(search)
+    return conditions, params
+
+
+def _fetch_frame(result) -> pl.DataFrame:
+    """Polars frame of a DuckDB result (without pyarrow)."""
+    columns = [c[0] for c in result.description]
+    return pl.DataFrame(
+        result.fetchall(), schema=columns, orient="row", infer_schema_length=None
+    )
+
+
+def comments_page(
+    docket_id: str,
+    content_hashes: list[str] | None = None,
+    search: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    sort: str = "modify_date",
+    descending: bool = False,
+    offset: int = 0,
+    limit: int = EXPLORER_PAGE_SIZE,
+) -> tuple[pl.DataFrame, int]:
+    """
+    One page of a docket's comments, filtered and sorted on disk.
+
+    Only the docket's partition files are read, with DuckDB, which skips row
+    groups using the min/max statistics and bloom filters written by
+    data2parquet.py: with the default hash-sorted layout a family's hashes are
+    found in a few row groups, and date ranges are pruned when partitions are
+    sorted by date. Hives ingested before content_hash was stored are matched on
+    sha256(comment), without pruning. The page is found in two passes so memory
+    stays flat for deep pages of large families: the first sorts only (sort key,
+    comment_id) to pick the page's ids, the second reads the full rows of those
+    ids.
+
+    Args:
+        docket_id: Docket to browse
+        content_hashes: Keep comments with one of these hashes (a duplicate group
+            or a near-duplicate family)
+        search: Keep comments containing this text (case-insensitive)
+        start: Keep comments modified at or after this time
+        end: Keep comments modified before this time
+        sort: Column to sort by, one of EXPLORER_SORTS
+        descending: Sort in descending order
+        offset: Rows to skip
+        limit: Rows per page
+
+    Returns:
+        tuple: DataFrame of the page (EXPLORER_COLUMNS) and the number of
+        matching comments
+    """
+    if sort not in EXPLORER_SORTS:
+        raise ValueError(f"sort must be one of {EXPLORER_SORTS}, got {sort!r}")
+
+    files = docket_files(docket_id)
+    if not files:
+        return pl.DataFrame(), 0
+
+    conn = duckdb.connect()
+    relation = conn.read_parquet(files, hive_partitioning=True)
+    hash_expr = (
+        "content_hash" if "content_hash" in relation.columns else "sha256(comment)"
+    )
+    conditions, params = _comment_conditions(
+        hash_expr, content_hashes, start=start, end=end, search=search
+    )
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    source = "read_parquet(?, hive_partitioning = true)"
+    sort_expr = hash_expr if sort == "content_hash" else sort
+    order = "DESC" if descending else "ASC"
+    # comment_id breaks ties so pages do not overlap
+    order_by = f"{sort_expr} {order} NULLS LAST, comment_id"
+
+    with span("comments_page", docket_id=docket_id, offset=offset) as s:
+        (total,) = conn.execute(
+            f"SELECT count(*) FROM {source} {where}", [files, *params]
+        ).fetchone()
+        ids = [
+            row[0]
+            for row in conn.execute(
+                f"SELECT comment_id FROM {source} {where} "
+                f"ORDER BY {order_by} LIMIT ? OFFSET ?",
+                [files, *params, limit, offset],
+            ).fetchall()
+        ]
+        columns = [
+            "comment_id",
+            *(
+                c
+                for c in EXPLORER_COLUMNS
+                if c in relation.columns and c != "comment_id"
+            ),
+        ]
+        select = ", ".join(columns)
+        if hash_expr != "content_hash":
+            select += f", {hash_expr} AS content_hash"
+        page = _fetch_frame(
+            conn.execute(
+                f"SELECT {select} FROM {source} "
+                f"WHERE {' AND '.join([*conditions, 'comment_id IN (SELECT unnest(?::VARCHAR[]))'])} "
+                f"ORDER BY {order_by}",
+                [files, *params, ids],
+            )
+        )
+        s["rows"] = len(page)
+
+    return page, total
+
+
+def docket_files(docket_id: str) -> list[str]:
+    """Parquet files of a docket's hive partition."""
+    root = str(MIRRULATIONS_PARQUET).split("*", 1)[0]
+    return sorted(
+        glob(str(Path(root, "*", "*", f"docket_id={docket_id}", "*.parquet")))
+    )
+
+
+def ingest_version(docket_id: str) -> str:
+    """
+    Fingerprint of a docket's ingested data.
+
+    Changes whenever a partition file is rewritten (path, size and mtime), when
+    FRAME_CACHE_VERSION is bumped or when Polars is upgraded (normalized_hash is
+    only stable within a Polars version).
+    """
+    h = hashlib.sha256(f"{FRAME_CACHE_VERSION}:{pl.__version__}".encode())
+    for path in docket_files(docket_id):
+        stat = os.stat(path)
+        h.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return h.hexdigest()[:16]
+
+
+def frame_cache_path(docket_id: str, cache_dir: str, version: str) -> Path:
+    """Arrow IPC file holding a docket's loaded frame for an ingest version."""
+    return Path(cache_dir, docket_id, f"{version}.arrow")
+
+
+def write_frame_cache(df: pl.DataFrame, path: Path) -> None:
+    """
+    Write a frame as an uncompressed Arrow IPC file and drop older versions.
+
+    The file is written under a temporary name and renamed, so a worker never maps a
+    partially written file. Workers still mapping a removed version keep reading it.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".arrow.tmp")
+    os.close(fd)
+    df.write_ipc(tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+    for old in path.parent.glob("*.arrow"):
+        if old != path:
+            old.unlink(missing_ok=True)
+
+
+def fetch_comments_df(docket_id: str, is_parquet=True, use_cache: bool = True):
+    """
+    Load comments json and populate a polars data frame
+
+    With FRAME_CACHE_DIR set, the loaded frame (with its derived columns) is kept as
+    an Arrow IPC file per ingest version. Later loads, from any worker process,
+    memory-map it: the columns are read zero-copy from the shared page cache.
+    """
+    cache_path = None
+    if is_parquet and use_cache and FRAME_CACHE_DIR:
+        cache_path = frame_cache_path(
+            docket_id, FRAME_CACHE_DIR, ingest_version(docket_id)
+        )
+        if cache_path.exists():
+            with span("load_frame_cache", docket_id=docket_id) as s:
+                df = pl.read_ipc(cache_path, memory_map=True, rechunk=False)
+                s["rows"] = len(df)
+            return df
 
     # loads json
     if not is_parquet:
@@ -114,7 +453,9 @@ def fetch_comments_df(docket_id: str, is_parquet=True):
             df = pl.DataFrame(normalized_data)
 
     # parquet files
-    df = load_mirrulations_parquet(docket_id=docket_id)
+    with span("load", docket_id=docket_id) as s:
+        df = load_mirrulations_parquet(docket_id=docket_id)
+        s["rows"] = len(df)
 
     # Drop columns that are entirely null
     # cols_to_keep = [col for col in df.columns if not df[col].is_null().all()]
@@ -128,20 +469,25 @@ def fetch_comments_df(docket_id: str, is_parquet=True):
     for col in existing_time_cols:
         df = df.with_columns(pl.col(col).str.to_datetime(format=None, strict=False))
 
-    # Check if comment column exists before processing duplicates
-    # Find duplicate comments
-    df = df.with_columns(pl.col("comment").is_duplicated().alias("is_duplicate"))
-
-    # Create SHA256 hash of comments for unique identifier
-    df = df.with_columns(
-        pl.col("comment")
-        .map_elements(
-            lambda x: hashlib.sha256(str(x).encode()).hexdigest()
-            if x is not None
-            else None,
-            return_dtype=pl.String,
-        )
-        .alias("content_hash")
-    )
+    df = with_normalized_columns(df)
+
+    # Create SHA256 hash of comments for unique identifier (stored at ingest by
+    # data2parquet.py; computed here for older hives)
+    if "content_hash" not in df.columns:
+        with span("hash", rows=len(df)):
+            df = df.with_columns(
+                pl.col("comment")
+                .map_elements(
+                    lambda x: hashlib.sha256(str(x).encode()).hexdigest()
+                    if x is not None
+                    else None,
+                    return_dtype=pl.String,
+                )
+                .alias("content_hash")
+            )
+
+    if cache_path is not None:
+        with span("write_frame_cache", rows=len(df), docket_id=docket_id):
+            write_frame_cache(df, cache_path)
 
     return df
@@ -1,14 +1,146 @@
 """
 Mostly copied from: https://github.com/jayqi/mirrulations-hive-partitioned-parquet
+
+Partition layout: rows within each docket partition are sorted (by content_hash
+and modify_date by default) and written in row groups of PARTITION_ROW_GROUP_SIZE
+rows with min/max statistics. Dictionaries are sized to hold a whole row group,
+which makes DuckDB write a bloom filter for every column, including the
+high-cardinality comment_id and content_hash. Reads filtered by hash or date
+range (data.comments_page) can then skip most row groups of a partition.
+
+After the partitions, a sketch of each docket is written to <out_dir>/sketches
+(see sketches.py) so the app can show approximate statistics immediately.
 """
 
+import shutil
+from pathlib import Path
+
 import duckdb
 
+from data import HASH_INDEX_ROW_GROUP_SIZE
+from sketches import write_docket_sketches
+
+# Row order within a partition; "hash" clusters copies of a text into few row
+# groups, "date" makes modify_date ranges prunable instead
+PARTITION_SORTS = {
+    "hash": "content_hash, modify_date",
+    "date": "modify_date, content_hash",
+    "none": None,
+}
+PARTITION_ROW_GROUP_SIZE = 50_000
+BLOOM_FILTER_FALSE_POSITIVE_RATIO = 0.01
+
+
+def write_comment_partitions(
+    conn,
+    source: str,
+    out_dir: str,
+    sort: str = "hash",
+    row_group_size: int = PARTITION_ROW_GROUP_SIZE,
+    bloom_filters: bool = True,
+) -> None:
+    """
+    Write comment rows as hive partitions in <out_dir>/comments.
+
+    Args:
+        conn: DuckDB connection
+        source: Table, view or table function holding the comment rows
+        out_dir: Output directory
+        sort: Row order within partitions, one of PARTITION_SORTS
+        row_group_size: Rows per row group
+        bloom_filters: Size dictionaries so every column gets a bloom filter
+            (DuckDB only writes them for dictionary-encoded columns)
+    """
+    if sort not in PARTITION_SORTS:
+        raise ValueError(
+            f"Unknown sort {sort!r}, expected one of {list(PARTITION_SORTS)}"
+        )
+
+    order_by = f"ORDER BY {PARTITION_SORTS[sort]}" if PARTITION_SORTS[sort] else ""
+    options = [
+        "FORMAT PARQUET",
+        "PARTITION_BY (agency_code, year, docket_id)",
+        "COMPRESSION SNAPPY",
+        f"ROW_GROUP_SIZE {row_group_size}",
+    ]
+    if bloom_filters:
+        # A dictionary limit at the row group size falls back to plain encoding
+        # when every value is distinct, hence the margin
+        options += [
+            f"DICTIONARY_SIZE_LIMIT {2 * row_group_size}",
+            f"BLOOM_FILTER_FALSE_POSITIVE_RATIO {BLOOM_FILTER_FALSE_POSITIVE_RATIO}",
+        ]
+
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    conn.query(f"""\
+    COPY (
+    SELECT *
+    FROM {source}
+    {order_by}
+    ) TO '{out_dir}/comments'
+    ({", ".join(options)});
+    """)
+
+
+def relayout_hive(
+    out_dir: str,
+    sort: str = "hash",
+    row_group_size: int = PARTITION_ROW_GROUP_SIZE,
+    bloom_filters: bool = True,
+    similarity_sample: int = 0,
+) -> None:
+    """
+    Rewrite the existing hive in <out_dir>/comments with the partition layout.
 
-def docket2parquet(data_dir: str, out_dir):
+    Hives ingested before content_hash was stored get the column added. The new
+    hive is written next to the old one and swapped in once complete, then the
+    docket sketches are rewritten.
+    """
+    comments = Path(out_dir, "comments")
+    staging = Path(out_dir, ".relayout")
+    shutil.rmtree(staging, ignore_errors=True)
+
+    conn = duckdb.connect()
+    conn.query(f"""\
+    CREATE OR REPLACE VIEW existing_comments AS
+    SELECT *
+    FROM read_parquet('{comments}/**/*.parquet', hive_partitioning = true);
+    """)
+    columns = [row[0] for row in conn.query("DESCRIBE existing_comments").fetchall()]
+    source = "existing_comments"
+    if "content_hash" not in columns:
+        source = "(SELECT *, sha256(comment) as content_hash FROM existing_comments)"
+
+    write_comment_partitions(
+        conn, source, str(staging), sort, row_group_size, bloom_filters
+    )
+
+    old = Path(out_dir, ".comments-old")
+    comments.rename(old)
+    (staging / "comments").rename(comments)
+    shutil.rmtree(old)
+    shutil.rmtree(staging)
+
+    write_docket_sketches(out_dir, similarity_sample=similarity_sample)
+
+
+def docket2parquet(
+    data_dir: str,
+    out_dir,
+    sort: str = "hash",
+    row_group_size: int = PARTITION_ROW_GROUP_SIZE,
+    bloom_filters: bool = True,
+    similarity_sample: int = 0,
+):
     """
     Parses .json mirrulations data in <data_dir> and stores output as hive partitions parquet
     in <out_dir>.
+
+    content_hash (sha256 hex digest of the comment, as computed by
+    data.fetch_comments_df for older hives) is computed at ingest. See
+    write_comment_partitions for the layout options and sketches.py for the
+    docket sketches (similarity_sample: sampled comments per docket scored for
+    the similarity histogram, 0 for none).
     """
     conn = duckdb.connect()
 
@@ -45,6 +177,7 @@ def docket2parquet(data_dir: str, out_dir):
 
     json_extract_string(f.content, '$.data.attributes.category') as category,
     json_extract_string(f.content, '$.data.attributes.comment') as comment,
+    sha256(json_extract_string(f.content, '$.data.attributes.comment')) as content_hash,
     json_extract_string(f.content, '$.data.attributes.documentType') as document_type,
     json_extract_string(f.content, '$.data.attributes.modifyDate')::TIMESTAMP as modify_date,
     json_extract_string(f.content, '$.data.attributes.postedDate')::TIMESTAMP as posted_date,
@@ -55,17 +188,54 @@ def docket2parquet(data_dir: str, out_dir):
 
     f.content AS raw_json
     FROM src_comment_files f;
+    """
 
+    conn.query(query)
+    write_comment_partitions(
+        conn, "comments_parsed", out_dir, sort, row_group_size, bloom_filters
+    )
+
+    write_content_hash_index(out_dir, conn=conn)
+    write_docket_sketches(out_dir, similarity_sample=similarity_sample)
+
+
+def write_content_hash_index(out_dir: str, conn=None) -> str:
+    """
+    Write the content_hash -> docket index for the hive in <out_dir>/comments.
+
+    One row per (content_hash, docket) with the number of copies and the first/last
+    receive date, sorted by content_hash in small row groups so lookups of a hash
+    only read the row group whose min/max statistics contain it. content_hash is
+    the sha256 hex digest of the comment, as computed by data.fetch_comments_df.
+
+    Returns:
+        str: Path of the index file
+    """
+    conn = conn or duckdb.connect()
+    index_path = f"{out_dir}/content_hash_index.parquet"
+
+    conn.query(f"""\
     COPY (
-    SELECT *
-    FROM comments_parsed
-    ) TO '{out_dir}/comments'
+    SELECT
+    sha256(comment) as content_hash,
+    agency_code,
+    year,
+    docket_id,
+    count(*)::UINTEGER as count,
+    min(receive_date) as first_date,
+    max(receive_date) as last_date,
+
+    FROM read_parquet('{out_dir}/comments/**/*.parquet', hive_partitioning = true)
+    WHERE comment IS NOT NULL
+    GROUP BY ALL
+    ORDER BY content_hash, docket_id
+    ) TO '{index_path}'
     (FORMAT PARQUET,
-    PARTITION_BY (agency_code, year, docket_id),
+    ROW_GROUP_SIZE {HASH_INDEX_ROW_GROUP_SIZE},
     COMPRESSION SNAPPY);
-    """
+    """)
 
-    conn.query(query)
+    return index_path
 
 
 if __name__ == "__main__":
@@ -73,9 +243,71 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
 
-    parser.add_argument("data_dir", type=str)
+    parser.add_argument(
+        "data_dir",
+        type=str,
+        nargs="?",
+        help="mirrulations data to ingest (not needed with --index-only, "
+        "--sketches-only or --relayout)",
+    )
     parser.add_argument("out_dir", type=str)
+    parser.add_argument(
+        "--index-only",
+        action="store_true",
+        help="Only rebuild the content_hash index of an existing hive in out_dir",
+    )
+    parser.add_argument(
+        "--sketches-only",
+        action="store_true",
+        help="Only rewrite the docket sketches of an existing hive in out_dir",
+    )
+    parser.add_argument(
+        "--relayout",
+        action="store_true",
+        help="Rewrite the existing hive in out_dir with the layout options below",
+    )
+    parser.add_argument(
+        "--sort",
+        type=str,
+        default="hash",
+        choices=list(PARTITION_SORTS),
+        help="Row order within partitions (hash: content_hash, modify_date)",
+    )
+    parser.add_argument("--row-group-size", type=int, default=PARTITION_ROW_GROUP_SIZE)
+    parser.add_argument(
+        "--no-bloom-filters",
+        action="store_true",
+        help="Keep DuckDB's default dictionary limit (no bloom filters on ids/hashes)",
+    )
+    parser.add_argument(
+        "--similarity-sample",
+        type=int,
+        default=0,
+        help="Sampled comments per docket scored against its top templates for the "
+        "sketch's similarity histogram (0: no histogram)",
+    )
 
     args = parser.parse_args()
 
-    docket2parquet(data_dir=args.data_dir, out_dir=args.out_dir)
+    layout = {
+        "sort": args.sort,
+        "row_group_size": args.row_group_size,
+        "bloom_filters": not args.no_bloom_filters,
+    }
+    if args.index_only:
+        write_content_hash_index(out_dir=args.out_dir)
+    elif args.sketches_only:
+        write_docket_sketches(args.out_dir, similarity_sample=args.similarity_sample)
+    elif args.relayout:
+        relayout_hive(
+            out_dir=args.out_dir, similarity_sample=args.similarity_sample, **layout
+        )
+    else:
+        if args.data_dir is None:
+            parser.error("data_dir is required to ingest")
+        docket2parquet(
+            data_dir=args.data_dir,
+            out_dir=args.out_dir,
+            similarity_sample=args.similarity_sample,
+            **layout,
+        )
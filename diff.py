@@ -0,0 +1,250 @@
+"""
+Diff engine shared by the app, viz.py and the batch diff report.
+
+Texts are split into alternating word and whitespace tokens, tokens are interned
+to integers and aligned with a patience-style pass: tokens occurring exactly once
+in both texts act as anchors (longest increasing subsequence of their positions)
+and only the gaps between anchors are aligned with rapidfuzz's bit-parallel,
+linear-space Levenshtein opcodes. Adjacent tokens with the same diff class are
+merged into a single ``<span>`` carrying a CSS class (see ``DIFF_CSS``).
+Character-level diffs (used by viz.py) run the same alignment over characters.
+"""
+
+import hashlib
+import html
+import re
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+from rapidfuzz.distance import Levenshtein
+
+TOKEN_PATTERN = re.compile(r"\s+|\S+")
+
+# CSS classes for the three diff states, matching the app's color legend
+MATCH_CLASS = "diff-eq"
+DELETE_CLASS = "diff-del"
+INSERT_CLASS = "diff-ins"
+
+DIFF_CSS = f"""
+.{MATCH_CLASS}, .{DELETE_CLASS}, .{INSERT_CLASS} {{
+    padding: 1px 0px;
+    border-radius: 2px;
+}}
+.{MATCH_CLASS} {{ background-color: #d4edda; }}
+.{DELETE_CLASS} {{ background-color: #f8d7da; }}
+.{INSERT_CLASS} {{ background-color: #d1ecf1; }}
+"""
+
+DIFF_CACHE_SIZE = 256
+
+_diff_cache: OrderedDict = OrderedDict()
+# Diffs are requested from app worker threads and the API's thread pool
+_diff_lock = threading.Lock()
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into word and whitespace tokens, preserving every character."""
+    return TOKEN_PATTERN.findall(text)
+
+
+def _intern(tokens1: list[str], tokens2: list[str]) -> tuple[list[int], list[int]]:
+    """Map tokens to integer ids shared across both sequences."""
+    vocab: dict[str, int] = {}
+    ids1 = [vocab.setdefault(t, len(vocab)) for t in tokens1]
+    ids2 = [vocab.setdefault(t, len(vocab)) for t in tokens2]
+    return ids1, ids2
+
+
+def _unique_anchors(a: list[int], b: list[int]) -> list[tuple[int, int]]:
+    """
+    Find patience anchors: tokens that occur exactly once in both sequences,
+    reduced to the longest chain that is increasing in both positions.
+    """
+    positions_a: dict[int, int] = {}
+    for i, token in enumerate(a):
+        positions_a[token] = -1 if token in positions_a else i
+    positions_b: dict[int, int] = {}
+    for j, token in enumerate(b):
+        positions_b[token] = -1 if token in positions_b else j
+
+    pairs = [
+        (i, positions_b[token])
+        for token, i in positions_a.items()
+        if i >= 0 and positions_b.get(token, -1) >= 0
+    ]
+    if not pairs:
+        return []
+    pairs.sort()
+
+    # Longest increasing subsequence over the b positions (patience sorting)
+    tails: list[int] = []
+    tail_idx: list[int] = []
+    prev: list[int] = [-1] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_idx.append(k)
+        else:
+            tails[pos] = j
+            tail_idx[pos] = k
+        prev[k] = tail_idx[pos - 1] if pos > 0 else -1
+
+    anchors = []
+    k = tail_idx[-1]
+    while k >= 0:
+        anchors.append(pairs[k])
+        k = prev[k]
+    anchors.reverse()
+    return anchors
+
+
+def _append(opcodes: list, tag: str, i1: int, i2: int, j1: int, j2: int) -> None:
+    """Append an opcode, merging it with the previous one if they are contiguous."""
+    if opcodes and opcodes[-1][0] == tag:
+        last = opcodes[-1]
+        opcodes[-1] = (tag, last[1], i2, last[3], j2)
+    else:
+        opcodes.append((tag, i1, i2, j1, j2))
+
+
+def _gap_opcodes(
+    opcodes: list, a: list[int], b: list[int], i1: int, i2: int, j1: int, j2: int
+) -> None:
+    """Align the region a[i1:i2] vs b[j1:j2] and append its opcodes."""
+    if i1 == i2 and j1 == j2:
+        return
+    if i1 == i2:
+        _append(opcodes, "insert", i1, i2, j1, j2)
+        return
+    if j1 == j2:
+        _append(opcodes, "delete", i1, i2, j1, j2)
+        return
+    for tag, si1, si2, sj1, sj2 in Levenshtein.opcodes(a[i1:i2], b[j1:j2]).as_list():
+        _append(opcodes, tag, i1 + si1, i1 + si2, j1 + sj1, j1 + sj2)
+
+
+def diff_opcodes(a: list, b: list) -> list[tuple[str, int, int, int, int]]:
+    """
+    Compute difflib-style opcodes between two sequences of hashable items.
+
+    Args:
+        a: First sequence (e.g. token ids of the reference text)
+        b: Second sequence (e.g. token ids of the compared text)
+
+    Returns:
+        list: (tag, i1, i2, j1, j2) tuples with tag in equal/replace/delete/insert,
+              adjacent opcodes with the same tag merged
+    """
+    opcodes: list = []
+    i = j = 0
+    for ai, bj in _unique_anchors(a, b):
+        _gap_opcodes(opcodes, a, b, i, ai, j, bj)
+        _append(opcodes, "equal", ai, ai + 1, bj, bj + 1)
+        i, j = ai + 1, bj + 1
+    _gap_opcodes(opcodes, a, b, i, len(a), j, len(b))
+    return opcodes
+
+
+def word_opcodes(
+    tokens1: list[str], tokens2: list[str]
+) -> list[tuple[str, int, int, int, int]]:
+    """Compute opcodes between two token lists."""
+    return diff_opcodes(*_intern(tokens1, tokens2))
+
+
+def diff_segments(
+    text1: str, text2: str, level: str = "word"
+) -> list[tuple[str, str, str]]:
+    """
+    Diff two texts into a renderer-agnostic list of segments.
+
+    Args:
+        text1: Reference text
+        text2: Compared text
+        level: "word" (word and whitespace tokens) or "char" (single characters)
+
+    Returns:
+        list: (tag, reference_segment, compared_segment) tuples with tag in
+              equal/replace/delete/insert; segments are empty where a side has no text
+    """
+    if level == "word":
+        tokens1, tokens2 = tokenize(text1), tokenize(text2)
+        opcodes = word_opcodes(tokens1, tokens2)
+    elif level == "char":
+        tokens1, tokens2 = text1, text2
+        opcodes = diff_opcodes(text1, text2)
+    else:
+        raise ValueError(f"Unknown diff level: {level!r}")
+
+    return [
+        (tag, "".join(tokens1[i1:i2]), "".join(tokens2[j1:j2]))
+        for tag, i1, i2, j1, j2 in opcodes
+    ]
+
+
+def _span(text: str, css_class: str, mark_newlines: bool) -> str:
+    """Render a run of text as a single escaped span."""
+    text = html.escape(text, quote=False)
+    if mark_newlines:
+        # Make changed line breaks visible
+        text = text.replace("\n", "↵\n")
+    return f'<span class="{css_class}">{text}</span>'
+
+
+def segments_to_html(segments: list[tuple[str, str, str]]) -> tuple[str, str]:
+    """Build the reference and compared HTML from diff segments."""
+    parts1: list[str] = []
+    parts2: list[str] = []
+    for tag, segment1, segment2 in segments:
+        if tag == "equal":
+            parts1.append(_span(segment1, MATCH_CLASS, False))
+            parts2.append(_span(segment2, MATCH_CLASS, False))
+            continue
+        if segment1:
+            parts1.append(_span(segment1, DELETE_CLASS, True))
+        if segment2:
+            parts2.append(_span(segment2, INSERT_CLASS, True))
+    return "".join(parts1), "".join(parts2)
+
+
+def text_hash(text: str) -> str:
+    """SHA256 hex digest of a text, matching ``content_hash`` in data.py."""
+    return hashlib.sha256(str(text).encode()).hexdigest()
+
+
+def word_diff_html(
+    text1: str,
+    text2: str,
+    ref_hash: str | None = None,
+    compared_hash: str | None = None,
+) -> tuple[str, str]:
+    """
+    Render a word-level diff of two texts as a pair of HTML fragments.
+
+    Results are cached per (ref_hash, compared_hash); hashes are computed from the
+    texts when not provided.
+
+    Args:
+        text1: Reference text
+        text2: Compared text
+        ref_hash: Content hash of the reference text (optional)
+        compared_hash: Content hash of the compared text (optional)
+
+    Returns:
+        tuple: (reference_html, compared_html)
+    """
+    key = (ref_hash or text_hash(text1), compared_hash or text_hash(text2))
+    with _diff_lock:
+        if key in _diff_cache:
+            _diff_cache.move_to_end(key)
+            return _diff_cache[key]
+
+    result = segments_to_html(diff_segments(text1, text2))
+
+    with _diff_lock:
+        _diff_cache[key] = result
+        if len(_diff_cache) > DIFF_CACHE_SIZE:
+            _diff_cache.popitem(last=False)
+    return result
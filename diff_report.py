@@ -0,0 +1,228 @@
+"""
+Batch diff report: diff a reference comment against its top-k most similar comments
+in a docket and write all pairs to a single HTML or terminal report.
+
+Usage:
+    python diff_report.py DOCKET_ID CONTENT_HASH --top-k 20 --format html -o report.html
+"""
+
+import html
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import polars as pl
+from rich.console import Console
+from rich.rule import Rule
+
+from botmirror import calculate_similarities
+from data import fetch_comments_df
+from diff import DIFF_CSS, diff_segments, segments_to_html
+from viz import rich_diff_display
+
+console = Console()
+
+
+def compute_report_diffs(
+    reference_text: str,
+    comments: list[str],
+    level: str = "word",
+    workers: int | None = None,
+) -> list[list[tuple[str, str, str]]]:
+    """
+    Diff the reference against every comment, in parallel across processes.
+
+    Args:
+        reference_text: Reference comment text
+        comments: Comments to diff against the reference
+        level: Diff granularity, "word" or "char"
+        workers: Number of worker processes (default: all cores)
+
+    Returns:
+        list: Diff segments per comment, in input order
+    """
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(comments) <= 1:
+        return [diff_segments(reference_text, c, level=level) for c in comments]
+
+    # spawn rather than fork: polars' thread pool does not survive forking
+    chunksize = max(1, len(comments) // (workers * 4))
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        return list(
+            executor.map(
+                diff_segments,
+                [reference_text] * len(comments),
+                comments,
+                [level] * len(comments),
+                chunksize=chunksize,
+            )
+        )
+
+
+def top_similar(
+    df: pl.DataFrame, content_hash: str, top_k: int, metric: str = "similarity_w"
+) -> tuple[str, pl.DataFrame]:
+    """Look up the reference text for content_hash and score the docket against it."""
+    matches = df.filter(pl.col("content_hash") == content_hash)
+    if matches.is_empty():
+        raise ValueError(f"content_hash {content_hash} not found in docket")
+    reference_text = matches["comment"][0]
+
+    similarity_df = calculate_similarities(
+        df=df, reference_text=reference_text, exclude_hash=content_hash
+    )
+    top_df = similarity_df.unique(subset="content_hash", keep="first").sort(
+        by=metric, descending=True
+    )
+
+    return reference_text, top_df.head(top_k)
+
+
+def render_html_report(
+    docket_id: str,
+    content_hash: str,
+    top_df: pl.DataFrame,
+    diffs: list[list[tuple[str, str, str]]],
+    metric: str,
+) -> str:
+    """Render all diffs into a standalone HTML page."""
+    sections = []
+    for rank, (row, segments) in enumerate(
+        zip(top_df.iter_rows(named=True), diffs), start=1
+    ):
+        ref_html, comp_html = segments_to_html(segments)
+        sections.append(
+            f"""
+<section>
+  <h3>#{rank} &mdash; {metric}: {row[metric]:.1f}
+    <small>({html.escape(str(row["content_hash"]))})</small></h3>
+  <div class="pair">
+    <div class="text">{ref_html}</div>
+    <div class="text">{comp_html}</div>
+  </div>
+</section>"""
+        )
+
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Diff report {html.escape(docket_id)}</title>
+<style>
+body {{ font-family: sans-serif; margin: 20px; }}
+.pair {{ display: grid; grid-template-columns: 1fr 1fr; gap: 10px; }}
+.text {{ white-space: pre-wrap; font-family: monospace; padding: 10px;
+         background-color: #f8f9fa; border-radius: 5px; line-height: 1.6; }}
+{DIFF_CSS}
+</style>
+</head>
+<body>
+<h1>Docket {html.escape(docket_id)}</h1>
+<p>Reference content_hash: {html.escape(content_hash)}; top {len(diffs)} comments by {metric}.</p>
+{"".join(sections)}
+</body>
+</html>
+"""
+
+
+def write_terminal_report(
+    reference_text: str,
+    top_df: pl.DataFrame,
+    diffs: list[list[tuple[str, str, str]]],
+    metric: str,
+    output: str | None = None,
+) -> None:
+    """Print all diffs to the terminal, optionally saving the text to a file."""
+    report_console = Console(record=output is not None)
+
+    for rank, (row, segments) in enumerate(
+        zip(top_df.iter_rows(named=True), diffs), start=1
+    ):
+        report_console.print(Rule(f"#{rank} {row['content_hash']}"))
+        rich_diff_display(
+            reference=reference_text,
+            comment=row["comment"],
+            similarity_score=round(row[metric], 1),
+            console=report_console,
+            segments=segments,
+        )
+
+    if output is not None:
+        report_console.save_text(output)
+
+
+def diff_report(
+    docket_id: str,
+    content_hash: str,
+    top_k: int = 20,
+    report_format: str = "html",
+    output: str | None = None,
+    level: str = "word",
+    metric: str = "similarity_w",
+    workers: int | None = None,
+) -> None:
+    """
+    Write diffs between a reference comment and its top-k similar comments.
+
+    Args:
+        docket_id: Docket to load
+        content_hash: content_hash of the reference comment
+        top_k: Number of most similar comments to include
+        report_format: "html" or "terminal"
+        output: Output path (html default: diff_report_<docket>_<hash>.html;
+                terminal: optional plain-text copy)
+        level: Diff granularity, "word" or "char"
+        metric: Similarity column used for ranking
+        workers: Number of diff worker processes (default: all cores)
+    """
+    df = fetch_comments_df(docket_id=docket_id)
+    reference_text, top_df = top_similar(df, content_hash, top_k, metric=metric)
+    console.print(f"Diffing {len(top_df)} comments against {content_hash[:12]}...")
+
+    diffs = compute_report_diffs(
+        reference_text, top_df["comment"].to_list(), level=level, workers=workers
+    )
+
+    if report_format == "terminal":
+        write_terminal_report(reference_text, top_df, diffs, metric, output=output)
+        return
+
+    output = output or f"diff_report_{docket_id}_{content_hash[:8]}.html"
+    with open(output, "w") as fh:
+        fh.write(render_html_report(docket_id, content_hash, top_df, diffs, metric))
+    console.print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("docket_id", type=str)
+    parser.add_argument("content_hash", type=str)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--format", choices=["html", "terminal"], default="html")
+    parser.add_argument("-o", "--output", type=str, default=None)
+    parser.add_argument("--level", choices=["word", "char"], default="word")
+    parser.add_argument(
+        "--metric",
+        choices=["similarity_w", "embedding_similarity", "similarity"],
+        default="similarity_w",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+
+    args = parser.parse_args()
+
+    diff_report(
+        docket_id=args.docket_id,
+        content_hash=args.content_hash,
+        top_k=args.top_k,
+        report_format=args.format,
+        output=args.output,
+        level=args.level,
+        metric=args.metric,
+        workers=args.workers,
+    )
@@ -0,0 +1,452 @@
+"""
+2D maps of a docket's embedding space.
+
+Projections are computed from the docket's embedding store (see
+embedding_store.py), block by block over the memory-mapped vectors, and cached
+as ``map-<method>[-knn<k>]-c<clusters>.npz`` inside the store directory. A store
+update writes a new directory, which drops every cached map with it.
+
+Methods:
+    pca         exact PCA from the (dim, dim) covariance matrix
+    randomized  randomized SVD of the centered vectors (a few passes over the
+                store, for stores whose dim makes the covariance expensive)
+
+An optional neighbour-graph layout pulls every point towards the mean position
+of its k nearest neighbours in embedding space, which tightens campaigns that a
+linear projection smears out. Its brute-force kNN pass is quadratic in the
+number of vectors, so it is meant for dockets of up to a few tens of thousands
+of distinct comments.
+
+Points are also labelled with a spherical k-means cluster. For plotting large
+maps, bin_points reduces the visible points to a grid of bins.
+
+Usage:
+    python embedding_map.py DOCKET_ID --method pca --neighbors 15
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+from rich.console import Console
+
+from embedding_store import SCORE_BLOCK_SIZE, EmbeddingStore, dequantize
+from instrument import span
+
+console = Console()
+
+MAP_METHODS = ("pca", "randomized")
+MAP_CLUSTERS = 12
+
+# Above this many visible points the app draws bins instead of points
+MAP_MAX_POINTS = 20_000
+MAP_BINS = 150
+
+NEIGHBOR_ITERATIONS = 10
+NEIGHBOR_STEP = 0.5
+
+
+def _blocks(store: EmbeddingStore, block_size: int = SCORE_BLOCK_SIZE):
+    """Yield (start, stop, float32 block) over the stored vectors."""
+    for start in range(0, len(store), block_size):
+        stop = min(start + block_size, len(store))
+        scales = None if store.scales is None else store.scales[start:stop]
+        yield start, stop, dequantize(store.vectors[start:stop], scales)
+
+
+def _mean(store: EmbeddingStore) -> np.ndarray:
+    total = np.zeros(store.vectors.shape[1], dtype=np.float64)
+    for _, _, block in _blocks(store):
+        total += block.sum(axis=0)
+    return total / len(store)
+
+
+def _project(
+    store: EmbeddingStore, mean: np.ndarray, components: np.ndarray
+) -> np.ndarray:
+    """Centered vectors times components, (n, k) float64."""
+    out = np.empty((len(store), components.shape[1]))
+    offset = mean @ components
+    for start, stop, block in _blocks(store):
+        out[start:stop] = block @ components - offset
+    return out
+
+
+def pca_2d(store: EmbeddingStore) -> np.ndarray:
+    """
+    Exact 2D PCA of the stored vectors.
+
+    The covariance matrix is accumulated block by block and its top two
+    eigenvectors are the projection axes.
+
+    Returns:
+        np.ndarray: (n, 2) coordinates
+    """
+    mean = _mean(store)
+    dim = store.vectors.shape[1]
+    covariance = np.zeros((dim, dim))
+    for _, _, block in _blocks(store):
+        block = block - mean
+        covariance += block.T @ block
+    _, eigenvectors = np.linalg.eigh(covariance)
+    # eigh returns ascending eigenvalues
+    return _project(store, mean, eigenvectors[:, [-1, -2]])
+
+
+def randomized_2d(
+    store: EmbeddingStore,
+    oversample: int = 10,
+    power_iterations: int = 2,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    2D projection by randomized SVD (Halko, Martinsson and Tropp).
+
+    Args:
+        store: Embedding store
+        oversample: Extra random directions beyond the two kept
+        power_iterations: Passes sharpening the range estimate
+        seed: Random seed
+
+    Returns:
+        np.ndarray: (n, 2) coordinates
+    """
+    rng = np.random.default_rng(seed)
+    mean = _mean(store)
+    dim = store.vectors.shape[1]
+
+    def times_transpose(y: np.ndarray) -> np.ndarray:
+        """Centered vectors transposed times y, (dim, k)."""
+        out = np.zeros((dim, y.shape[1]))
+        for start, stop, block in _blocks(store):
+            out += block.T @ y[start:stop]
+        return out - np.outer(mean, y.sum(axis=0))
+
+    q, _ = np.linalg.qr(
+        _project(store, mean, rng.standard_normal((dim, 2 + oversample)))
+    )
+    for _ in range(power_iterations):
+        q, _ = np.linalg.qr(_project(store, mean, times_transpose(q)))
+
+    # q spans the top singular vectors; finish with a small exact SVD
+    u, s, _ = np.linalg.svd(times_transpose(q).T, full_matrices=False)
+    return (q @ u[:, :2]) * s[:2]
+
+
+def nearest_neighbors(
+    store: EmbeddingStore, k: int, block_size: int = 2048
+) -> np.ndarray:
+    """
+    Indices of the k most cosine-similar other vectors of every stored vector.
+
+    Brute force, one (block_size, n) similarity block at a time.
+    """
+    k = min(k, len(store) - 1)
+    vectors = dequantize(store.vectors, store.scales)
+    out = np.empty((len(store), k), dtype=np.int64)
+    for start in range(0, len(store), block_size):
+        stop = min(start + block_size, len(store))
+        scores = vectors[start:stop] @ vectors.T
+        scores[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        out[start:stop] = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return out
+
+
+def neighbor_layout(
+    coords: np.ndarray,
+    neighbors: np.ndarray,
+    iterations: int = NEIGHBOR_ITERATIONS,
+    step: float = NEIGHBOR_STEP,
+) -> np.ndarray:
+    """
+    Refine a layout by moving every point towards its neighbours' mean position.
+
+    The spread of each axis is restored after every iteration so the layout
+    tightens clusters without collapsing.
+    """
+    spread = coords.std(axis=0)
+    spread[spread == 0] = 1
+    for _ in range(iterations):
+        coords = (1 - step) * coords + step * coords[neighbors].mean(axis=1)
+        centered = coords - coords.mean(axis=0)
+        scale = centered.std(axis=0)
+        scale[scale == 0] = 1
+        coords = centered / scale * spread
+    return coords
+
+
+def kmeans_labels(
+    store: EmbeddingStore, k: int = MAP_CLUSTERS, iterations: int = 20, seed: int = 0
+) -> np.ndarray:
+    """
+    Spherical k-means cluster per stored vector.
+
+    Vectors are normalized, so each one joins the centroid with the largest dot
+    product; centroids are renormalized means.
+    """
+    n = len(store)
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+    init = np.sort(rng.choice(n, size=k, replace=False))
+    centroids = dequantize(
+        store.vectors[init], None if store.scales is None else store.scales[init]
+    )
+
+    labels = np.zeros(n, dtype=np.int64)
+    for _ in range(iterations):
+        sums = np.zeros_like(centroids, dtype=np.float64)
+        changed = 0
+        for start, stop, block in _blocks(store):
+            block_labels = (block @ centroids.T).argmax(axis=1)
+            changed += int((block_labels != labels[start:stop]).sum())
+            labels[start:stop] = block_labels
+            sums += np.eye(k)[block_labels].T @ block
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # Empty clusters keep their centroid
+        centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+        centroids = centroids.astype(np.float32)
+        if not changed:
+            break
+    return labels
+
+
+def map_path(
+    store: EmbeddingStore, method: str, neighbors: int = 0, clusters: int = MAP_CLUSTERS
+) -> Path:
+    layout = f"-knn{neighbors}" if neighbors else ""
+    return store.path / f"map-{method}{layout}-c{clusters}.npz"
+
+
+def get_docket_map(
+    store: EmbeddingStore,
+    method: str = "pca",
+    neighbors: int = 0,
+    clusters: int = MAP_CLUSTERS,
+) -> pl.DataFrame:
+    """
+    2D map of a store's vectors, computed once and cached in the store directory.
+
+    Args:
+        store: Docket embedding store
+        method: Projection, one of MAP_METHODS
+        neighbors: Neighbours per point for the neighbour-graph layout (0: off)
+        clusters: Number of k-means clusters to label points with
+
+    Returns:
+        DataFrame with content_hash, x, y and cluster per stored vector
+    """
+    if method not in MAP_METHODS:
+        raise ValueError(
+            f"Unknown map method {method!r}, expected one of {MAP_METHODS}"
+        )
+
+    path = map_path(store, method, neighbors, clusters)
+    if path.exists():
+        with np.load(path, allow_pickle=False) as cached:
+            coords, labels = cached["coords"], cached["clusters"]
+    else:
+        with span("embedding_map", rows=len(store), method=method, neighbors=neighbors):
+            coords = pca_2d(store) if method == "pca" else randomized_2d(store)
+            if neighbors and len(store) > 1:
+                coords = neighbor_layout(coords, nearest_neighbors(store, neighbors))
+            coords = coords.astype(np.float32)
+            labels = kmeans_labels(store, clusters).astype(np.int32)
+
+        # Written next to the vectors and renamed into place
+        fd, tmp = tempfile.mkstemp(dir=store.path, prefix=".map-", suffix=".npz")
+        with os.fdopen(fd, "wb") as fh:
+            np.savez(fh, coords=coords, clusters=labels)
+        os.replace(tmp, path)
+
+    return pl.DataFrame(
+        {
+            "content_hash": store.hashes,
+            "x": coords[:, 0],
+            "y": coords[:, 1],
+            "cluster": labels,
+        },
+        schema={
+            "content_hash": pl.String,
+            "x": pl.Float32,
+            "y": pl.Float32,
+            "cluster": pl.Int32,
+        },
+    )
+
+
+def bin_points(
+    points: pl.DataFrame,
+    label_col: str,
+    bins: int = MAP_BINS,
+    x_range: tuple[float, float] | None = None,
+    y_range: tuple[float, float] | None = None,
+) -> pl.DataFrame:
+    """
+    Reduce map points to a grid of bins for plotting.
+
+    Args:
+        points: Frame with x, y, label_col, content_hash, comment and n columns
+        label_col: Column whose most common value labels each bin
+        bins: Bins per axis
+        x_range: (min, max) of the grid on x (default: extent of the points)
+        y_range: (min, max) of the grid on y (default: extent of the points)
+
+    Returns:
+        DataFrame with one row per non-empty bin: x and y (mean position),
+        label_col, n (copies in the bin), points, and the content_hash and
+        comment of the bin's largest point
+    """
+    if points.is_empty():
+        return points.select(
+            "x", "y", label_col, "n", "content_hash", "comment"
+        ).with_columns(pl.lit(0, dtype=pl.UInt32).alias("points"))
+
+    def cell(col: str, bounds: tuple[float, float] | None) -> pl.Expr:
+        lo, hi = (
+            bounds if bounds is not None else (points[col].min(), points[col].max())
+        )
+        width = (hi - lo) / bins or 1.0
+        return ((pl.col(col) - lo) / width).floor().clip(0, bins - 1).cast(pl.Int32)
+
+    return (
+        points.with_columns(
+            cell("x", x_range).alias("_bx"), cell("y", y_range).alias("_by")
+        )
+        .sort("n", descending=True)
+        .group_by("_bx", "_by")
+        .agg(
+            pl.col("x").mean(),
+            pl.col("y").mean(),
+            pl.col(label_col).mode().sort().first(),
+            pl.col("n").sum(),
+            pl.len().alias("points"),
+            pl.col("content_hash").first(),
+            pl.col("comment").first(),
+        )
+        .drop("_bx", "_by")
+        .sort("n", descending=True)
+    )
+
+
+def docket_map_frame(
+    df: pl.DataFrame,
+    docket_id: str,
+    method: str = "pca",
+    neighbors: int = 0,
+    top_groups: int = 10,
+    **store_kwargs,
+) -> pl.DataFrame:
+    """
+    Map points of a docket with the labels the app colors them by.
+
+    The docket's distinct comments are embedded into its store first when
+    needed (see get_docket_store).
+
+    Args:
+        df: Docket frame from fetch_comments_df
+        docket_id: Docket the store belongs to
+        method: Projection, one of MAP_METHODS
+        neighbors: Neighbours per point for the neighbour-graph layout (0: off)
+        top_groups: Largest duplicate groups that get their own label
+        **store_kwargs: Passed to get_docket_store (model_name, backend, root, ...)
+
+    Returns:
+        DataFrame with content_hash, x, y, cluster, group, n (copies of the
+        text) and comment per distinct comment, largest groups first
+    """
+    from botmirror import group_key, text_column
+    from embedding_store import get_docket_store
+
+    key_col = group_key(df)
+    text_col = text_column(df)
+    distinct = (
+        df.filter(pl.col("comment").is_not_null())
+        .group_by("content_hash", maintain_order=True)
+        .agg(
+            *([pl.col(key_col).first()] if key_col != "content_hash" else []),
+            pl.col(text_col).first().alias("_text"),
+            pl.col("comment").first(),
+            pl.len().alias("n"),
+        )
+    )
+    # Ties in size are ranked in order of first appearance
+    groups = (
+        distinct.group_by(key_col, maintain_order=True)
+        .agg(pl.col("n").sum().alias("_group_size"))
+        .with_columns(
+            pl.col("_group_size").rank("ordinal", descending=True).alias("_group_rank")
+        )
+    )
+    distinct = distinct.join(groups, on=key_col).with_columns(
+        pl.when(pl.col("_group_rank") <= top_groups, pl.col("_group_size") > 1)
+        .then(pl.format("Group {}", pl.col("_group_rank")))
+        .when(pl.col("_group_size") > 1)
+        .then(pl.lit("Other duplicates"))
+        .otherwise(pl.lit("Unique"))
+        .alias("group")
+    )
+
+    store = get_docket_store(
+        docket_id,
+        distinct["content_hash"].to_list(),
+        distinct["_text"].to_list(),
+        text_col=text_col,
+        **store_kwargs,
+    )
+    return (
+        get_docket_map(store, method, neighbors)
+        .join(distinct, on="content_hash")
+        .sort("_group_rank", "n", descending=[False, True])
+        .select(
+            "content_hash",
+            "x",
+            "y",
+            pl.format("Cluster {}", pl.col("cluster") + 1).alias("cluster"),
+            "group",
+            "n",
+            "comment",
+        )
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from rich.table import Table
+
+    from data import fetch_comments_df
+    from embedding_store import EMBEDDING_CACHE_DIR
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("docket_id", type=str)
+    parser.add_argument("--method", type=str, default="pca", choices=MAP_METHODS)
+    parser.add_argument(
+        "--neighbors",
+        type=int,
+        default=0,
+        help="Neighbours per point for the neighbour-graph layout (0: off)",
+    )
+
+    args = parser.parse_args()
+
+    if not EMBEDDING_CACHE_DIR:
+        raise SystemExit("Set EMBEDDING_CACHE_DIR in .env to build embedding maps")
+
+    points = docket_map_frame(
+        fetch_comments_df(args.docket_id), args.docket_id, args.method, args.neighbors
+    )
+
+    table = Table(title=f"{args.docket_id}: {len(points):,} distinct comments mapped")
+    for column in ["Group", "Points", "Copies", "Center x", "Center y"]:
+        table.add_column(column, justify="left" if column == "Group" else "right")
+    summary = (
+        points.group_by("group", maintain_order=True)
+        .agg(pl.len(), pl.col("n").sum(), pl.col("x").mean(), pl.col("y").mean())
+        .iter_rows()
+    )
+    for group, n_points, copies, x, y in summary:
+        table.add_row(group, f"{n_points:,}", f"{copies:,}", f"{x:.3f}", f"{y:.3f}")
+    console.print(table)
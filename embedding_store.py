@@ -0,0 +1,327 @@
+"""
+On-disk embedding cache keyed by content_hash.
+
+Vectors are L2-normalized and stored as float32, float16 or scalar-quantized int8
+(one float32 scale per row) in ``.npy`` files that are memory-mapped on open, so
+scoring a docket is a blocked NumPy dot product straight from the page cache.
+
+Layout of a store directory:
+    meta.json      dtype, dim, model
+    hashes.npy     content_hash per row
+    vectors.npy    (n, dim) float32 / float16 / int8
+    scales.npy     (n,) float32, int8 stores only
+
+Updates take an exclusive lock on ``.<store>.lock`` next to the directory, so
+processes filling the same docket's store do not lose each other's rows.
+"""
+
+import fcntl
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from config import settings
+from embeddings import (
+    DEFAULT_BACKEND,
+    DEFAULT_MAX_CHUNKS,
+    DEFAULT_MODEL,
+    DEFAULT_WINDOW_WORDS,
+    encode_texts,
+    get_model,
+)
+from instrument import span
+
+STORE_DTYPES = ("float32", "float16", "int8")
+
+# Set EMBEDDING_CACHE_DIR in .env to cache docket embeddings on disk
+EMBEDDING_CACHE_DIR = settings.get("EMBEDDING_CACHE_DIR") or None
+EMBEDDING_STORE_DTYPE = settings.get("EMBEDDING_STORE_DTYPE") or "float16"
+
+SCORE_BLOCK_SIZE = 65536
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """
+    Convert normalized float32 vectors to the storage dtype.
+
+    Returns:
+        tuple: (stored vectors, per-row float32 scales for int8 else None)
+    """
+    if dtype == "float32":
+        return vectors.astype(np.float32), None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        quantized = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+    raise ValueError(f"Unknown store dtype {dtype!r}, expected one of {STORE_DTYPES}")
+
+
+def dequantize(vectors: np.ndarray, scales: np.ndarray | None) -> np.ndarray:
+    """Convert stored vectors back to float32."""
+    out = np.asarray(vectors, dtype=np.float32)
+    return out if scales is None else out * scales[:, None]
+
+
+class EmbeddingStore:
+    """Memory-mapped embeddings for a set of content hashes."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        with open(self.path / "meta.json") as fh:
+            self.meta = json.load(fh)
+        self.hashes = np.load(self.path / "hashes.npy", allow_pickle=False)
+        self.vectors = np.load(self.path / "vectors.npy", mmap_mode="r")
+        scales_path = self.path / "scales.npy"
+        self.scales = np.load(scales_path) if scales_path.exists() else None
+        self._index = {h: i for i, h in enumerate(self.hashes.tolist())}
+
+    @classmethod
+    def write(
+        cls,
+        path: str | Path,
+        hashes: list[str],
+        vectors: np.ndarray,
+        dtype: str = EMBEDDING_STORE_DTYPE,
+        model_name: str = DEFAULT_MODEL,
+    ) -> "EmbeddingStore":
+        """
+        Write normalized float32 vectors as a store, replacing any existing one.
+
+        The store is written to a temporary directory and renamed into place, so
+        readers never see a partially written store.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        stored, scales = quantize(vectors, dtype)
+
+        tmp_dir = Path(tempfile.mkdtemp(dir=path.parent, prefix=f".{path.name}-"))
+        np.save(tmp_dir / "hashes.npy", np.asarray(hashes, dtype=str))
+        np.save(tmp_dir / "vectors.npy", stored)
+        if scales is not None:
+            np.save(tmp_dir / "scales.npy", scales)
+        with open(tmp_dir / "meta.json", "w") as fh:
+            json.dump(
+                {"dtype": dtype, "dim": int(vectors.shape[1]), "model": model_name},
+                fh,
+            )
+
+        if path.exists():
+            old = path.with_name(f".{path.name}-old-{time.time_ns()}")
+            os.replace(path, old)
+            os.replace(tmp_dir, path)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.replace(tmp_dir, path)
+
+        return cls(path)
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes used by the vectors (and scales)."""
+        return self.vectors.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+    def rows(self, hashes: list[str]) -> np.ndarray:
+        """Row index per hash, -1 where the hash is not stored."""
+        return np.array([self._index.get(h, -1) for h in hashes], dtype=np.int64)
+
+    def to_float32(self, rows: np.ndarray | None = None) -> np.ndarray:
+        """Dequantized vectors, optionally for a subset of rows."""
+        if rows is None:
+            return dequantize(self.vectors, self.scales)
+        scales = None if self.scales is None else self.scales[rows]
+        return dequantize(self.vectors[rows], scales)
+
+    def scores(self, query: np.ndarray, rows: np.ndarray | None = None) -> np.ndarray:
+        """
+        Cosine similarity of a normalized float32 query against stored vectors.
+
+        The dot product runs block by block over the memory-mapped vectors; int8
+        rows are rescaled after the dot product.
+
+        Args:
+            query: Normalized (dim,) float32 query vector
+            rows: Restrict to these rows, in this order (default: all rows)
+
+        Returns:
+            np.ndarray: float32 cosine similarities
+        """
+        query = np.asarray(query, dtype=np.float32)
+        n = len(self) if rows is None else len(rows)
+        out = np.empty(n, dtype=np.float32)
+
+        for start in range(0, n, SCORE_BLOCK_SIZE):
+            stop = min(start + SCORE_BLOCK_SIZE, n)
+            if rows is None:
+                block = self.vectors[start:stop]
+                scales = None if self.scales is None else self.scales[start:stop]
+            else:
+                block = self.vectors[rows[start:stop]]
+                scales = None if self.scales is None else self.scales[rows[start:stop]]
+            block_scores = block.astype(np.float32) @ query
+            out[start:stop] = block_scores if scales is None else block_scores * scales
+
+        return out
+
+
+def store_path(
+    docket_id: str,
+    model_name: str = DEFAULT_MODEL,
+    backend: str = DEFAULT_BACKEND,
+    dtype: str = EMBEDDING_STORE_DTYPE,
+    root: str | None = EMBEDDING_CACHE_DIR,
+    window_words: int | None = DEFAULT_WINDOW_WORDS,
+    max_chunks: int = DEFAULT_MAX_CHUNKS,
+    text_col: str = "comment",
+) -> Path:
+    """
+    Directory of a docket's store for a given model, backend, pooling, embedded
+    text column (raw comment or normalized_comment) and dtype.
+    """
+    model_slug = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+    pooling = f"window{window_words}x{max_chunks}" if window_words else "truncate"
+    return Path(root, model_slug, backend, pooling, text_col, dtype, docket_id)
+
+
+def get_docket_store(
+    docket_id: str,
+    hashes: list[str],
+    texts: list[str],
+    model_name: str = DEFAULT_MODEL,
+    backend: str = DEFAULT_BACKEND,
+    dtype: str = EMBEDDING_STORE_DTYPE,
+    root: str | None = EMBEDDING_CACHE_DIR,
+    threads: int | None = None,
+    window_words: int | None = DEFAULT_WINDOW_WORDS,
+    max_chunks: int = DEFAULT_MAX_CHUNKS,
+    text_col: str = "comment",
+) -> EmbeddingStore:
+    """
+    Open a docket's store, encoding and adding any hashes it does not hold yet.
+
+    Args:
+        docket_id: Docket the store belongs to
+        hashes: content_hash per text
+        texts: Texts to make sure are stored
+        model_name: Sentence transformer model
+        backend: Embedding inference backend
+        dtype: Storage dtype, one of STORE_DTYPES
+        root: Cache root directory
+        threads: Intra-op thread count for the backend
+        window_words: Words per window for long texts (None: truncate)
+        max_chunks: Maximum number of windows per text
+        text_col: Column the texts come from; stores of raw and normalized
+            text are kept apart since both are keyed by content_hash
+
+    Returns:
+        EmbeddingStore: Store containing every given hash
+    """
+    path = store_path(
+        docket_id, model_name, backend, dtype, root, window_words, max_chunks, text_col
+    )
+    store, missing = _open_with_missing(path, hashes, texts)
+    if not missing and store is not None:
+        return store
+
+    with _store_lock(path):
+        # Reopen under the lock: another process may have added rows meanwhile
+        store, missing = _open_with_missing(path, hashes, texts)
+        if not missing and store is not None:
+            return store
+
+        with span("embedding_store_update", rows=len(missing), docket_id=docket_id):
+            new_vectors = encode_texts(
+                get_model(model_name, backend, threads),
+                list(missing.values()),
+                window_words=window_words,
+                max_chunks=max_chunks,
+            )
+            all_hashes = list(missing)
+            if store is not None:
+                # float16 and per-row int8 round-trip exactly through float32
+                all_hashes = store.hashes.tolist() + all_hashes
+                new_vectors = np.vstack([store.to_float32(), new_vectors])
+            return EmbeddingStore.write(
+                path, all_hashes, new_vectors, dtype, model_name
+            )
+
+
+def _open_with_missing(
+    path: Path, hashes: list[str], texts: list[str]
+) -> tuple[EmbeddingStore | None, dict[str, str]]:
+    """The store at path (None if absent) and the texts of hashes it lacks."""
+    store = EmbeddingStore(path) if (path / "meta.json").exists() else None
+
+    known = set() if store is None else set(store._index)
+    missing: dict[str, str] = {}
+    for h, text in zip(hashes, texts):
+        if h is not None and text is not None and h not in known:
+            missing.setdefault(h, text)
+    return store, missing
+
+
+@contextmanager
+def _store_lock(path: Path):
+    """Hold an exclusive lock on a store across processes and threads."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(f".{path.name}.lock"), "w") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def recall_at_k(
+    vectors: np.ndarray, dtype: str, n_queries: int = 100, k: int = 10, seed: int = 0
+) -> dict:
+    """
+    Measure how well a storage dtype preserves float32 nearest neighbours.
+
+    Queries are sampled from the vectors themselves; for each, the top-k by
+    float32 cosine is compared with the top-k scored from the quantized vectors.
+
+    Args:
+        vectors: Normalized float32 vectors
+        dtype: Storage dtype to evaluate
+        n_queries: Number of sampled queries
+        k: Neighbours per query
+        seed: Random seed
+
+    Returns:
+        dict: dtype, recall@k, mean absolute score error and bytes per vector
+    """
+    stored, scales = quantize(vectors, dtype)
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), size=min(n_queries, len(vectors)))]
+
+    exact = queries @ vectors.T
+    approx = (queries @ stored.astype(np.float32).T) * (
+        1 if scales is None else scales[None, :]
+    )
+
+    k = min(k, len(vectors))
+    exact_top = np.argpartition(-exact, k - 1, axis=1)[:, :k]
+    approx_top = np.argpartition(-approx, k - 1, axis=1)[:, :k]
+    hits = [len(set(a) & set(b)) for a, b in zip(exact_top, approx_top)]
+
+    return {
+        "dtype": dtype,
+        "recall_at_k": float(np.mean(hits) / k),
+        "k": k,
+        "mean_abs_error": float(np.abs(exact - approx).mean()),
+        "bytes_per_vector": stored.itemsize * stored.shape[1]
+        + (0 if scales is None else 4),
+    }
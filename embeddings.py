@@ -0,0 +1,283 @@
+"""
+Sentence-embedding helpers: model loading and a length-bucketed, chunked encoder
+with optional windowing of long texts.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+from config import settings
+from instrument import span
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_CHUNK_SIZE = 4096
+
+# Inference backends for CPU serving:
+# - torch: PyTorch FP32 (reference)
+# - torch-int8: PyTorch with Linear layers dynamically quantized to int8
+# - onnx: ONNX Runtime FP32
+# - onnx-int8: ONNX Runtime with the model's pre-quantized int8 weights
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+ONNX_INT8_FILE = "onnx/model_qint8_avx2.onnx"
+
+# Defaults can be set in .env (EMBEDDING_BACKEND, EMBEDDING_THREADS)
+DEFAULT_BACKEND = settings.get("EMBEDDING_BACKEND") or "torch"
+DEFAULT_THREADS = int(settings.get("EMBEDDING_THREADS") or 0) or None
+
+# Long comments: embed overlapping windows of EMBEDDING_WINDOW_WORDS words (at most
+# EMBEDDING_MAX_CHUNKS per comment) and mean-pool them. Unset: truncate to the model.
+DEFAULT_WINDOW_WORDS = int(settings.get("EMBEDDING_WINDOW_WORDS") or 0) or None
+DEFAULT_MAX_CHUNKS = int(settings.get("EMBEDDING_MAX_CHUNKS") or 8)
+WINDOW_OVERLAP = 0.25
+
+
+@lru_cache(maxsize=4)
+def get_model(
+    model_name: str = DEFAULT_MODEL,
+    backend: str = DEFAULT_BACKEND,
+    threads: int | None = DEFAULT_THREADS,
+):
+    """
+    Load a sentence transformer once per process and reuse it across calls.
+
+    Args:
+        model_name: Sentence transformer model to load
+        backend: One of BACKENDS
+        threads: Intra-op thread count (default: library default, usually all cores)
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+
+    # Import here to avoid loading if not used
+    from sentence_transformers import SentenceTransformer
+
+    if backend.startswith("onnx"):
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        if threads:
+            session_options.intra_op_num_threads = threads
+        model_kwargs = {
+            "provider": "CPUExecutionProvider",
+            "session_options": session_options,
+        }
+        if backend == "onnx-int8":
+            model_kwargs["file_name"] = ONNX_INT8_FILE
+
+        return SentenceTransformer(
+            model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs
+        )
+
+    import torch
+
+    if threads:
+        torch.set_num_threads(threads)
+
+    model = SentenceTransformer(model_name, device="cpu")
+    if backend == "torch-int8":
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+    return model
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize each row (rows of zeros/NaN are left as they are)."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(norms > 0, vectors / norms, vectors)
+
+
+def split_windows(
+    text: str,
+    window_words: int,
+    max_chunks: int = DEFAULT_MAX_CHUNKS,
+    overlap: float = WINDOW_OVERLAP,
+) -> list[str]:
+    """
+    Split a text into overlapping windows of whitespace words.
+
+    When a text needs more than ``max_chunks`` windows, evenly spaced windows are
+    kept so the whole text is still represented, not just its beginning.
+
+    Args:
+        text: Text to split
+        window_words: Words per window
+        max_chunks: Maximum number of windows returned
+        overlap: Fraction of a window shared with the next one
+
+    Returns:
+        list: Window texts, ``[text]`` when the text fits in one window
+    """
+    words = text.split()
+    if len(words) <= window_words:
+        return [text]
+
+    step = max(1, int(window_words * (1 - overlap)))
+    last = len(words) - window_words
+    starts = list(range(0, last, step)) + [last]
+    if len(starts) > max_chunks:
+        keep = np.unique(
+            np.linspace(0, len(starts) - 1, max_chunks).round().astype(int)
+        )
+        starts = [starts[k] for k in keep]
+
+    return [" ".join(words[s : s + window_words]) for s in starts]
+
+
+def _encode_unique(
+    model, texts: list[str], batch_size: int, chunk_size: int, normalize: bool
+) -> np.ndarray:
+    """Encode distinct texts shortest first, ``chunk_size`` texts per call."""
+    dim = model.get_sentence_embedding_dimension()
+    out = np.empty((len(texts), dim), dtype=np.float32)
+
+    lengths = np.array([len(t.split()) for t in texts])
+    order = np.argsort(lengths, kind="stable")
+
+    # Text past the model's context window is truncated anyway; don't tokenize it
+    max_seq_length = getattr(model, "max_seq_length", None)
+    max_words = 2 * max_seq_length if max_seq_length else None
+
+    for start in range(0, len(order), chunk_size):
+        chunk = order[start : start + chunk_size]
+        batch = [texts[k] for k in chunk]
+        if max_words:
+            batch = [
+                " ".join(t.split()[:max_words]) if lengths[k] > max_words else t
+                for k, t in zip(chunk, batch)
+            ]
+        with span("encode_chunk", rows=len(chunk), max_tokens=int(lengths[chunk[-1]])):
+            vectors = np.asarray(
+                model.encode(batch, batch_size=batch_size, convert_to_numpy=True),
+                dtype=np.float32,
+            )
+        out[chunk] = normalize_rows(vectors) if normalize else vectors
+
+    return out
+
+
+def encode_texts(
+    model,
+    texts: list[str | None],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    normalize: bool = True,
+    window_words: int | None = DEFAULT_WINDOW_WORDS,
+    max_chunks: int = DEFAULT_MAX_CHUNKS,
+) -> np.ndarray:
+    """
+    Encode texts in length-sorted, bounded chunks.
+
+    Identical texts are encoded once. Distinct texts are sorted by token length
+    (whitespace tokens) so each batch holds texts of similar length and little
+    padding, and are passed to the model ``chunk_size`` at a time so memory stays
+    bounded on huge dockets. Results are scattered back to the input order.
+
+    With ``window_words`` set, texts longer than a window are split into at most
+    ``max_chunks`` overlapping windows. All windows are encoded together (windows
+    shared between texts, e.g. template paragraphs, are encoded once) and each
+    text's embedding is the mean of its normalized window embeddings.
+
+    Args:
+        model: SentenceTransformer (anything with a compatible ``encode``)
+        texts: Texts to encode; None entries are allowed
+        batch_size: Batch size passed to ``model.encode``
+        chunk_size: Maximum number of texts per ``model.encode`` call
+        normalize: L2-normalize the embeddings
+        window_words: Words per window for long texts (None: truncate to the model)
+        max_chunks: Maximum number of windows per text
+
+    Returns:
+        np.ndarray: (len(texts), dim) float32 array, rows of NaN where the text is None
+    """
+    # Deduplicate, remembering where each distinct text goes
+    positions: dict[str, list[int]] = {}
+    for i, text in enumerate(texts):
+        if text is not None:
+            positions.setdefault(text, []).append(i)
+    unique_texts = list(positions)
+
+    dim = model.get_sentence_embedding_dimension()
+    out = np.full((len(texts), dim), np.nan, dtype=np.float32)
+    if not unique_texts:
+        return out
+
+    if window_words:
+        windows = [split_windows(t, window_words, max_chunks) for t in unique_texts]
+        with span("encode_windows", rows=len(unique_texts)) as s:
+            pooled = encode_texts(
+                model,
+                [w for text_windows in windows for w in text_windows],
+                batch_size=batch_size,
+                chunk_size=chunk_size,
+                normalize=True,
+                window_words=None,
+            )
+            s["windows"] = len(pooled)
+        counts = np.array([len(w) for w in windows])
+        offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        vectors = np.add.reduceat(pooled, offsets, axis=0) / counts[:, None]
+        if normalize:
+            vectors = normalize_rows(vectors)
+    else:
+        vectors = _encode_unique(model, unique_texts, batch_size, chunk_size, normalize)
+
+    for text, vector in zip(unique_texts, vectors):
+        out[positions[text]] = vector
+
+    return out
+
+
+def check_backend_parity(
+    texts: list[str],
+    backend: str,
+    model_name: str = DEFAULT_MODEL,
+    sample_size: int = 256,
+    threads: int | None = DEFAULT_THREADS,
+    seed: int = 0,
+) -> dict:
+    """
+    Compare a backend's embeddings against the torch FP32 reference on a sample.
+
+    Args:
+        texts: Texts to sample from (e.g. a docket's comments)
+        backend: Backend to check
+        model_name: Sentence transformer model
+        sample_size: Number of distinct texts to compare
+        threads: Intra-op thread count for the checked backend
+        seed: Random seed for the sample
+
+    Returns:
+        dict: backend, n, min/mean cosine between the two embeddings of each text
+              and the largest difference on the 0-100 similarity scale
+    """
+    unique_texts = sorted({t for t in texts if t})
+    rng = np.random.default_rng(seed)
+    sample = [
+        unique_texts[i]
+        for i in rng.choice(
+            len(unique_texts), size=min(sample_size, len(unique_texts)), replace=False
+        )
+    ]
+    if not sample:
+        return {"backend": backend, "n": 0}
+
+    with span("parity_check", rows=len(sample), backend=backend):
+        reference = encode_texts(get_model(model_name, "torch", threads), sample)
+        candidate = encode_texts(get_model(model_name, backend, threads), sample)
+
+    cosines = np.sum(reference * candidate, axis=1)
+    # Pairwise similarity to the first sampled text, on the app's 0-100 scale
+    score_diff = np.abs((reference @ reference[0]) - (candidate @ candidate[0])) * 50
+
+    return {
+        "backend": backend,
+        "n": len(sample),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "max_score_diff": float(score_diff.max()),
+    }
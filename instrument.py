@@ -0,0 +1,114 @@
+"""
+Lightweight timing and memory instrumentation for the pipeline.
+
+Wrap a stage in ``span`` to record its wall time, row count and RSS delta:
+
+    with span("load", docket_id=docket_id) as s:
+        df = load_mirrulations_parquet(docket_id)
+        s["rows"] = len(df)
+
+Every finished span is logged as a JSON line on the "botmirror" logger and kept in
+an in-memory ring buffer that the app's diagnostics panel reads.
+"""
+
+import json
+import logging
+import resource
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+import polars as pl
+
+logger = logging.getLogger("botmirror")
+
+MAX_SPANS = 1000
+
+_spans: deque = deque(maxlen=MAX_SPANS)
+_parent: ContextVar[str | None] = ContextVar("parent_span", default=None)
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB."""
+    try:
+        with open("/proc/self/statm") as fh:
+            pages = int(fh.read().split()[1])
+        return pages * resource.getpagesize() / 1024**2
+    except (OSError, IndexError, ValueError):
+        # No procfs (e.g. macOS): fall back to the peak RSS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+@contextmanager
+def span(name: str, rows: int | None = None, **attrs):
+    """
+    Time a pipeline stage.
+
+    Args:
+        name: Stage name (e.g. "load", "hash", "string_score")
+        rows: Number of rows processed, if known up front
+        **attrs: Extra fields to record (docket_id, reference hash, ...)
+
+    Yields:
+        dict: The span record; set ``record["rows"]`` or other keys inside the block
+    """
+    record = {
+        "span": name,
+        "parent": _parent.get(),
+        "start": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "rows": rows,
+        **attrs,
+    }
+    token = _parent.set(name)
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = repr(e)
+        raise
+    finally:
+        record["seconds"] = round(time.perf_counter() - start, 6)
+        record["rss_mb"] = round(current_rss_mb(), 1)
+        record["rss_delta_mb"] = round(record["rss_mb"] - rss_before, 1)
+        _parent.reset(token)
+        _spans.append(record)
+        logger.info(json.dumps(record, default=str))
+
+
+def recent_spans(n: int | None = None) -> list[dict]:
+    """Most recent span records, newest last."""
+    spans = list(_spans)
+    return spans if n is None else spans[-n:]
+
+
+def spans_frame(n: int | None = None) -> pl.DataFrame:
+    """Recent spans as a DataFrame (newest first) for display."""
+    spans = recent_spans(n)
+    if not spans:
+        return pl.DataFrame(
+            schema={
+                "start": pl.String,
+                "span": pl.String,
+                "parent": pl.String,
+                "seconds": pl.Float64,
+                "rows": pl.Int64,
+                "rss_mb": pl.Float64,
+                "rss_delta_mb": pl.Float64,
+            }
+        )
+
+    columns = ["start", "span", "parent", "seconds", "rows", "rss_mb", "rss_delta_mb"]
+    return pl.DataFrame(
+        [{c: s.get(c) for c in columns} for s in reversed(spans)],
+        schema_overrides={"rows": pl.Int64, "parent": pl.String},
+    )
+
+
+def clear_spans() -> None:
+    """Drop all recorded spans."""
+    _spans.clear()
@@ -0,0 +1,439 @@
+"""
+Ingest-time sketches of each docket for instant, approximate statistics.
+
+data2parquet.py writes one JSON file per docket to ``<out_dir>/sketches`` after
+the partitions are written; the app reads it (set DOCKET_SKETCH_DIR in .env)
+to fill the overview while the docket itself is still loading. A docket is
+streamed in batches of SKETCH_BATCH_ROWS rows, so sketching is memory-flat.
+
+Each sketch holds:
+    n_comments  exact row count
+    hll         HyperLogLog registers over content_hash (distinct comments)
+    sample      coordinated sample: every content_hash (16 hex prefix) whose
+                value falls below a threshold, with its copy count; the
+                threshold halves whenever the sample outgrows
+                SKETCH_SAMPLE_SIZE. Scaling the sampled texts that have copies
+                gives an unbiased estimate of the number of duplicate groups.
+    top         Space-Saving heavy hitters: the most copied texts, with counts
+                that overestimate by at most ``error``
+    similarity  optional histogram of the string similarity of sampled
+                comments to their closest top template, weighted by copies
+
+The hash values are the first 64 bits of the sha256 content_hash, so sketches
+of different dockets can be merged.
+
+Usage:
+    python sketches.py OUT_DIR --similarity-sample 2000
+    python sketches.py --show DOCKET_ID
+"""
+
+import base64
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+from rich.console import Console
+
+from config import settings
+from instrument import span
+
+# Set DOCKET_SKETCH_DIR in .env (e.g. <out_dir>/sketches) to use the sketches
+DOCKET_SKETCH_DIR = settings.get("DOCKET_SKETCH_DIR") or None
+
+HLL_PRECISION = 14
+TOP_K = 50
+SKETCH_SAMPLE_SIZE = 20_000
+SKETCH_BATCH_ROWS = 200_000
+SIMILARITY_BINS = 10
+TEXT_PREVIEW_CHARS = 300
+
+console = Console()
+
+
+def hash_value(expr: pl.Expr) -> pl.Expr:
+    """First 64 bits of a sha256 hex digest as UInt64."""
+    return expr.str.slice(0, 16).str.to_integer(base=16, dtype=pl.UInt64)
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter over 64-bit hash values."""
+
+    def __init__(self, precision: int = HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = (
+            np.zeros(1 << precision, dtype=np.uint8)
+            if registers is None
+            else np.asarray(registers, dtype=np.uint8)
+        )
+
+    def add(self, values: np.ndarray) -> None:
+        """Add uint64 hash values."""
+        values = np.asarray(values, dtype=np.uint64)
+        tail_bits = 64 - self.precision
+        index = (values >> np.uint64(tail_bits)).astype(np.int64)
+        tail = values & np.uint64((1 << tail_bits) - 1)
+        # Position of the leftmost 1-bit in the tail (tails fit a float exactly)
+        _, bit_length = np.frexp(tail.astype(np.float64))
+        rank = (tail_bits - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        return HyperLogLog(self.precision, np.maximum(self.registers, other.registers))
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return m * np.log(m / zeros)
+        return float(raw)
+
+    def to_dict(self) -> dict:
+        return {
+            "precision": self.precision,
+            "registers": base64.b64encode(self.registers.tobytes()).decode(),
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "HyperLogLog":
+        registers = np.frombuffer(base64.b64decode(d["registers"]), dtype=np.uint8)
+        return cls(d["precision"], registers.copy())
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters with batched, weighted updates.
+
+    A batch's exact counts are merged into the summary: items already tracked
+    add their count; new items start from the summary's smallest count (the
+    most they can have been missed by), recorded as their error. The k largest
+    counts are kept.
+    """
+
+    SCHEMA = {
+        "item": pl.String,
+        "count": pl.Int64,
+        "error": pl.Int64,
+        "label": pl.String,
+    }
+
+    def __init__(self, k: int = TOP_K, counters: pl.DataFrame | None = None):
+        self.k = k
+        self.counters = (
+            pl.DataFrame(schema=self.SCHEMA) if counters is None else counters
+        )
+
+    def update(self, batch: pl.DataFrame) -> None:
+        """Merge a batch with item, count and label columns (one row per item)."""
+        floor = self.counters["count"].min() if len(self.counters) >= self.k else 0
+        merged = (
+            self.counters.join(
+                batch.select("item", "count", "label"),
+                on="item",
+                how="full",
+                coalesce=True,
+                suffix="_batch",
+            )
+            .with_columns(
+                pl.when(pl.col("count").is_null())
+                .then(pl.col("count_batch") + floor)
+                .otherwise(pl.col("count") + pl.col("count_batch").fill_null(0))
+                .alias("count"),
+                pl.col("error").fill_null(floor),
+                pl.coalesce("label", "label_batch").alias("label"),
+            )
+            .select(self.SCHEMA.keys())
+        )
+        self.counters = merged.sort("count", "item", descending=[True, False]).head(
+            self.k
+        )
+
+    def top(self, n: int | None = None) -> pl.DataFrame:
+        return self.counters.head(n) if n is not None else self.counters
+
+
+def similarity_histogram(
+    texts: list[str], weights: list[int], templates: list[str]
+) -> dict:
+    """
+    Histogram of each text's best fuzz.ratio against the templates.
+
+    Returns:
+        dict: bin edges (0-100), copy-weighted counts per bin and sample size
+    """
+    from rapidfuzz import fuzz, process
+
+    scores = process.cdist(texts, templates, scorer=fuzz.ratio, workers=-1).max(axis=1)
+    counts, edges = np.histogram(
+        scores, bins=SIMILARITY_BINS, range=(0, 100), weights=weights
+    )
+    return {
+        "edges": edges.tolist(),
+        "counts": counts.astype(int).tolist(),
+        "sample_size": len(texts),
+    }
+
+
+def build_docket_sketch(
+    files: list[str],
+    docket_id: str,
+    top_k: int = TOP_K,
+    sample_size: int = SKETCH_SAMPLE_SIZE,
+    similarity_sample: int = 0,
+    batch_rows: int = SKETCH_BATCH_ROWS,
+) -> dict:
+    """
+    Stream a docket's partition files into a sketch.
+
+    Args:
+        files: Parquet files of the docket
+        docket_id: Docket id
+        top_k: Heavy hitters to track
+        sample_size: Largest number of distinct hashes kept in the sample
+        similarity_sample: Sampled texts scored against the top templates for the
+            similarity histogram (0: no histogram)
+        batch_rows: Rows read per batch
+
+    Returns:
+        dict: JSON-serializable sketch (see module docstring)
+    """
+    lf = pl.scan_parquet(files)
+    if "content_hash" not in lf.collect_schema().names():
+        # Hives ingested before content_hash was stored
+        lf = lf.with_columns(
+            pl.col("comment")
+            .map_elements(
+                lambda x: hashlib.sha256(x.encode()).hexdigest(),
+                return_dtype=pl.String,
+            )
+            .alias("content_hash")
+        )
+    lf = lf.select("content_hash", "comment")
+
+    hll = HyperLogLog()
+    heavy = SpaceSaving(top_k)
+    threshold = np.iinfo(np.uint64).max
+    sample = pl.DataFrame(
+        schema={"content_hash": pl.String, "value": pl.UInt64, "count": pl.Int64}
+    )
+    sample_texts: dict[str, str] = {}
+    n_comments = 0
+
+    with span("docket_sketch", docket_id=docket_id) as s:
+        offset = 0
+        while True:
+            batch = lf.slice(offset, batch_rows).collect()
+            if batch.is_empty():
+                break
+            offset += len(batch)
+            n_comments += len(batch)
+
+            counts = (
+                batch.drop_nulls("content_hash")
+                .group_by("content_hash")
+                .agg(pl.len().cast(pl.Int64).alias("count"), pl.col("comment").first())
+                .with_columns(hash_value(pl.col("content_hash")).alias("value"))
+            )
+            hll.add(counts["value"].to_numpy())
+            heavy.update(
+                counts.select(
+                    pl.col("content_hash").alias("item"),
+                    "count",
+                    pl.col("comment").alias("label"),
+                )
+            )
+
+            sampled = counts.filter(pl.col("value") <= threshold)
+            if similarity_sample:
+                for h, text in sampled.select("content_hash", "comment").iter_rows():
+                    sample_texts.setdefault(h, text)
+            sample = (
+                pl.concat([sample, sampled.select(sample.columns)])
+                .group_by("content_hash", "value")
+                .agg(pl.col("count").sum())
+            )
+            if len(sample) > sample_size:
+                while len(sample) > sample_size:
+                    threshold //= 2
+                    sample = sample.filter(pl.col("value") <= threshold)
+                sample_texts = {
+                    h: sample_texts[h]
+                    for h in sample["content_hash"]
+                    if h in sample_texts
+                }
+
+        s["rows"] = n_comments
+
+        rate = (threshold + 1) / 2.0**64
+        top = heavy.top()
+        histogram = None
+        if similarity_sample and len(sample) and len(top):
+            sample = sample.sort("content_hash")
+            picked = sample.head(similarity_sample)
+            histogram = similarity_histogram(
+                [sample_texts[h] for h in picked["content_hash"]],
+                picked["count"].to_list(),
+                top["label"].head(10).to_list(),
+            )
+
+    return {
+        "docket_id": docket_id,
+        "n_comments": n_comments,
+        "hll": hll.to_dict(),
+        "sample": {
+            "rate": rate,
+            # Hash prefixes are enough to merge samples and keep the file small
+            "content_hash": sample["content_hash"].str.slice(0, 16).to_list(),
+            "count": sample["count"].to_list(),
+        },
+        "top": {
+            "content_hash": top["item"].to_list(),
+            "count": top["count"].to_list(),
+            "error": top["error"].to_list(),
+            "comment": [t[:TEXT_PREVIEW_CHARS] for t in top["label"].to_list()],
+        },
+        "similarity": histogram,
+    }
+
+
+def sketch_path(docket_id: str, sketch_dir: str) -> Path:
+    return Path(sketch_dir, f"{docket_id}.json")
+
+
+def write_docket_sketches(
+    out_dir: str, similarity_sample: int = 0, sketch_dir: str | None = None
+) -> str:
+    """
+    Sketch every docket of the hive in <out_dir>/comments.
+
+    Each sketch is written under a temporary name and renamed into place.
+
+    Returns:
+        str: Directory holding the sketches (default <out_dir>/sketches)
+    """
+    sketch_dir = sketch_dir or str(Path(out_dir, "sketches"))
+    Path(sketch_dir).mkdir(parents=True, exist_ok=True)
+
+    files_by_docket: dict[str, list[str]] = {}
+    for path in sorted(Path(out_dir, "comments").glob("*/*/docket_id=*/*.parquet")):
+        docket_id = path.parent.name.split("=", 1)[1]
+        files_by_docket.setdefault(docket_id, []).append(str(path))
+
+    for docket_id, files in files_by_docket.items():
+        sketch = build_docket_sketch(
+            files, docket_id, similarity_sample=similarity_sample
+        )
+        fd, tmp = tempfile.mkstemp(dir=sketch_dir, suffix=".json.tmp")
+        with os.fdopen(fd, "w") as fh:
+            json.dump(sketch, fh)
+        os.replace(tmp, sketch_path(docket_id, sketch_dir))
+
+    return sketch_dir
+
+
+def sketch_estimates(sketch: dict) -> dict:
+    """
+    Approximate overview statistics from a sketch.
+
+    Returns:
+        dict: n_comments (exact at ingest), unique_comments (HyperLogLog),
+        duplicate_groups (texts with more than one copy, from the sample),
+        top (DataFrame of heavy hitters) and similarity (histogram or None)
+    """
+    sample = sketch["sample"]
+    n_repeated = sum(1 for count in sample["count"] if count > 1)
+    return {
+        "n_comments": sketch["n_comments"],
+        "unique_comments": round(HyperLogLog.from_dict(sketch["hll"]).estimate()),
+        "duplicate_groups": round(n_repeated / sample["rate"]),
+        "top": pl.DataFrame(sketch["top"]),
+        "similarity": sketch["similarity"],
+    }
+
+
+def load_docket_sketch(
+    docket_id: str,
+    files: list[str] | None = None,
+    sketch_dir: str | None = DOCKET_SKETCH_DIR,
+) -> dict | None:
+    """
+    Estimates from a docket's sketch, or None without an up-to-date sketch.
+
+    A sketch older than any of the docket's partition files (the docket was
+    re-ingested since) is ignored.
+
+    Args:
+        docket_id: Docket id
+        files: The docket's partition files (default: data.docket_files)
+        sketch_dir: Directory of the sketches (default: DOCKET_SKETCH_DIR)
+    """
+    if not sketch_dir:
+        return None
+    path = sketch_path(docket_id, sketch_dir)
+    if not path.exists():
+        return None
+
+    if files is None:
+        from data import docket_files
+
+        files = docket_files(docket_id)
+    sketched_at = path.stat().st_mtime_ns
+    if any(os.stat(f).st_mtime_ns > sketched_at for f in files):
+        return None
+
+    with open(path) as fh:
+        return sketch_estimates(json.load(fh))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from rich.table import Table
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("out_dir", type=str, nargs="?", help="Hive to sketch")
+    parser.add_argument(
+        "--similarity-sample",
+        type=int,
+        default=0,
+        help="Sampled comments scored against the top templates (0: no histogram)",
+    )
+    parser.add_argument(
+        "--show", type=str, default=None, help="Print the sketch of this docket"
+    )
+
+    args = parser.parse_args()
+
+    if args.show is None:
+        if args.out_dir is None:
+            parser.error("out_dir is required unless --show is given")
+        sketch_dir = write_docket_sketches(args.out_dir, args.similarity_sample)
+        console.print(f"Sketches written to {sketch_dir}")
+    else:
+        estimates = load_docket_sketch(args.show)
+        if estimates is None:
+            raise SystemExit(
+                f"No up-to-date sketch for {args.show} in DOCKET_SKETCH_DIR"
+            )
+
+        console.print(
+            f"{args.show}: {estimates['n_comments']:,} comments, "
+            f"~{estimates['unique_comments']:,} unique, "
+            f"~{estimates['duplicate_groups']:,} texts with duplicates"
+        )
+        table = Table(title="Most copied texts")
+        table.add_column("Copies", justify="right")
+        table.add_column("± error", justify="right")
+        table.add_column("Comment")
+        for row in estimates["top"].head(10).iter_rows(named=True):
+            table.add_row(
+                f"{row['count']:,}", f"{row['error']:,}", row["comment"][:100]
+            )
+        console.print(table)
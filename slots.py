@@ -0,0 +1,302 @@
+"""
+Mail-merge slot detection for a family of near-duplicate comments.
+
+A family is every distinct comment of a docket whose string similarity to the
+representative is at least FAMILY_MIN_SIMILARITY, single copies included. Each
+member is aligned word by word against the representative with rapidfuzz's
+Levenshtein opcodes over a shared token vocabulary. Reference words and the gaps
+between them that vary in at least ``min_share`` of the members become slots,
+and adjacent variable words merge into one slot. The result is a template
+skeleton with numbered slots and the frequency of every value each slot takes.
+
+Usage:
+    python slots.py DOCKET_ID CONTENT_HASH --min-similarity 80 --top-k 10
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+import numpy as np
+import polars as pl
+from rapidfuzz import fuzz, process
+from rapidfuzz.distance import Levenshtein
+from rich.console import Console
+from rich.table import Table
+
+from instrument import span
+
+console = Console()
+
+# Share of (weighted) members that must vary at a position for it to be a slot
+MIN_SLOT_SHARE = 0.05
+# String similarity (fuzz.ratio, 0-100) to the representative of family members
+FAMILY_MIN_SIMILARITY = 80
+
+
+def _slot_spans(
+    position_share: np.ndarray, gap_share: np.ndarray, min_share: float
+) -> list[tuple[int, int]]:
+    """
+    Merge variable positions and gaps into slots.
+
+    Positions and gaps alternate (gap 0, word 0, gap 1, ..., word n-1, gap n);
+    runs of variable elements become (start, end) spans of reference words, where
+    start == end for a slot holding inserted words only.
+    """
+    n = len(position_share)
+    variable = np.empty(2 * n + 1, dtype=bool)
+    variable[0::2] = gap_share >= min_share
+    variable[1::2] = position_share >= min_share
+    # Consecutive variable words form one slot (e.g. a first and last name)
+    variable[2:-1:2] |= variable[1:-2:2] & variable[3::2]
+
+    spans = []
+    start = None
+    for e, is_variable in enumerate(variable):
+        if is_variable and start is None:
+            start = e
+        elif not is_variable and start is not None:
+            spans.append((start // 2, e // 2))
+            start = None
+    if start is not None:
+        spans.append((start // 2, len(variable) // 2))
+    return spans
+
+
+def _boundary_positions(
+    opcodes: list, boundaries: list[int]
+) -> tuple[dict[int, int], dict[int, int]]:
+    """
+    Map reference word boundaries to member word positions.
+
+    Returns the first and last member position at each boundary; they differ
+    when words were inserted at the boundary or it falls inside an edit.
+    """
+    left = {}
+    right = {}
+    for tag, i1, i2, j1, j2 in opcodes:
+        lo, hi = bisect_left(boundaries, i1), bisect_right(boundaries, i2)
+        for k in boundaries[lo:hi]:
+            if tag == "equal":
+                left_j = right_j = j1 + (k - i1)
+            else:
+                left_j = j1 if k < i2 or i1 == i2 else j2
+                right_j = j2 if k > i1 or i1 == i2 else j1
+            left[k] = min(left.get(k, left_j), left_j)
+            right[k] = max(right.get(k, right_j), right_j)
+    return left, right
+
+
+def near_duplicate_family(
+    df: pl.DataFrame, reference: str, min_similarity: float = FAMILY_MIN_SIMILARITY
+) -> pl.DataFrame:
+    """
+    Distinct comments of a docket similar enough to the reference to be members.
+
+    Every distinct comment is scored, not just duplicated ones: mail-merge members
+    with a unique name or address are often single copies.
+
+    Args:
+        df: DataFrame with a comment column
+        reference: Representative text of the family
+        min_similarity: Minimum fuzz.ratio to the reference (0-100)
+
+    Returns:
+        DataFrame with comment and count (copies of it in df)
+    """
+    family = (
+        df.filter(pl.col("comment").is_not_null())
+        .group_by("comment")
+        .agg(pl.len().alias("count"))
+    )
+    with span("slot_family", rows=len(family)) as s:
+        scores = process.cdist(
+            [reference],
+            family["comment"].to_list(),
+            scorer=fuzz.ratio,
+            score_cutoff=min_similarity,
+            workers=-1,
+        )[0]
+        family = family.filter(pl.Series(scores >= min_similarity))
+        s["members"] = len(family)
+    return family
+
+
+def detect_slots(
+    reference: str,
+    members: list[str],
+    counts: list[int] | None = None,
+    min_share: float = MIN_SLOT_SHARE,
+) -> tuple[list[tuple[str, str | int]], pl.DataFrame, pl.DataFrame]:
+    """
+    Align a family of near-duplicates against its representative and find slots.
+
+    Args:
+        reference: Representative text of the family
+        members: Member texts (None entries are skipped)
+        counts: Number of copies of each member (default: 1 each)
+        min_share: Share of members that must vary at a position to make a slot
+
+    Returns:
+        tuple: (skeleton, slots, values)
+            skeleton: ("text", words) and ("slot", slot number) segments
+            slots: slot, reference_value, n_values and varying_share per slot
+            values: slot, value, count and share, most frequent first per slot
+    """
+    ref_tokens = reference.split()
+    n = len(ref_tokens)
+    vocab: dict[str, int] = {}
+    ref_ids = [vocab.setdefault(t, len(vocab)) for t in ref_tokens]
+
+    # Identical members are aligned once and weighted by their copies
+    weights: Counter = Counter()
+    for text, count in zip(members, counts or [1] * len(members)):
+        if text is not None:
+            weights[text] += count
+    total = sum(weights.values())
+
+    position_weight = np.zeros(n)
+    gap_weight = np.zeros(n + 1)
+    alignments = []
+    with span("slot_align", rows=len(weights)):
+        for text, weight in weights.items():
+            tokens = text.split()
+            opcodes = Levenshtein.opcodes(
+                ref_ids, [vocab.setdefault(t, len(vocab)) for t in tokens]
+            ).as_list()
+            for tag, i1, i2, _, _ in opcodes:
+                if tag == "insert":
+                    gap_weight[i1] += weight
+                elif tag != "equal":
+                    position_weight[i1:i2] += weight
+            alignments.append((tokens, weight, opcodes))
+
+    spans = (
+        _slot_spans(position_weight / total, gap_weight / total, min_share)
+        if total
+        else []
+    )
+    boundaries = sorted({k for span_ in spans for k in span_})
+
+    values: list[Counter] = [Counter() for _ in spans]
+    with span("slot_values", rows=len(alignments), slots=len(spans)):
+        for tokens, weight, opcodes in alignments:
+            left, right = _boundary_positions(opcodes, boundaries)
+            for slot, (s1, s2) in enumerate(spans):
+                value = tokens[left.get(s1, 0) : right.get(s2, len(tokens))]
+                values[slot][" ".join(value)] += weight
+
+    skeleton: list[tuple[str, str | int]] = []
+    position = 0
+    for slot, (s1, s2) in enumerate(spans, start=1):
+        if s1 > position:
+            skeleton.append(("text", " ".join(ref_tokens[position:s1])))
+        skeleton.append(("slot", slot))
+        position = s2
+    if position < n:
+        skeleton.append(("text", " ".join(ref_tokens[position:])))
+
+    reference_values = [" ".join(ref_tokens[s1:s2]) for s1, s2 in spans]
+    slots = pl.DataFrame(
+        {
+            "slot": list(range(1, len(spans) + 1)),
+            "reference_value": reference_values,
+            "n_values": [len(v) for v in values],
+            "varying_share": [
+                1 - v[ref] / total for v, ref in zip(values, reference_values)
+            ],
+        },
+        schema={
+            "slot": pl.Int64,
+            "reference_value": pl.String,
+            "n_values": pl.Int64,
+            "varying_share": pl.Float64,
+        },
+    )
+    value_table = pl.DataFrame(
+        [
+            {"slot": slot, "value": value, "count": count, "share": count / total}
+            for slot, counter in enumerate(values, start=1)
+            for value, count in counter.most_common()
+        ],
+        schema={
+            "slot": pl.Int64,
+            "value": pl.String,
+            "count": pl.Int64,
+            "share": pl.Float64,
+        },
+    )
+
+    return skeleton, slots, value_table
+
+
+def skeleton_text(skeleton: list[tuple[str, str | int]]) -> str:
+    """Render a skeleton as text with {{n}} placeholders."""
+    return " ".join(
+        f"{{{{{value}}}}}" if kind == "slot" else value for kind, value in skeleton
+    )
+
+
+def print_slots(
+    skeleton: list, slots: pl.DataFrame, values: pl.DataFrame, top_k: int = 10
+) -> None:
+    """Print a skeleton and the most frequent values of each slot."""
+    console.print(skeleton_text(skeleton))
+    for row in slots.iter_rows(named=True):
+        table = Table(
+            title=f"Slot {row['slot']}: {row['n_values']:,} values, "
+            f"{row['varying_share']:.0%} differ from the reference"
+        )
+        table.add_column("Value")
+        table.add_column("Count", justify="right")
+        table.add_column("Share", justify="right")
+        for value in (
+            values.filter(pl.col("slot") == row["slot"])
+            .head(top_k)
+            .iter_rows(named=True)
+        ):
+            table.add_row(
+                value["value"] or "(empty)",
+                f"{value['count']:,}",
+                f"{value['share']:.1%}",
+            )
+        console.print(table)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from data import fetch_comments_df
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("docket_id", type=str)
+    parser.add_argument("content_hash", type=str)
+    parser.add_argument(
+        "--min-similarity",
+        type=float,
+        default=FAMILY_MIN_SIMILARITY,
+        help="Family: comments with a string similarity of at least this (0-100)",
+    )
+    parser.add_argument("--min-share", type=float, default=MIN_SLOT_SHARE)
+    parser.add_argument("--top-k", type=int, default=10)
+
+    args = parser.parse_args()
+
+    df = fetch_comments_df(docket_id=args.docket_id)
+    reference = df.filter(pl.col("content_hash") == args.content_hash)["comment"][0]
+
+    family = near_duplicate_family(df, reference, args.min_similarity)
+    console.print(
+        f"Family: {family['count'].sum():,} comments ({len(family):,} distinct)"
+    )
+
+    print_slots(
+        *detect_slots(
+            reference,
+            family["comment"].to_list(),
+            family["count"].to_list(),
+            min_share=args.min_share,
+        ),
+        top_k=args.top_k,
+    )
@@ -0,0 +1,74 @@
+"""Shared pytest fixtures."""
+
+import duckdb
+import numpy as np
+import polars as pl
+import pytest
+
+
+class FakeModel:
+    """Stand-in for SentenceTransformer: bag-of-letters embeddings."""
+
+    def __init__(self):
+        self.calls = []
+
+    def get_sentence_embedding_dimension(self):
+        return 26
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        vectors = np.zeros((len(texts), 26), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for ch in text.lower():
+                if "a" <= ch <= "z":
+                    vectors[i, ord(ch) - ord("a")] += 1
+        return vectors
+
+
+@pytest.fixture
+def fake_model(mocker):
+    """Patch the sentence transformer used by botmirror with FakeModel."""
+    model = FakeModel()
+    mocker.patch("botmirror.get_model", return_value=model)
+    mocker.patch("embedding_store.get_model", return_value=model)
+    return model
+
+
+@pytest.fixture(autouse=True)
+def clear_score_cache():
+    """Keep botmirror's raw score cache from leaking between tests."""
+    import botmirror
+
+    botmirror._score_cache.clear()
+    yield
+    botmirror._score_cache.clear()
+
+
+@pytest.fixture
+def corrupt_row_groups():
+    """
+    Overwrite the pages of a parquet file's row groups that hold none of the given
+    values, so a read that does not skip them fails. Returns the number corrupted.
+    """
+
+    def corrupt(path, column: str, values: list) -> int:
+        chunks = duckdb.execute(
+            "SELECT row_group_id, row_group_num_rows, "
+            "coalesce(dictionary_page_offset, data_page_offset), total_compressed_size "
+            "FROM parquet_metadata(?)",
+            [str(path)],
+        ).fetchall()
+        sizes = dict((rg, n) for rg, n, _, _ in chunks)
+        ends = np.cumsum([sizes[rg] for rg in sorted(sizes)])
+        rows = pl.read_parquet(path, columns=[column]).with_row_index()
+        matching = rows.filter(pl.col(column).is_in(values))["index"].to_numpy()
+        keep = set(np.searchsorted(ends, matching, side="right").tolist())
+
+        with open(path, "r+b") as fh:
+            for rg, _, offset, size in chunks:
+                if rg not in keep:
+                    fh.seek(offset)
+                    fh.write(b"\xff" * size)
+        return len(sizes) - len(keep)
+
+    return corrupt
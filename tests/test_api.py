@@ -0,0 +1,198 @@
+"""Tests for the HTTP scoring service in api.py."""
+
+import asyncio
+import json
+
+import numpy as np
+import polars as pl
+import pytest
+
+import api
+from api import MicroBatcher, Overloaded, create_app
+
+
+async def call(app, method: str, path: str, body: dict | None = None) -> tuple:
+    """Send one request to an ASGI app; returns (status, headers, json body)."""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": [(b"content-type", b"application/json")],
+        "app": app,
+    }
+    request_body = b"" if body is None else json.dumps(body).encode()
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": request_body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    start, *chunks = messages
+    headers = {k.decode(): v.decode() for k, v in start["headers"]}
+    content = b"".join(m.get("body", b"") for m in chunks)
+    return start["status"], headers, json.loads(content)
+
+
+def run_with_app(app, requests):
+    """Run the app's lifespan around concurrently sent requests."""
+
+    async def main():
+        async with app.router.lifespan_context(app):
+            return await asyncio.gather(*(call(app, *r) for r in requests))
+
+    return asyncio.run(main())
+
+
+class CountingEncoder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        vectors = np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture(autouse=True)
+def clear_dockets():
+    api._dockets.clear()
+    yield
+    api._dockets.clear()
+
+
+def test_concurrent_embeds_share_one_encode_call():
+    encoder = CountingEncoder()
+    app = create_app(encoder, max_wait_ms=50)
+
+    responses = run_with_app(
+        app, [("POST", "/embed", {"texts": [f"text {i}", "x"]}) for i in range(5)]
+    )
+
+    assert [status for status, _, _ in responses] == [200] * 5
+    assert len(encoder.calls) == 1
+    assert len(encoder.calls[0]) == 10
+    for i, (_, _, body) in enumerate(responses):
+        assert np.allclose(body["embeddings"], encoder([f"text {i}", "x"]))
+
+
+def test_batches_are_capped():
+    encoder = CountingEncoder()
+    app = create_app(encoder, max_batch=4, max_wait_ms=50)
+
+    run_with_app(app, [("POST", "/embed", {"texts": ["a", "b"]}) for _ in range(4)])
+
+    assert [len(c) for c in encoder.calls] == [4, 4]
+
+
+def test_full_queue_rejects():
+    async def main():
+        batcher = MicroBatcher(CountingEncoder(), max_queued=1)
+        # Worker not started: the first request stays queued
+        pending = asyncio.ensure_future(batcher.submit(["a"]))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await batcher.submit(["b"])
+        pending.cancel()
+
+    asyncio.run(main())
+
+
+def test_bad_request():
+    app = create_app(CountingEncoder())
+    ((status, _, body),) = run_with_app(app, [("POST", "/embed", {"texts": "a"})])
+    assert status == 400
+
+
+def test_score_and_diff():
+    app = create_app(CountingEncoder())
+    (score, diff) = run_with_app(
+        app,
+        [
+            ("POST", "/score", {"reference": "abc", "texts": ["abc", "xyz"]}),
+            ("POST", "/diff", {"a": "the cat sat", "b": "the dog sat"}),
+        ],
+    )
+
+    assert score[0] == 200
+    assert score[2]["scores"][0]["similarity"] == 100
+    assert score[2]["scores"][0]["embedding_similarity"] == pytest.approx(100)
+    assert diff[0] == 200
+    assert "cat" in diff[2]["a_html"] and "dog" in diff[2]["b_html"]
+
+
+def test_docket_endpoints(mocker, fake_model):
+    df = pl.DataFrame(
+        {
+            "comment": ["support the rule"] * 3 + ["oppose the rule"] * 2 + ["other"],
+            "content_hash": ["s"] * 3 + ["o"] * 2 + ["x"],
+            "modify_date": [1, 2, 3, 4, 5, 6],
+        }
+    ).with_columns(pl.col("comment").is_duplicated().alias("is_duplicate"))
+    load = mocker.patch.object(api, "fetch_comments_df", return_value=df)
+    app = create_app(CountingEncoder())
+
+    groups, scores, missing = run_with_app(
+        app,
+        [
+            ("GET", "/dockets/D-1/groups?top_n=1"),
+            ("POST", "/dockets/D-1/similarities", {"reference_hash": "s"}),
+            ("POST", "/dockets/D-1/similarities", {"reference_hash": "nope"}),
+        ],
+    )
+
+    assert load.call_count == 1
+    assert groups[2]["groups"] == [
+        {
+            "content_hash": "s",
+            "count": 3,
+            "n_variants": 1,
+            "comment": "support the rule",
+        }
+    ]
+    assert scores[0] == 200
+    assert [r["content_hash"] for r in scores[2]["scores"]] == ["o", "o"]
+    assert missing[0] == 404
+
+
+@pytest.mark.parametrize(
+    ("method", "path", "body", "message"),
+    [
+        ("GET", "/dockets/D-1/groups?top_n=lots", None, "'top_n' must be a number"),
+        ("GET", "/dockets/D-1/groups?top_n=0", None, "positive integer"),
+        (
+            "POST",
+            "/dockets/D-1/similarities",
+            {"reference_hash": "s", "top_k": "ten"},
+            "'top_k' must be a number",
+        ),
+        (
+            "POST",
+            "/dockets/D-1/similarities",
+            {"reference_hash": "s", "string_weight": "half"},
+            "'string_weight' must be a number",
+        ),
+        (
+            "POST",
+            "/dockets/D-1/similarities",
+            {"reference_hash": "s", "string_weight": 2},
+            "between 0 and 1",
+        ),
+    ],
+)
+def test_docket_endpoints_bad_parameters(mocker, method, path, body, message):
+    load = mocker.patch.object(api, "fetch_comments_df")
+    app = create_app(CountingEncoder())
+
+    ((status, _, response),) = run_with_app(app, [(method, path, body)])
+
+    assert status == 400
+    assert message in response["error"]
+    load.assert_not_called()
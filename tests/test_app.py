@@ -1,12 +1,23 @@
 """Tests for app.py functions."""
 
+import polars as pl
 import pytest
-from app import create_word_diff_html, _placeholder_fig
+from datetime import datetime, timedelta
 
-# Color constants used in diff highlighting
-MATCHING_COLOR = "#d4edda"  # Green background for matching text
-DELETED_COLOR = "#f8d7da"  # Red background for deleted text (reference only)
-INSERTED_COLOR = "#d1ecf1"  # Blue background for inserted text (compared only)
+from app import (
+    create_word_diff_html,
+    _placeholder_fig,
+    filter_catalog,
+    in_background,
+    with_burst_scores,
+)
+from botmirror import get_duplicate_groups
+from data import with_normalized_columns
+
+# CSS classes used in diff highlighting
+MATCHING_CLASS = "diff-eq"  # Green background for matching text
+DELETED_CLASS = "diff-del"  # Red background for deleted text (reference only)
+INSERTED_CLASS = "diff-ins"  # Blue background for inserted text (compared only)
 
 
 class TestCreateWordDiffHtml:
@@ -20,8 +31,8 @@ class TestCreateWordDiffHtml:
         html1, html2 = create_word_diff_html(text1, text2)
 
         # Both should be highlighted as matching (green)
-        assert MATCHING_COLOR in html1  # Green background for matching
-        assert MATCHING_COLOR in html2
+        assert MATCHING_CLASS in html1  # Green background for matching
+        assert MATCHING_CLASS in html2
         assert "Hello" in html1
         assert "world" in html1
         assert "test" in html1
@@ -34,12 +45,12 @@ class TestCreateWordDiffHtml:
         html1, html2 = create_word_diff_html(text1, text2)
 
         # Text1 words should be red (deleted)
-        assert DELETED_COLOR in html1  # Red background
+        assert DELETED_CLASS in html1  # Red background
         assert "Hello" in html1
         assert "world" in html1
 
         # Text2 words should be blue (inserted)
-        assert INSERTED_COLOR in html2  # Blue background
+        assert INSERTED_CLASS in html2  # Blue background
         assert "Goodbye" in html2
         assert "earth" in html2
 
@@ -51,10 +62,10 @@ class TestCreateWordDiffHtml:
         html1, html2 = create_word_diff_html(text1, text2)
 
         # Should have both matching (green) and different colors
-        assert MATCHING_COLOR in html1  # Green for matching words
-        assert DELETED_COLOR in html1  # Red for 'support'
-        assert MATCHING_COLOR in html2  # Green for matching words
-        assert INSERTED_COLOR in html2  # Blue for 'oppose'
+        assert MATCHING_CLASS in html1  # Green for matching words
+        assert DELETED_CLASS in html1  # Red for 'support'
+        assert MATCHING_CLASS in html2  # Green for matching words
+        assert INSERTED_CLASS in html2  # Blue for 'oppose'
 
         # Check specific words
         assert "support" in html1
@@ -195,3 +206,54 @@ class TestPlaceholderFig:
 
         # Check that template is set (plotly_white template should have white background)
         assert hasattr(fig.layout, "template")
+
+
+class TestStartup:
+    """Tests for the deferred startup helpers."""
+
+    def test_in_background_result(self):
+        future = in_background("test_task", lambda: 42)
+        assert future.result(timeout=5) == 42
+
+    def test_in_background_exception(self):
+        def fail():
+            raise RuntimeError("no model")
+
+        future = in_background("test_task", fail)
+        assert isinstance(future.exception(timeout=5), RuntimeError)
+
+    def test_filter_catalog(self):
+        partitions = pl.DataFrame(
+            {
+                "agency_code": ["DEA", "DEA", "EPA"],
+                "year": [2024, 2023, 2024],
+                "docket_id": ["DEA-2024-1", "DEA-2023-1", "EPA-2024-1"],
+            }
+        )
+
+        assert filter_catalog(partitions) == ["DEA-2023-1", "DEA-2024-1", "EPA-2024-1"]
+        assert filter_catalog(partitions, agency_codes=["DEA"], years=[2024]) == [
+            "DEA-2024-1"
+        ]
+
+
+def test_burst_scores_cover_every_variant_of_a_group():
+    start = datetime(2024, 1, 1)
+    df = with_normalized_columns(
+        pl.DataFrame(
+            {
+                # Two raw variants of one normalized text: a burst of three copies
+                # within minutes, and three copies a day apart
+                "comment": ["I support this."] * 3 + ["i SUPPORT this."] * 3,
+                "content_hash": ["a"] * 3 + ["b"] * 3,
+                "receive_date": [start + timedelta(minutes=i) for i in range(3)]
+                + [start + timedelta(days=i + 1) for i in range(3)],
+            }
+        ).with_columns(pl.col("receive_date").alias("modify_date"))
+    )
+
+    scored = with_burst_scores(df, get_duplicate_groups(df))
+
+    assert scored["len"].to_list() == [6]
+    # Half of the group's copies arrived in its busiest hour, not all of "a"'s
+    assert scored["burst_score"].to_list() == [50.0]
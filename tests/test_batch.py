@@ -0,0 +1,77 @@
+"""Tests for batch.py functions."""
+
+import polars as pl
+import pytest
+
+import batch
+
+
+@pytest.fixture
+def docket_df():
+    comments = ["support the rule"] * 3 + ["oppose the rule"] * 2 + ["other"]
+    return pl.DataFrame(
+        {
+            "comment": comments,
+            "content_hash": [f"h-{c}" for c in comments],
+            "modify_date": pl.datetime_range(
+                pl.datetime(2024, 1, 1), pl.datetime(2024, 1, 6), "1d", eager=True
+            ),
+        }
+    ).with_columns(pl.col("comment").is_duplicated().alias("is_duplicate"))
+
+
+def test_score_docket(docket_df, fake_model):
+    """Every representative is scored against the other duplicate groups."""
+    scores = batch.score_docket(docket_df)
+
+    assert set(scores["reference_hash"]) == {"h-support the rule", "h-oppose the rule"}
+    assert len(scores) == 2
+    row = scores.filter(pl.col("reference_hash") == "h-support the rule").row(
+        0, named=True
+    )
+    assert row["content_hash"] == "h-oppose the rule"
+    assert row["count"] == 2
+
+
+def test_score_docket_embeds_docket_once(docket_df, fake_model):
+    """All references are scored from a single encode of the docket."""
+    batch.score_docket(docket_df)
+
+    # One call for the references and one for the docket's comments
+    assert len(fake_model.calls) == 2
+
+
+def test_score_docket_top_n(docket_df, fake_model):
+    """top_n limits the references to the largest groups."""
+    scores = batch.score_docket(docket_df, top_n=1)
+    assert scores["reference_hash"].unique().to_list() == ["h-support the rule"]
+
+
+def test_score_docket_cascade(docket_df, fake_model):
+    """With a score cutoff, unrelated groups are dropped instead of scored."""
+    full = batch.score_docket(docket_df)
+    cascade = batch.score_docket(docket_df, score_cutoff=80)
+
+    assert cascade.columns == full.columns
+    assert len(cascade) < len(full)
+    assert (cascade["similarity"] >= 80).all()
+
+
+def test_run_batch_resumes(tmp_path, mocker, docket_df, fake_model):
+    """Finished dockets are written hive-style and skipped on the next run."""
+    mocker.patch(
+        "batch.get_docket_partitions",
+        return_value=pl.DataFrame(
+            {"agency_code": ["DEA"], "year": [2024], "docket_id": ["DEA-2024-0001"]}
+        ),
+    )
+    mocker.patch("batch.fetch_comments_df", return_value=docket_df)
+
+    first = batch.run_batch(out_dir=str(tmp_path))
+    second = batch.run_batch(out_dir=str(tmp_path))
+
+    path = batch.output_path(str(tmp_path), "DEA", 2024, "DEA-2024-0001")
+    assert path.exists()
+    assert first[0]["status"] == "done"
+    assert second[0]["status"] == "skipped"
+    assert len(pl.read_parquet(path)) == first[0]["rows"]
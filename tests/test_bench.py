@@ -0,0 +1,45 @@
+"""Tests for bench.py helpers."""
+
+import polars as pl
+
+from bench import compare_results, make_synthetic_docket
+
+
+class TestMakeSyntheticDocket:
+    """Tests for the synthetic docket generator."""
+
+    def test_shape_and_determinism(self):
+        """Same seed gives the same docket with the hive columns."""
+        df1 = make_synthetic_docket(200, seed=3)
+        df2 = make_synthetic_docket(200, seed=3)
+
+        assert df1.equals(df2)
+        assert len(df1) == 200
+        assert {"docket_id", "comment", "modify_date", "receive_date"} <= set(
+            df1.columns
+        )
+
+    def test_template_ratio_controls_duplicates(self):
+        """Without templates nearly every comment is unique; with them most repeat."""
+        no_templates = make_synthetic_docket(500, template_ratio=0.0)
+        all_templates = make_synthetic_docket(500, template_ratio=1.0, edit_rate=0.0)
+
+        assert no_templates["comment"].n_unique() == 500
+        assert all_templates["comment"].n_unique() <= 20
+
+    def test_text_length(self):
+        """Comments are roughly text_length characters long."""
+        df = make_synthetic_docket(50, text_length=2000)
+        mean_length = df.select(pl.col("comment").str.len_chars().mean()).item()
+        assert 1000 < mean_length < 3000
+
+
+def test_compare_results_flags_regressions():
+    """Cases slower than the threshold are flagged."""
+    base = {"results": [{"case": "a", "size": 10, "min_s": 1.0, "peak_rss_mb": 100}]}
+    new = {"results": [{"case": "a", "size": 10, "min_s": 1.5, "peak_rss_mb": 100}]}
+
+    rows = compare_results(base, new, threshold=0.1)
+
+    assert rows[0]["ratio"] == 1.5
+    assert rows[0]["regression"]
@@ -0,0 +1,249 @@
+"""Tests for the similarity scoring and the raw score cache in botmirror.py."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import polars as pl
+import pytest
+
+import botmirror
+from botmirror import (
+    assign_references,
+    cached_raw_similarities,
+    calculate_similarities,
+    cascade_similarities,
+    raw_similarities,
+    score_references,
+    weight_similarities,
+)
+
+
+@pytest.fixture
+def comments_df():
+    return pl.DataFrame(
+        {
+            "comment": [
+                "the cat sat on the mat",
+                "the cat sat on the mat",
+                "the cat sat on a mat",
+                "dogs bark loudly",
+                "dogs bark loudly",
+            ],
+            "content_hash": ["r", "r", "a", "b", "b"],
+            "is_duplicate": [True, True, True, True, True],
+        }
+    )
+
+
+def test_calculate_similarities_keeps_rows(comments_df, fake_model):
+    """Every compared row gets scores; each distinct text is scored once."""
+    scores = calculate_similarities(comments_df, "the cat sat on the mat", "r")
+
+    assert scores.columns == [
+        "comment",
+        "content_hash",
+        "similarity",
+        "embedding_similarity",
+        "similarity_w",
+    ]
+    assert scores["content_hash"].to_list() == ["a", "b", "b"]
+    assert fake_model.calls[-1] == ["dogs bark loudly", "the cat sat on a mat"]
+
+
+def test_raw_scores_cached_per_docket_and_reference(comments_df, fake_model):
+    kwargs = dict(df=comments_df, reference_text="the cat sat on the mat")
+
+    assert cached_raw_similarities("D-1", "r") is None
+    first = raw_similarities(**kwargs, exclude_hash="r", docket_id="D-1")
+    n_calls = len(fake_model.calls)
+
+    again = raw_similarities(**kwargs, exclude_hash="r", docket_id="D-1")
+    assert again is first
+    assert cached_raw_similarities("D-1", "r") is first
+    assert len(fake_model.calls) == n_calls
+
+    raw_similarities(**kwargs, exclude_hash="r", docket_id="D-2")
+    assert len(fake_model.calls) > n_calls
+
+
+def test_score_cache_evicts_least_recently_used(comments_df, fake_model, mocker):
+    mocker.patch.object(botmirror, "SCORE_CACHE_SIZE", 2)
+    kwargs = dict(df=comments_df, reference_text="x", exclude_hash="r")
+
+    raw_similarities(**kwargs, docket_id="D-1")
+    raw_similarities(**kwargs, docket_id="D-2")
+    cached_raw_similarities("D-1", "r")  # D-1 is now the most recently used
+    raw_similarities(**kwargs, docket_id="D-3")
+
+    assert cached_raw_similarities("D-1", "r") is not None
+    assert cached_raw_similarities("D-2", "r") is None
+
+
+def test_weight_similarities_reorders():
+    raw = pl.DataFrame(
+        {
+            "content_hash": ["a", "b"],
+            "similarity": [100.0, 0.0],
+            "embedding_similarity": [0.0, 100.0],
+        }
+    )
+
+    string_heavy = weight_similarities(raw, string_weight=0.9, embedding_weight=0.1)
+    embedding_heavy = weight_similarities(raw, string_weight=0.1, embedding_weight=0.9)
+
+    assert string_heavy["content_hash"].to_list() == ["a", "b"]
+    assert embedding_heavy["content_hash"].to_list() == ["b", "a"]
+    assert string_heavy["similarity_w"].to_list() == pytest.approx([90.0, 10.0])
+
+
+def test_concurrent_identical_requests_share_one_computation(comments_df, mocker):
+    started = threading.Event()
+    release = threading.Event()
+    result = pl.DataFrame({"content_hash": ["a"]})
+
+    def slow_score(**kwargs):
+        started.set()
+        release.wait(timeout=5)
+        return result
+
+    score = mocker.patch.object(botmirror, "_score_candidates", side_effect=slow_score)
+    kwargs = dict(df=comments_df, reference_text="x", exclude_hash="r", docket_id="D")
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(raw_similarities, **kwargs)
+        started.wait(timeout=5)
+        followers = [executor.submit(raw_similarities, **kwargs) for _ in range(3)]
+        release.set()
+        results = [f.result() for f in [leader, *followers]]
+
+    assert score.call_count == 1
+    assert all(r is result for r in results)
+    assert botmirror._in_flight == {}
+
+
+def test_failed_computation_is_not_cached(comments_df, mocker):
+    mocker.patch.object(
+        botmirror, "_score_candidates", side_effect=RuntimeError("boom")
+    )
+    with pytest.raises(RuntimeError):
+        raw_similarities(comments_df, "x", "r", docket_id="D")
+
+    assert cached_raw_similarities("D", "r") is None
+    assert botmirror._in_flight == {}
+
+
+def test_assign_references_picks_best_reference(fake_model):
+    df = pl.DataFrame(
+        {
+            "comment": [
+                "the cat sat on the mat",
+                "dogs bark loudly",
+                "the cat sat on a mat",
+                "dogs bark very loudly",
+                "dogs bark loudly",
+            ],
+            "content_hash": ["r1", "r2", "a", "b", "r2"],
+        }
+    )
+
+    assigned = assign_references(df, ["r1", "r2"], docket_id=None)
+
+    best = dict(zip(assigned["content_hash"], assigned["reference_hash"]))
+    assert best == {"r1": "r1", "r2": "r2", "a": "r1", "b": "r2"}
+    # One encode call for the references and one for all distinct comments
+    assert len(fake_model.calls) == 2
+
+
+def test_assign_references_matches_single_reference_scores(comments_df, fake_model):
+    assigned = assign_references(comments_df, ["b"], string_weight=0.5)
+    single = calculate_similarities(comments_df, "dogs bark loudly", "b").unique(
+        "content_hash"
+    )
+
+    row = assigned.filter(pl.col("content_hash") == "a").row(0, named=True)
+    expected = single.filter(pl.col("content_hash") == "a").row(0, named=True)
+    assert row["similarity"] == pytest.approx(expected["similarity"])
+    assert row["embedding_similarity"] == pytest.approx(
+        expected["embedding_similarity"], abs=1e-4
+    )
+
+
+def test_score_references_matches_calculate_similarities(comments_df, fake_model):
+    scores = score_references(comments_df, ["r", "b"])
+    # One encode call for the references and one for the docket
+    assert len(fake_model.calls) == 2
+
+    for reference_hash, reference_text in [
+        ("r", "the cat sat on the mat"),
+        ("b", "dogs bark loudly"),
+    ]:
+        expected = calculate_similarities(comments_df, reference_text, reference_hash)
+        got = scores.filter(pl.col("reference_hash") == reference_hash)
+        assert sorted(got["content_hash"]) == sorted(expected["content_hash"])
+        for column in ["similarity", "embedding_similarity", "similarity_w"]:
+            assert got.sort("content_hash")[column].to_list() == pytest.approx(
+                expected.sort("content_hash")[column].to_list(), abs=1e-4
+            )
+
+
+def test_assign_references_unknown_hash(comments_df, fake_model):
+    with pytest.raises(ValueError):
+        assign_references(comments_df, ["missing"])
+
+
+@pytest.fixture
+def cascade_df():
+    return pl.DataFrame(
+        {
+            "comment": [
+                "the cat sat on the mat today",
+                "the cat sat on a mat today",
+                "the cat sat on a rug today",
+                "completely unrelated words appear here instead",
+                "no",
+            ],
+            "content_hash": ["r", "a", "b", "c", "d"],
+            "is_duplicate": [True] * 5,
+        }
+    )
+
+
+def test_cascade_drops_unrelated_before_embedding(cascade_df, fake_model):
+    scores, stats = cascade_similarities(
+        cascade_df, "the cat sat on the mat today", "r", score_cutoff=60
+    )
+
+    assert sorted(scores["content_hash"]) == ["a", "b"]
+    assert stats["stage"].to_list() == ["length", "ngram", "string", "embedding"]
+    assert stats["rows_in"].to_list() == [4, 3, 2, 2]
+    # Only survivors are embedded
+    assert sorted(fake_model.calls[-1]) == sorted(
+        ["the cat sat on a mat today", "the cat sat on a rug today"]
+    )
+
+
+def test_cascade_matches_full_scores_for_survivors(cascade_df, fake_model):
+    full = calculate_similarities(cascade_df, "the cat sat on the mat today", "r")
+    scores, _ = cascade_similarities(
+        cascade_df, "the cat sat on the mat today", "r", score_cutoff=60
+    )
+
+    joined = scores.join(full, on="content_hash", suffix="_full")
+    assert joined["similarity_w"].to_list() == pytest.approx(
+        joined["similarity_w_full"].to_list()
+    )
+
+
+def test_cascade_certain_scores_skip_embedding(cascade_df, fake_model):
+    scores, stats = cascade_similarities(
+        cascade_df,
+        "the cat sat on the mat today",
+        "r",
+        score_cutoff=60,
+        certain_score=90,
+    )
+
+    row = scores.filter(pl.col("content_hash") == "a").row(0, named=True)
+    assert row["embedding_similarity"] is None
+    assert row["similarity_w"] == row["similarity"]
+    assert stats["rows_out"][-1] == 1
@@ -0,0 +1,70 @@
+"""Tests for bursts.py."""
+
+from datetime import datetime, timedelta
+
+import polars as pl
+import pytest
+
+from bursts import burst_scores
+
+
+def make_events(groups: dict[str, list[datetime]]) -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "content_hash": [g for g, times in groups.items() for _ in times],
+            "receive_date": [t for times in groups.values() for t in times],
+        }
+    )
+
+
+START = datetime(2024, 1, 1)
+
+
+def test_burst_vs_spread_out():
+    """A group arriving within one hour scores higher than one spread over days."""
+    df = make_events(
+        {
+            "burst": [START + timedelta(minutes=i) for i in range(30)],
+            "spread": [START + timedelta(hours=7 * i) for i in range(30)],
+        }
+    )
+
+    scores = {row["content_hash"]: row for row in burst_scores(df).to_dicts()}
+
+    assert scores["burst"]["burst_score"] == pytest.approx(100.0)
+    assert scores["burst"]["peak_count"] == 30
+    assert scores["spread"]["peak_count"] == 1
+    assert scores["spread"]["burst_score"] < 5
+
+
+def test_regular_arrivals_have_low_cv():
+    df = make_events(
+        {
+            "regular": [START + timedelta(minutes=10 * i) for i in range(20)],
+            "irregular": [START + timedelta(minutes=i**2) for i in range(20)],
+        }
+    )
+
+    cv = dict(burst_scores(df).select("content_hash", "interarrival_cv").iter_rows())
+
+    assert cv["regular"] == pytest.approx(0.0)
+    assert cv["irregular"] > 0.5
+
+
+def test_peak_bin_and_ratio():
+    times = [START + timedelta(days=d) for d in range(10)]
+    times += [START + timedelta(days=3, minutes=m) for m in range(10)]
+    row = burst_scores(make_events({"a": times}), every="1d").row(0, named=True)
+
+    assert row["peak_bin"] == START + timedelta(days=3)
+    assert row["peak_count"] == 11
+    assert row["n"] == 20
+    # 11 in the peak day vs 20 spread over 9 days
+    assert row["peak_ratio"] == pytest.approx(11 / (20 / 9))
+
+
+def test_small_groups_and_nulls_skipped():
+    df = make_events({"single": [START], "pair": [START, None]})
+
+    assert burst_scores(df).is_empty()
+    assert burst_scores(make_events({"pair": [START, START]}), min_size=2).height == 1
@@ -0,0 +1,202 @@
+"""Tests for corpus.py."""
+
+import shutil
+
+import numpy as np
+import polars as pl
+import pytest
+
+import corpus
+import data
+from bench import make_synthetic_docket, write_synthetic_hive
+from data2parquet import write_content_hash_index
+
+
+@pytest.fixture(scope="module")
+def corpus_index(tmp_path_factory):
+    """Two dockets sharing the same templates, indexed once, and their hash index."""
+    root = tmp_path_factory.mktemp("corpus")
+    df = pl.concat(
+        [
+            make_synthetic_docket(300, text_length=600, docket_id=d, seed=1)
+            for d in ["DEA-2024-0001", "EPA-2023-0001"]
+        ]
+    )
+    hive = write_synthetic_hive(df, str(root / "hive"))
+    hash_index = write_content_hash_index(str(root / "hive"))
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(data, "MIRRULATIONS_PARQUET", hive)
+        corpus.build_index(str(root / "index"))
+        docket = data.fetch_comments_df("DEA-2024-0001")
+
+    top = (
+        docket.group_by("content_hash")
+        .agg(pl.len(), pl.col("comment").first())
+        .sort("len", descending=True)
+        .row(0, named=True)
+    )
+    return str(root / "index"), top, hash_index
+
+
+def test_shingles_ignore_case_and_punctuation():
+    df = pl.DataFrame(
+        {
+            "content_hash": ["a", "b", "c"],
+            "comment": [
+                "One two three, four five six.",
+                "one TWO three four five six",
+                "x",
+            ],
+        }
+    )
+    shingles = corpus.shingle_hashes(df, k=5)
+
+    by_hash = shingles.group_by("content_hash").agg("shingle")
+    sets = {h: set(s) for h, s in by_hash.iter_rows()}
+    assert sets["a"] == sets["b"]
+    assert len(sets["a"]) == 2
+    assert len(sets["c"]) == 1
+
+
+def test_minhash_estimates_jaccard():
+    words = [f"w{i}" for i in range(400)]
+    edited = words.copy()
+    for i in range(0, 400, 40):
+        edited[i] = "changed"
+    df = pl.DataFrame(
+        {"content_hash": ["a", "b"], "comment": [" ".join(words), " ".join(edited)]}
+    )
+
+    shingles = corpus.shingle_hashes(df)
+    _, signatures = corpus.minhash_signatures(shingles)
+    sets = [
+        set(s)
+        for _, s in shingles.group_by("content_hash")
+        .agg("shingle")
+        .sort("content_hash")
+        .iter_rows()
+    ]
+    exact = len(sets[0] & sets[1]) / len(sets[0] | sets[1])
+
+    assert (signatures[0] == signatures[1]).mean() == pytest.approx(exact, abs=0.15)
+
+
+def test_search_by_hash_groups_dockets(corpus_index):
+    index_dir, top, hash_index = corpus_index
+    hits = corpus.search(
+        content_hash=top["content_hash"], index_dir=index_dir, hash_index=hash_index
+    )
+
+    exact = hits.filter(pl.col("match") == "exact")
+    assert set(exact["docket_id"]) == {"DEA-2024-0001", "EPA-2023-0001"}
+    assert (
+        exact.filter(pl.col("docket_id") == "DEA-2024-0001")["count"][0] == top["len"]
+    )
+
+    grouped = corpus.group_hits(hits)
+    assert grouped.height == 2
+    assert (grouped["copies"] >= grouped["exact"]).all()
+
+
+def test_search_by_edited_text_finds_near_duplicates(corpus_index):
+    index_dir, top, hash_index = corpus_index
+    words = top["comment"].split()
+    words[::30] = ["edited"] * len(words[::30])
+
+    hits = corpus.search(
+        text=" ".join(words), index_dir=index_dir, hash_index=hash_index
+    )
+
+    assert hits.filter(pl.col("match") == "exact").is_empty()
+    near = hits.filter(pl.col("content_hash") == top["content_hash"])
+    assert set(near["docket_id"]) == {"DEA-2024-0001", "EPA-2023-0001"}
+    assert near["jaccard"].min() >= corpus.MIN_JACCARD
+
+
+def test_search_skips_row_groups(corpus_index, corrupt_row_groups, tmp_path, mocker):
+    index_dir, top, hash_index = corpus_index
+    # Re-merge the parts into many small row groups
+    shutil.copytree(corpus._parts_dir(index_dir), corpus._parts_dir(str(tmp_path)))
+    mocker.patch.object(corpus, "ROW_GROUP_SIZE", 2)
+    corpus.merge_index(str(tmp_path))
+
+    buckets = corpus.band_buckets(corpus._signature_of(top["comment"])[None, :])[0]
+    lsh = pl.read_parquet(tmp_path / "lsh.parquet")
+    candidates = lsh.filter(pl.col("bucket").is_in(buckets.tolist()))["content_hash"]
+    assert corrupt_row_groups(tmp_path / "lsh.parquet", "bucket", buckets.tolist())
+    assert corrupt_row_groups(
+        tmp_path / "signatures.parquet", "content_hash", candidates.to_list()
+    )
+
+    hits = corpus.search(
+        text=top["comment"], index_dir=str(tmp_path), hash_index=hash_index
+    )
+
+    assert set(hits["content_hash"]) >= set(candidates)
+
+
+def test_build_is_resumable(corpus_index):
+    index_dir, _, _ = corpus_index
+    assert corpus.index_docket(index_dir, "DEA-2024-0001")["status"] == "skipped"
+
+
+def test_search_needs_query_and_hash_index():
+    with pytest.raises(ValueError):
+        corpus.search(index_dir="unused", hash_index="unused")
+    with pytest.raises(ValueError, match="CONTENT_HASH_INDEX"):
+        corpus.search(text="a text", index_dir="unused", hash_index=None)
+
+
+def test_band_buckets_differ_per_band():
+    signatures = np.zeros((1, corpus.NUM_PERM), dtype=np.uint32)
+    buckets = corpus.band_buckets(signatures)
+
+    assert buckets.shape == (1, corpus.BANDS)
+    assert len(set(buckets[0].tolist())) == corpus.BANDS
+
+
+def test_shingle_hashes_are_pinned():
+    # Stored signatures are compared with query signatures computed later, so
+    # shingle hashes must not depend on the Polars or Python version
+    df = pl.DataFrame({"content_hash": ["a"], "comment": ["One two three four five"]})
+
+    assert corpus.shingle_hashes(df)["shingle"].to_list() == [16668804351399435582]
+
+
+def test_search_refuses_other_index_versions(corpus_index, tmp_path):
+    index_dir, top, hash_index = corpus_index
+    query = {"content_hash": top["content_hash"], "hash_index": hash_index}
+    assert corpus.search(index_dir=index_dir, **query).height
+
+    # An index built before the version was recorded
+    with pytest.raises(ValueError, match="rebuild"):
+        corpus.search(index_dir=str(tmp_path), **query)
+
+
+def test_build_carries_on_after_a_failed_docket(tmp_path, mocker):
+    df = pl.concat(
+        [
+            make_synthetic_docket(50, text_length=200, docket_id=d)
+            for d in ["DEA-2024-0001", "EPA-2023-0001"]
+        ]
+    )
+    mocker.patch.object(
+        data, "MIRRULATIONS_PARQUET", write_synthetic_hive(df, str(tmp_path / "hive"))
+    )
+    fetch = corpus.fetch_comments_df
+
+    def flaky_fetch(docket_id):
+        if docket_id == "DEA-2024-0001":
+            raise OSError("unreadable partition")
+        return fetch(docket_id=docket_id)
+
+    mocker.patch.object(corpus, "fetch_comments_df", flaky_fetch)
+    index_dir = str(tmp_path / "index")
+
+    summaries = corpus.build_index(index_dir)
+
+    status = {s["docket_id"]: s["status"] for s in summaries}
+    assert status == {"DEA-2024-0001": "failed", "EPA-2023-0001": "done"}
+    indexed = pl.read_parquet(tmp_path / "index" / "signatures.parquet")
+    assert indexed.height == df.filter(docket_id="EPA-2023-0001")["comment"].n_unique()
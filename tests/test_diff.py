@@ -0,0 +1,133 @@
+"""Tests for diff.py functions."""
+
+import difflib
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import diff
+from diff import diff_opcodes, diff_segments, tokenize, word_diff_html
+
+
+def apply_opcodes(a, b, opcodes):
+    """Rebuild b from a using the opcodes."""
+    out = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        out.extend(a[i1:i2] if tag == "equal" else b[j1:j2])
+    return out
+
+
+class TestTokenize:
+    """Tests for the tokenize function."""
+
+    def test_roundtrip(self):
+        """Joining the tokens gives back the original text."""
+        text = "  Hello\n\nworld,  this is\ta test "
+        assert "".join(tokenize(text)) == text
+
+    def test_whitespace_tokens_separate(self):
+        """Whitespace runs are separate tokens."""
+        assert tokenize("a  b\nc") == ["a", "  ", "b", "\n", "c"]
+
+
+class TestDiffOpcodes:
+    """Tests for the diff_opcodes function."""
+
+    @pytest.mark.parametrize(
+        "a,b",
+        [
+            ("abcdef", "abcdef"),
+            ("abcdef", "abXdef"),
+            ("abc", ""),
+            ("", "abc"),
+            ("the cat sat on the mat", "a cat sat on a mat today"),
+            ("aaabbbccc", "cccbbbaaa"),
+        ],
+    )
+    def test_opcodes_cover_both_sequences(self, a, b):
+        """Opcodes tile both sequences and reconstruct the second one."""
+        a, b = list(a), list(b)
+        opcodes = diff_opcodes(a, b)
+
+        assert apply_opcodes(a, b, opcodes) == b
+        if opcodes:
+            assert opcodes[0][1] == 0 and opcodes[0][3] == 0
+            assert opcodes[-1][2] == len(a) and opcodes[-1][4] == len(b)
+        for (_, _, i2, _, j2), (_, i1, _, j1, _) in zip(opcodes, opcodes[1:]):
+            assert (i2, j2) == (i1, j1)
+
+    def test_adjacent_opcodes_merged(self):
+        """No two consecutive opcodes share a tag."""
+        opcodes = diff_opcodes(list("a b c d e"), list("a x c y e"))
+        tags = [op[0] for op in opcodes]
+        assert all(t1 != t2 for t1, t2 in zip(tags, tags[1:]))
+
+    def test_matches_as_much_as_difflib(self):
+        """Equal runs cover at least as many items as difflib finds."""
+        a = tokenize("I support this rule because it protects my family and town")
+        b = tokenize("I strongly support this rule since it protects my town")
+        ours = sum(
+            i2 - i1 for tag, i1, i2, _, _ in diff_opcodes(a, b) if tag == "equal"
+        )
+        theirs = sum(
+            i2 - i1
+            for tag, i1, i2, _, _ in difflib.SequenceMatcher(None, a, b).get_opcodes()
+            if tag == "equal"
+        )
+        assert ours >= theirs
+
+
+class TestDiffSegments:
+    """Tests for the diff_segments function."""
+
+    @pytest.mark.parametrize("level", ["word", "char"])
+    def test_segments_rebuild_texts(self, level):
+        """Concatenated segments give back both texts."""
+        text1 = "I support the rule.\nThanks, Ann"
+        text2 = "I oppose the rule.\nThanks, Bob"
+        segments = diff_segments(text1, text2, level=level)
+
+        assert "".join(s1 for _, s1, _ in segments) == text1
+        assert "".join(s2 for _, _, s2 in segments) == text2
+
+    def test_unknown_level(self):
+        """Unknown levels are rejected."""
+        with pytest.raises(ValueError):
+            diff_segments("a", "b", level="line")
+
+
+class TestWordDiffHtml:
+    """Tests for the word_diff_html function."""
+
+    def test_spans_merged(self):
+        """Identical texts render as a single matching span per side."""
+        html1, html2 = word_diff_html("one two three", "one two three")
+        assert html1.count("<span") == 1
+        assert html2.count("<span") == 1
+
+    def test_html_escaped(self):
+        """Text content is escaped."""
+        html1, _ = word_diff_html("<b>bold</b>", "plain")
+        assert "<b>" not in html1
+        assert "&lt;b&gt;" in html1
+
+    def test_cached_by_hash(self):
+        """A second call with the same hashes is served from the cache."""
+        diff._diff_cache.clear()
+        first = word_diff_html("a b", "a c", ref_hash="r", compared_hash="c")
+        second = word_diff_html("ignored", "ignored", ref_hash="r", compared_hash="c")
+        assert first is second
+
+    def test_cache_shared_between_threads(self, mocker):
+        """Concurrent lookups and evictions of a small cache do not raise."""
+        diff._diff_cache.clear()
+        mocker.patch.object(diff, "DIFF_CACHE_SIZE", 2)
+
+        def run(i):
+            return word_diff_html("a b", "a c", ref_hash=str(i % 4), compared_hash="c")
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(run, range(2000)))
+
+        assert len(results) == 2000
+        assert len(diff._diff_cache) <= 2
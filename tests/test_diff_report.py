@@ -0,0 +1,39 @@
+"""Tests for diff_report.py functions."""
+
+import polars as pl
+
+from diff_report import compute_report_diffs, render_html_report
+
+
+def test_compute_report_diffs_parallel_matches_serial():
+    """Parallel diffs come back in input order and match the serial result."""
+    reference = "I support this regulation because it protects public health."
+    comments = [
+        "I support this regulation because it protects my family.",
+        "I oppose this regulation.",
+        reference,
+    ]
+
+    serial = compute_report_diffs(reference, comments, workers=1)
+    parallel = compute_report_diffs(reference, comments, workers=2)
+
+    assert parallel == serial
+    assert [tag for tag, _, _ in serial[2]] == ["equal"]
+
+
+def test_render_html_report():
+    """The report contains one section per compared comment."""
+    top_df = pl.DataFrame(
+        {
+            "comment": ["a b c", "a x c"],
+            "content_hash": ["h1", "h2"],
+            "similarity_w": [90.0, 80.0],
+        }
+    )
+    diffs = compute_report_diffs("a b c", top_df["comment"].to_list(), workers=1)
+
+    report = render_html_report("DEA-2024-0001", "ref", top_df, diffs, "similarity_w")
+
+    assert report.count("<section>") == 2
+    assert "diff-ins" in report
+    assert "DEA-2024-0001" in report
@@ -0,0 +1,108 @@
+"""Tests for embedding_map.py."""
+
+import numpy as np
+import polars as pl
+import pytest
+
+from bench import make_clustered_vectors
+from embedding_map import (
+    bin_points,
+    docket_map_frame,
+    get_docket_map,
+    kmeans_labels,
+    map_path,
+    nearest_neighbors,
+    neighbor_layout,
+    pca_2d,
+    randomized_2d,
+)
+from embedding_store import EmbeddingStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    vectors = make_clustered_vectors(2000, dim=32, n_clusters=4, noise=0.2)
+    return EmbeddingStore.write(
+        tmp_path / "store", [str(i) for i in range(len(vectors))], vectors, "float32"
+    )
+
+
+def test_pca_matches_numpy(store):
+    vectors = store.to_float32().astype(np.float64)
+    centered = vectors - vectors.mean(axis=0)
+    _, _, vt = np.linalg.svd(centered, full_matrices=False)
+    expected = centered @ vt[:2].T
+
+    coords = pca_2d(store)
+
+    # Axes are defined up to sign
+    for axis in range(2):
+        assert abs(np.corrcoef(coords[:, axis], expected[:, axis])[0, 1]) > 0.9999
+
+
+def test_randomized_matches_pca(store):
+    coords = randomized_2d(store)
+    np.testing.assert_allclose(coords.var(axis=0), pca_2d(store).var(axis=0), rtol=1e-3)
+
+
+def test_neighbor_layout_tightens_clusters(store):
+    labels = kmeans_labels(store, k=4)
+    coords = pca_2d(store)
+
+    def within_spread(c):
+        return sum(c[labels == k].var(axis=0).sum() for k in range(4))
+
+    refined = neighbor_layout(coords, nearest_neighbors(store, 10))
+
+    assert refined.shape == coords.shape
+    np.testing.assert_allclose(refined.std(axis=0), coords.std(axis=0), rtol=1e-6)
+    assert within_spread(refined) < within_spread(coords)
+
+
+def test_map_is_cached_in_store(store, mocker):
+    first = get_docket_map(store, neighbors=5)
+    assert map_path(store, "pca", 5).exists()
+
+    project = mocker.patch("embedding_map.pca_2d")
+    second = get_docket_map(store, neighbors=5)
+
+    project.assert_not_called()
+    assert first.equals(second)
+    assert first["cluster"].n_unique() > 1
+
+
+def test_bin_points():
+    points = pl.DataFrame(
+        {
+            "x": [0.0, 0.1, 0.2, 9.9, 10.0],
+            "y": [0.0, 0.1, 0.0, 10.0, 9.8],
+            "group": ["a", "a", "b", "b", "b"],
+            "n": [1, 5, 1, 2, 2],
+            "content_hash": ["h1", "h2", "h3", "h4", "h5"],
+            "comment": ["c1", "c2", "c3", "c4", "c5"],
+        }
+    )
+
+    bins = bin_points(points, "group", bins=2)
+
+    assert bins["n"].to_list() == [7, 4]
+    assert bins["points"].to_list() == [3, 2]
+    assert bins["group"].to_list() == ["a", "b"]
+    # A bin links to its largest point
+    assert bins["content_hash"].to_list() == ["h2", "h4"]
+
+
+def test_docket_map_frame(fake_model, tmp_path):
+    df = pl.DataFrame(
+        {
+            "comment": ["support the rule"] * 3 + ["oppose it", "zzz", None],
+            "content_hash": ["s"] * 3 + ["o", "z", "n"],
+        }
+    ).with_columns(pl.col("comment").is_duplicated().alias("is_duplicate"))
+
+    points = docket_map_frame(df, "D-1", root=str(tmp_path))
+
+    assert points["content_hash"].to_list() == ["s", "o", "z"]
+    assert points["group"].to_list() == ["Group 1", "Unique", "Unique"]
+    assert points["n"].to_list() == [3, 1, 1]
+    assert points["comment"][0] == "support the rule"
@@ -0,0 +1,195 @@
+"""Tests for embedding_store.py."""
+
+import threading
+import time
+
+import numpy as np
+import polars as pl
+import pytest
+
+import botmirror
+from botmirror import calculate_similarities
+from embedding_store import (
+    STORE_DTYPES,
+    EmbeddingStore,
+    dequantize,
+    get_docket_store,
+    quantize,
+    recall_at_k,
+    store_path,
+)
+
+
+def random_unit_vectors(n: int, dim: int = 26, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class TestQuantize:
+    """Tests for quantize/dequantize."""
+
+    @pytest.mark.parametrize(
+        "dtype, atol", [("float32", 0), ("float16", 1e-3), ("int8", 1e-2)]
+    )
+    def test_round_trip(self, dtype, atol):
+        vectors = random_unit_vectors(50)
+        stored, scales = quantize(vectors, dtype)
+
+        assert stored.dtype == np.dtype(dtype)
+        np.testing.assert_allclose(dequantize(stored, scales), vectors, atol=atol)
+
+    def test_zero_rows_int8(self):
+        """All-zero rows do not divide by zero."""
+        stored, scales = quantize(np.zeros((2, 4), dtype=np.float32), "int8")
+        assert not np.isnan(dequantize(stored, scales)).any()
+
+    def test_unknown_dtype(self):
+        with pytest.raises(ValueError, match="Unknown store dtype"):
+            quantize(random_unit_vectors(2), "bfloat16")
+
+
+class TestEmbeddingStore:
+    """Tests for writing, opening and scoring a store."""
+
+    @pytest.mark.parametrize("dtype", STORE_DTYPES)
+    def test_scores_match_float32(self, tmp_path, dtype):
+        vectors = random_unit_vectors(100)
+        hashes = [f"h{i}" for i in range(100)]
+        store = EmbeddingStore.write(tmp_path / "store", hashes, vectors, dtype)
+
+        reopened = EmbeddingStore(tmp_path / "store")
+        assert isinstance(reopened.vectors, np.memmap)
+        assert len(reopened) == 100
+
+        np.testing.assert_allclose(
+            reopened.scores(vectors[0]), vectors @ vectors[0], atol=2e-2
+        )
+        rows = store.rows(["h5", "missing", "h2"])
+        np.testing.assert_array_equal(rows, [5, -1, 2])
+        np.testing.assert_allclose(
+            store.scores(vectors[0], rows[rows >= 0]),
+            vectors[[5, 2]] @ vectors[0],
+            atol=2e-2,
+        )
+
+    def test_compact_dtypes_are_smaller(self, tmp_path):
+        vectors = random_unit_vectors(100, dim=384)
+        hashes = [str(i) for i in range(100)]
+        sizes = {
+            dtype: EmbeddingStore.write(tmp_path / dtype, hashes, vectors, dtype).nbytes
+            for dtype in STORE_DTYPES
+        }
+
+        assert sizes["float16"] == sizes["float32"] // 2
+        assert sizes["int8"] < sizes["float32"] // 3.9
+
+    def test_rewrite_replaces_store(self, tmp_path):
+        path = tmp_path / "store"
+        EmbeddingStore.write(path, ["a"], random_unit_vectors(1))
+        store = EmbeddingStore.write(path, ["a", "b"], random_unit_vectors(2))
+
+        assert len(store) == 2
+        assert [p.name for p in tmp_path.iterdir()] == ["store"]
+
+
+class TestGetDocketStore:
+    """Tests for the incremental per-docket store."""
+
+    def test_encodes_only_missing(self, tmp_path, fake_model):
+        store = get_docket_store("D-1", ["h1", "h2"], ["abc", "xyz"], root=tmp_path)
+        assert len(store) == 2
+
+        store = get_docket_store(
+            "D-1", ["h1", "h2", "h3"], ["abc", "xyz", "hello"], root=tmp_path
+        )
+        assert len(store) == 3
+        assert fake_model.calls[-1] == ["hello"]
+
+        n_calls = len(fake_model.calls)
+        get_docket_store("D-1", ["h3", "h1"], ["hello", "abc"], root=tmp_path)
+        assert len(fake_model.calls) == n_calls
+
+    def test_concurrent_fills_keep_all_rows(self, tmp_path, fake_model, mocker):
+        encode = fake_model.encode
+
+        def slow_encode(texts, **kwargs):
+            # Both fills read the store before either has written it
+            time.sleep(0.2)
+            return encode(texts, **kwargs)
+
+        mocker.patch.object(fake_model, "encode", slow_encode)
+        fills = [(["h1", "h2"], ["abc", "xyz"]), (["h3"], ["hello"])]
+        threads = [
+            threading.Thread(
+                target=get_docket_store, args=("D-1", *fill), kwargs={"root": tmp_path}
+            )
+            for fill in fills
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        store = EmbeddingStore(store_path("D-1", root=tmp_path))
+        assert sorted(store.hashes.tolist()) == ["h1", "h2", "h3"]
+
+    def test_path_per_model_backend_and_dtype(self, tmp_path):
+        path = store_path(
+            "D-1", "org/model", "onnx", "int8", root=tmp_path, window_words=None
+        )
+        assert path == (
+            tmp_path / "org_model" / "onnx" / "truncate" / "comment" / "int8" / "D-1"
+        )
+
+        windowed = store_path("D-1", root=tmp_path, window_words=200, max_chunks=4)
+        assert "window200x4" in windowed.parts
+
+    def test_raw_and_normalized_texts_are_stored_apart(self, tmp_path, fake_model):
+        get_docket_store("D-1", ["h1"], ["Hello  World"], root=tmp_path)
+
+        store = get_docket_store(
+            "D-1", ["h1"], ["hello world"], root=tmp_path, text_col="normalized_comment"
+        )
+
+        # The raw-text vector under the same content_hash is not reused
+        assert fake_model.calls[-1] == ["hello world"]
+        assert store.path != store_path("D-1", root=tmp_path)
+
+
+def test_calculate_similarities_from_store(tmp_path, fake_model, mocker):
+    """Scores from the store match the in-memory embedding path."""
+    df = pl.DataFrame(
+        {
+            "comment": ["the cat sat", "the cat sat!", "dogs bark", None],
+            "content_hash": ["r", "a", "b", "n"],
+            "is_duplicate": [True, True, True, True],
+        }
+    )
+    kwargs = dict(df=df, reference_text="the cat sat", exclude_hash="r")
+
+    expected = calculate_similarities(**kwargs)
+
+    mocker.patch.object(botmirror, "EMBEDDING_CACHE_DIR", str(tmp_path))
+    cached = calculate_similarities(**kwargs, docket_id="D-1")
+
+    assert cached["content_hash"].to_list() == expected["content_hash"].to_list()
+    np.testing.assert_allclose(
+        cached["embedding_similarity"].to_numpy(),
+        expected["embedding_similarity"].to_numpy(),
+        atol=0.1,
+    )
+    assert (
+        cached.filter(pl.col("content_hash") == "n")["embedding_similarity"]
+        .is_null()
+        .all()
+    )
+
+
+def test_recall_at_k():
+    vectors = random_unit_vectors(500, dim=64)
+
+    assert recall_at_k(vectors, "float32", k=5)["recall_at_k"] == 1.0
+    float16 = recall_at_k(vectors, "float16", k=5)
+    assert float16["recall_at_k"] > 0.95
+    assert float16["bytes_per_vector"] == 128
+    assert recall_at_k(vectors, "int8", k=5)["bytes_per_vector"] == 68
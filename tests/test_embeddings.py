@@ -0,0 +1,142 @@
+"""Tests for embeddings.py and the embedding similarity expression."""
+
+import numpy as np
+import pytest
+import polars as pl
+
+from botmirror import get_embedding_similarity_pl  # noqa: F401 - needed for monkey patching
+from embeddings import check_backend_parity, encode_texts, get_model, split_windows
+from tests.conftest import FakeModel
+
+
+class TestEncodeTexts:
+    """Tests for the encode_texts function."""
+
+    def test_nulls_stay_aligned(self):
+        """None inputs become NaN rows at their original positions."""
+        embeddings = encode_texts(FakeModel(), ["abc", None, "xyz", None])
+
+        assert embeddings.shape == (4, 26)
+        assert np.isnan(embeddings[1]).all() and np.isnan(embeddings[3]).all()
+        assert not np.isnan(embeddings[0]).any()
+        assert embeddings[0, 0] > 0 and embeddings[2, 25] > 0
+
+    def test_normalized(self):
+        """Embeddings are L2-normalized by default."""
+        embeddings = encode_texts(FakeModel(), ["hello world", "abc"])
+        np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1, rtol=1e-6)
+
+    def test_duplicates_encoded_once(self):
+        """Identical texts are sent to the model once and scattered back."""
+        model = FakeModel()
+        embeddings = encode_texts(model, ["same", "other", "same"])
+
+        assert sum(len(call) for call in model.calls) == 2
+        np.testing.assert_array_equal(embeddings[0], embeddings[2])
+
+    def test_chunks_sorted_by_length(self):
+        """Texts are encoded shortest first, at most chunk_size per call."""
+        model = FakeModel()
+        texts = ["a b c d", "a", "a b c", "a b"]
+        encode_texts(model, texts, chunk_size=2)
+
+        assert model.calls == [["a", "a b"], ["a b c", "a b c d"]]
+
+    def test_all_null(self):
+        """Only nulls gives an all-NaN array without calling the model."""
+        model = FakeModel()
+        embeddings = encode_texts(model, [None, None])
+
+        assert embeddings.shape == (2, 26)
+        assert np.isnan(embeddings).all()
+        assert model.calls == []
+
+    def test_truncates_past_context_window(self):
+        """Words far past the model's context window are not sent to the model."""
+        model = FakeModel()
+        model.max_seq_length = 4
+        encode_texts(model, ["a " * 20 + "z"])
+
+        assert model.calls == [[" ".join(["a"] * 8)]]
+
+
+class TestWindows:
+    """Tests for long-text windowing and pooling."""
+
+    def test_short_text_is_one_window(self):
+        assert split_windows("a b c", window_words=5) == ["a b c"]
+
+    def test_windows_cover_text(self):
+        words = [f"w{i}" for i in range(10)]
+        windows = split_windows(" ".join(words), window_words=4, overlap=0.5)
+
+        assert windows[0] == "w0 w1 w2 w3"
+        assert windows[-1] == "w6 w7 w8 w9"
+        assert all(len(w.split()) == 4 for w in windows)
+
+    def test_max_chunks_spread_over_text(self):
+        words = [f"w{i}" for i in range(100)]
+        windows = split_windows(
+            " ".join(words), window_words=10, max_chunks=3, overlap=0
+        )
+
+        assert len(windows) == 3
+        assert windows[0].startswith("w0 ") and windows[-1].endswith("w99")
+
+    def test_pooled_embedding_sees_whole_text(self):
+        """The tail of a long text changes its pooled embedding."""
+        model = FakeModel()
+        head = "aaaa " * 10
+        embeddings = encode_texts(
+            model, [head + "zzzz " * 10, head + "bbbb " * 10], window_words=10
+        )
+
+        assert embeddings[0, 25] > 0 and embeddings[1, 1] > 0
+        np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1, rtol=1e-6)
+
+    def test_shared_windows_encoded_once(self):
+        """Windows repeated across texts (e.g. templates) are encoded once."""
+        model = FakeModel()
+        template = " ".join(["a"] * 10)
+        encode_texts(
+            model, [f"{template} b", f"{template} c"], window_words=10, max_chunks=2
+        )
+
+        windows = [w for call in model.calls for w in call]
+        assert windows.count(template) == 1
+
+
+def test_embedding_similarity_keeps_nulls(fake_model):
+    """The similarity Series has the input length, with nulls for null comments."""
+    df = pl.DataFrame({"comment": ["abc", None, "xyz"]})
+
+    scores = df.select(
+        pl.col("comment").get_embedding_similarity_pl(ref="abc")
+    ).to_series()
+
+    assert len(scores) == 3
+    assert scores[1] is None
+    assert scores[0] == pytest.approx(100.0)
+    assert scores[2] < scores[0]
+
+
+class TestBackends:
+    """Tests for backend selection and the parity check."""
+
+    def test_unknown_backend(self):
+        """Unknown backends are rejected before loading anything."""
+        with pytest.raises(ValueError):
+            get_model("all-MiniLM-L6-v2", "tensorrt")
+
+    def test_parity_check(self, mocker):
+        """Identical backends give a cosine of 1 on every sampled text."""
+        get_model_mock = mocker.patch("embeddings.get_model", return_value=FakeModel())
+        texts = ["alpha", "beta", "gamma", "alpha", None]
+
+        parity = check_backend_parity(texts, "onnx", sample_size=2)
+
+        assert parity["n"] == 2
+        assert parity["min_cosine"] == pytest.approx(1.0)
+        assert parity["max_score_diff"] == pytest.approx(0.0, abs=1e-5)
+        backends = [call.args[1] for call in get_model_mock.call_args_list]
+        assert backends == ["torch", "onnx"]
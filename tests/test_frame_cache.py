@@ -0,0 +1,54 @@
+"""Tests for the Arrow IPC docket frame cache in data.py."""
+
+import os
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+import data
+from bench import make_synthetic_docket, write_synthetic_hive
+
+DOCKET_ID = "BENCH-2024-0001"
+
+
+@pytest.fixture
+def cached_hive(tmp_path, mocker):
+    pattern = write_synthetic_hive(
+        make_synthetic_docket(100, text_length=100), str(tmp_path / "hive")
+    )
+    mocker.patch.object(data, "MIRRULATIONS_PARQUET", pattern)
+    mocker.patch.object(data, "FRAME_CACHE_DIR", str(tmp_path / "frames"))
+    return tmp_path
+
+
+def test_second_load_is_mapped_from_cache(cached_hive, mocker):
+    first = data.fetch_comments_df(DOCKET_ID)
+    cached = list((cached_hive / "frames" / DOCKET_ID).glob("*.arrow"))
+    assert len(cached) == 1
+
+    load = mocker.spy(data, "load_mirrulations_parquet")
+    second = data.fetch_comments_df(DOCKET_ID)
+
+    load.assert_not_called()
+    assert_frame_equal(first, second)
+
+
+def test_reingest_invalidates(cached_hive):
+    data.fetch_comments_df(DOCKET_ID)
+    version = data.ingest_version(DOCKET_ID)
+
+    (path,) = data.docket_files(DOCKET_ID)
+    df = pl.read_parquet(path)
+    df.head(50).write_parquet(path)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+
+    assert data.ingest_version(DOCKET_ID) != version
+    assert len(data.fetch_comments_df(DOCKET_ID)) == 50
+    # Only the current version is kept
+    assert len(list((cached_hive / "frames" / DOCKET_ID).glob("*.arrow"))) == 1
+
+
+def test_cache_disabled(cached_hive):
+    data.fetch_comments_df(DOCKET_ID, use_cache=False)
+    assert not (cached_hive / "frames").exists()
@@ -0,0 +1,86 @@
+"""Tests for the ingest-time content_hash index (data2parquet.py, data.py)."""
+
+import hashlib
+
+import polars as pl
+import pytest
+
+from bench import make_synthetic_docket, write_synthetic_hive
+from data import lookup_content_hashes, other_docket_counts
+from data2parquet import write_content_hash_index
+
+
+@pytest.fixture(scope="module")
+def hash_index(tmp_path_factory):
+    root = tmp_path_factory.mktemp("hive")
+    df = pl.concat(
+        [
+            make_synthetic_docket(200, text_length=200, docket_id=d, seed=1)
+            for d in ["DEA-2024-0001", "DEA-2024-0002", "EPA-2023-0001"]
+        ]
+    )
+    write_synthetic_hive(df, str(root))
+    return write_content_hash_index(str(root)), df
+
+
+def test_index_sorted_and_counts_match(hash_index):
+    index_path, df = hash_index
+    index = pl.read_parquet(index_path)
+
+    assert index["content_hash"].is_sorted()
+    assert index["count"].sum() == len(df)
+    assert set(index.columns) >= {"first_date", "last_date", "docket_id", "year"}
+
+
+def test_hash_matches_loader(hash_index):
+    """Index hashes are the sha256 digests used by fetch_comments_df."""
+    index_path, df = hash_index
+    comment = df["comment"][0]
+    content_hash = hashlib.sha256(comment.encode()).hexdigest()
+
+    hits = lookup_content_hashes([content_hash], index_path=index_path)
+
+    expected = df.filter(pl.col("comment") == comment)
+    assert hits["count"].sum() == len(expected)
+    assert set(hits["docket_id"]) == set(expected["docket_id"])
+    assert hits["first_date"].min() == expected["receive_date"].min()
+
+
+def test_lookup_many(hash_index):
+    index_path, df = hash_index
+    hashes = [hashlib.sha256(c.encode()).hexdigest() for c in df["comment"][:5]]
+
+    hits = lookup_content_hashes(hashes, index_path=index_path)
+
+    assert set(hits["content_hash"]) == set(hashes)
+
+
+def test_lookup_many_skips_row_groups(hash_index, corrupt_row_groups, tmp_path):
+    index_path, df = hash_index
+    small = tmp_path / "index.parquet"
+    pl.read_parquet(index_path).write_parquet(small, row_group_size=10)
+    # The first and last hashes in sort order, so a range scan would read them all
+    hashes = pl.read_parquet(small)["content_hash"].gather([0, -1]).to_list()
+    assert corrupt_row_groups(small, "content_hash", hashes)
+
+    hits = lookup_content_hashes(hashes, index_path=str(small))
+
+    assert set(hits["content_hash"]) == set(hashes)
+
+
+def test_other_docket_counts(hash_index):
+    index_path, df = hash_index
+    top = (
+        df.filter(pl.col("docket_id") == "DEA-2024-0001")
+        .group_by("comment")
+        .len()
+        .sort("len", descending=True)["comment"][0]
+    )
+    content_hash = hashlib.sha256(top.encode()).hexdigest()
+
+    others = other_docket_counts(content_hash, "DEA-2024-0001", index_path=index_path)
+
+    assert others["other_dockets"] == 2
+    assert others["other_copies"] == len(
+        df.filter(pl.col("comment") == top, pl.col("docket_id") != "DEA-2024-0001")
+    )
@@ -0,0 +1,68 @@
+"""Tests for instrument.py functions."""
+
+import json
+import logging
+
+import pytest
+
+from instrument import clear_spans, recent_spans, span, spans_frame
+
+
+@pytest.fixture(autouse=True)
+def fresh_spans():
+    clear_spans()
+    yield
+    clear_spans()
+
+
+def test_span_records_timing_and_rows():
+    """A span records wall time, rows, RSS and extra attributes."""
+    with span("load", docket_id="DEA-2024-0001") as s:
+        s["rows"] = 42
+
+    (record,) = recent_spans()
+    assert record["span"] == "load"
+    assert record["rows"] == 42
+    assert record["docket_id"] == "DEA-2024-0001"
+    assert record["seconds"] >= 0
+    assert record["rss_mb"] > 0
+
+
+def test_nested_spans_record_parent():
+    """Inner spans point at the enclosing span."""
+    with span("outer"):
+        with span("inner"):
+            pass
+
+    inner, outer = recent_spans()
+    assert inner["parent"] == "outer"
+    assert outer["parent"] is None
+
+
+def test_span_records_errors():
+    """Exceptions are recorded and re-raised."""
+    with pytest.raises(ValueError):
+        with span("broken"):
+            raise ValueError("boom")
+
+    assert "boom" in recent_spans()[0]["error"]
+
+
+def test_span_logs_json(caplog):
+    """Finished spans are logged as JSON lines."""
+    with caplog.at_level(logging.INFO, logger="botmirror"):
+        with span("group", rows=3):
+            pass
+
+    assert json.loads(caplog.records[-1].getMessage())["span"] == "group"
+
+
+def test_spans_frame_newest_first():
+    """spans_frame lists spans newest first, and is empty but typed without spans."""
+    assert spans_frame().is_empty()
+
+    for name in ["a", "b"]:
+        with span(name):
+            pass
+
+    assert spans_frame()["span"].to_list() == ["b", "a"]
@@ -0,0 +1,89 @@
+"""Tests for comment normalization and grouping on normalized_hash."""
+
+import polars as pl
+
+from botmirror import calculate_similarities, get_duplicate_groups
+from data import normalize_comment, normalize_text
+
+
+def with_normalized(df: pl.DataFrame) -> pl.DataFrame:
+    """Add the columns fetch_comments_df derives from the comment text."""
+    return df.with_columns(
+        normalize_text(pl.col("comment")).alias("normalized_comment")
+    ).with_columns(
+        pl.col("normalized_comment").hash().alias("normalized_hash"),
+        pl.col("normalized_comment").is_duplicated().alias("is_duplicate"),
+    )
+
+
+def test_normalize_text():
+    texts = pl.Series(
+        [
+            "  I  Support<br/>the   RULE ",
+            "<p>I support the rule</p>",
+            "I support &amp; endorse &nbsp;the rule",
+            "“No” means it’s closed",
+            "a < b and c > d",
+            None,
+        ]
+    )
+    assert pl.select(normalize_text(pl.lit(texts))).to_series().to_list() == [
+        "i support the rule",
+        "i support the rule",
+        "i support & endorse the rule",
+        '"no" means it\'s closed',
+        "a < b and c > d",
+        None,
+    ]
+
+
+def test_normalize_comment_matches_expression():
+    assert normalize_comment("Hello<BR>World&nbsp;!") == "hello world !"
+
+
+def test_groups_merge_trivial_variants():
+    df = with_normalized(
+        pl.DataFrame(
+            {
+                "comment": [
+                    "I support the rule",
+                    "i support  the rule",
+                    "<p>I support the rule</p>",
+                    "something else",
+                ],
+                "content_hash": ["a", "b", "c", "d"],
+                "modify_date": [1, 2, 3, 4],
+            }
+        )
+    )
+
+    groups = get_duplicate_groups(df)
+
+    assert len(groups) == 1
+    row = groups.row(0, named=True)
+    assert row["content_hash"] == "a"
+    assert row["len"] == 3
+    assert row["n_variants"] == 3
+
+
+def test_similarities_exclude_reference_variants(fake_model):
+    df = with_normalized(
+        pl.DataFrame(
+            {
+                "comment": [
+                    "I support the rule",
+                    "I SUPPORT the rule",
+                    "I oppose the rule",
+                    "i oppose the rule",
+                ],
+                "content_hash": ["a", "b", "c", "d"],
+            }
+        )
+    )
+
+    scores = calculate_similarities(df, "I support the rule", "a")
+
+    assert sorted(scores["content_hash"]) == ["c", "d"]
+    # Both variants share one score, computed on the normalized text
+    assert scores["similarity"].n_unique() == 1
+    assert fake_model.calls[-1] == ["i oppose the rule"]
@@ -0,0 +1,164 @@
+"""Tests for the partition layout written by data2parquet.py and the reads using it."""
+
+import hashlib
+import json
+from datetime import datetime
+
+import duckdb
+import polars as pl
+import pytest
+
+import data
+from bench import make_synthetic_docket, write_synthetic_hive
+from data2parquet import docket2parquet, relayout_hive
+
+DOCKET_ID = "DEA-2024-0001"
+
+
+def sha256(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def row_group_stats(path: str, column: str) -> list[tuple]:
+    """(stats_min, stats_max, has bloom filter) per row group of a column."""
+    return (
+        duckdb.connect()
+        .execute(
+            """
+            SELECT stats_min, stats_max, bloom_filter_offset IS NOT NULL
+            FROM parquet_metadata(?)
+            WHERE path_in_schema = ?
+            ORDER BY file_name, row_group_id
+            """,
+            [path, column],
+        )
+        .fetchall()
+    )
+
+
+@pytest.fixture
+def hive(tmp_path, mocker):
+    """Synthetic hive without content_hash, rewritten with the layout."""
+    df = make_synthetic_docket(10_000, text_length=50, docket_id=DOCKET_ID)
+    pattern = write_synthetic_hive(df, str(tmp_path))
+    # DuckDB rounds row groups up to its 2048-row vectors
+    relayout_hive(str(tmp_path), row_group_size=2048)
+    mocker.patch.object(data, "MIRRULATIONS_PARQUET", pattern)
+    mocker.patch.object(data, "FRAME_CACHE_DIR", None)
+    return df
+
+
+def test_relayout_sorts_and_adds_hash(hive):
+    (path,) = data.docket_files(DOCKET_ID)
+    written = pl.read_parquet(path)
+
+    assert len(written) == len(hive)
+    assert written["content_hash"].to_list() == [sha256(c) for c in written["comment"]]
+    assert written.select("content_hash", "modify_date").equals(
+        written.select("content_hash", "modify_date").sort(
+            "content_hash", "modify_date"
+        )
+    )
+
+    stats = row_group_stats(path, "content_hash")
+    assert len(stats) == 5
+    assert all(has_bloom for _, _, has_bloom in stats)
+    assert all(has_bloom for _, _, has_bloom in row_group_stats(path, "comment_id"))
+
+    # A hash lookup only has to read the row group whose range holds the hash
+    unique = hive.filter(pl.col("comment").is_unique())["comment"][0]
+    content_hash = sha256(unique)
+    assert sum(lo <= content_hash <= hi for lo, hi, _ in stats) == 1
+
+
+def test_comments_page_filters(hive):
+    comment = hive["comment"][0]
+    expected = hive.filter(pl.col("comment") == comment)
+
+    by_hash, total = data.comments_page(
+        DOCKET_ID, content_hashes=[sha256(comment)], limit=len(expected)
+    )
+    assert total == len(expected)
+    assert sorted(by_hash["comment_id"]) == sorted(expected["comment_id"])
+
+    start, end = datetime(2024, 1, 5), datetime(2024, 1, 10)
+    _, total = data.comments_page(DOCKET_ID, start=start, end=end)
+    assert total == len(
+        hive.filter(pl.col("modify_date") >= start, pl.col("modify_date") < end)
+    )
+
+    page, total = data.comments_page("NOPE-2024-0001")
+    assert page.is_empty() and total == 0
+
+
+def test_loader_uses_ingested_hash(hive, mocker):
+    sha = mocker.spy(data.hashlib, "sha256")
+
+    df = data.fetch_comments_df(DOCKET_ID)
+
+    sha.assert_not_called()
+    assert df["content_hash"][0] == sha256(df["comment"][0])
+
+
+def test_docket2parquet_from_json(tmp_path):
+    comments_dir = tmp_path / "in/mirrulations/bulk/raw-data/DEA" / DOCKET_ID
+    comments_dir = comments_dir / "text-DEA-2024-0001/comments"
+    comments_dir.mkdir(parents=True)
+    texts = ["b text", "a text", "b text", None]
+    for i, text in enumerate(texts):
+        attributes = {
+            "comment": text,
+            "modifyDate": f"2024-01-0{4 - i}T00:00:00Z",
+            "receiveDate": f"2024-01-0{4 - i}T00:00:00Z",
+        }
+        with open(comments_dir / f"{DOCKET_ID}-{i}.json", "w") as fh:
+            json.dump(
+                {"data": {"id": f"{DOCKET_ID}-{i}", "attributes": attributes}}, fh
+            )
+
+    docket2parquet(str(tmp_path / "in"), str(tmp_path / "out"))
+
+    written = pl.read_parquet(tmp_path / "out/comments/**/*.parquet")
+    hashes = [sha256(t) for t in ["a text", "b text", "b text"]]
+    assert written["content_hash"].to_list() == sorted(hashes) + [None]
+    # Copies of a text are ordered by modify_date
+    copies = written.filter(pl.col("comment") == "b text")
+    assert copies["comment_id"].to_list() == [f"{DOCKET_ID}-2", f"{DOCKET_ID}-0"]
+
+
+def test_comments_page(hive):
+    comment = hive["comment"].value_counts(sort=True)["comment"][0]
+    family = hive.filter(pl.col("comment") == comment).sort(
+        "receive_date", "comment_id", descending=[True, False]
+    )
+
+    pages = [
+        data.comments_page(
+            DOCKET_ID,
+            content_hashes=[sha256(comment)],
+            sort="receive_date",
+            descending=True,
+            offset=offset,
+            limit=100,
+        )
+        for offset in range(0, len(family), 100)
+    ]
+
+    assert all(total == len(family) for _, total in pages)
+    browsed = pl.concat([page for page, _ in pages])
+    assert browsed["comment_id"].to_list() == family["comment_id"].to_list()
+    assert "raw_json" not in browsed.columns
+
+    word = comment.split()[0]
+    matches = hive.filter(pl.col("comment").str.to_lowercase().str.contains(word))
+    page, total = data.comments_page(DOCKET_ID, search=word.upper(), limit=10)
+    assert total == len(matches)
+    expected = matches.sort("modify_date", "comment_id")["comment_id"].head(10)
+    assert page["comment_id"].to_list() == expected.to_list()
+
+    page, total = data.comments_page(DOCKET_ID, search="no such text")
+    assert total == 0
+    assert page.is_empty()
+
+    with pytest.raises(ValueError):
+        data.comments_page(DOCKET_ID, sort="comment")
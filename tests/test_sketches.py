@@ -0,0 +1,86 @@
+"""Tests for the docket sketches in sketches.py."""
+
+import os
+
+import numpy as np
+import polars as pl
+
+import data
+from bench import make_synthetic_docket, write_synthetic_hive
+from data2parquet import relayout_hive
+from sketches import HyperLogLog, SpaceSaving, load_docket_sketch, sketch_path
+
+DOCKET_ID = "DEA-2024-0001"
+
+
+def test_hyperloglog_estimate_and_merge():
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, 2**63, size=100_000, dtype=np.uint64) * np.uint64(2)
+
+    first, second = HyperLogLog(), HyperLogLog()
+    first.add(values[:60_000])
+    # Repeated values do not count twice
+    first.add(values[:10_000])
+    second.add(values[40_000:])
+
+    assert abs(first.estimate() / 60_000 - 1) < 0.02
+    assert abs(first.merge(second).estimate() / 100_000 - 1) < 0.02
+    restored = HyperLogLog.from_dict(first.to_dict())
+    assert restored.estimate() == first.estimate()
+
+    small = HyperLogLog()
+    small.add(values[:100])
+    assert round(small.estimate()) == 100
+
+
+def test_space_saving_bounds():
+    rng = np.random.default_rng(0)
+    # Zipf counts: a few heavy items and a long tail of rare ones
+    items = rng.zipf(1.5, size=50_000).astype(str)
+    exact = pl.DataFrame({"item": items}).group_by("item").len("count")
+
+    summary = SpaceSaving(k=20)
+    for batch in np.array_split(items, 10):
+        summary.update(
+            pl.DataFrame({"item": batch})
+            .group_by("item")
+            .len("count")
+            .with_columns(pl.col("count").cast(pl.Int64), label=pl.col("item"))
+        )
+
+    top = summary.top().join(exact, on="item", suffix="_exact")
+    assert len(top) == 20
+    # Counts overestimate by at most their recorded error
+    assert (top["count"] >= top["count_exact"]).all()
+    assert (top["count"] - top["error"] <= top["count_exact"]).all()
+    heaviest = exact.sort("count", descending=True)["item"].head(5)
+    assert set(heaviest) <= set(summary.top(10)["item"])
+
+
+def test_sketch_estimates(tmp_path, mocker):
+    df = make_synthetic_docket(20_000, text_length=50, docket_id=DOCKET_ID)
+    pattern = write_synthetic_hive(df, str(tmp_path))
+    relayout_hive(str(tmp_path), row_group_size=2048, similarity_sample=500)
+    mocker.patch.object(data, "MIRRULATIONS_PARQUET", pattern)
+    sketch_dir = str(tmp_path / "sketches")
+
+    estimates = load_docket_sketch(DOCKET_ID, sketch_dir=sketch_dir)
+
+    counts = df["comment"].value_counts(sort=True)
+    assert estimates["n_comments"] == len(df)
+    assert abs(estimates["unique_comments"] / len(counts) - 1) < 0.02
+    # The sample holds every distinct text of a small docket
+    assert estimates["duplicate_groups"] == (counts["count"] > 1).sum()
+    assert (
+        estimates["top"]["count"].head(5).to_list() == counts["count"].head(5).to_list()
+    )
+    assert sum(estimates["similarity"]["counts"]) > 0
+
+    assert load_docket_sketch("NOPE-2024-0001", sketch_dir=sketch_dir) is None
+    assert load_docket_sketch(DOCKET_ID, sketch_dir=None) is None
+
+    # Re-ingested partitions make the sketch stale
+    sketched_at = sketch_path(DOCKET_ID, sketch_dir).stat().st_mtime_ns
+    (path,) = data.docket_files(DOCKET_ID)
+    os.utime(path, ns=(sketched_at + 10**9, sketched_at + 10**9))
+    assert load_docket_sketch(DOCKET_ID, sketch_dir=sketch_dir) is None
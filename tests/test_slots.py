@@ -0,0 +1,73 @@
+"""Tests for mail-merge slot detection in slots.py."""
+
+import polars as pl
+
+from slots import detect_slots, near_duplicate_family, skeleton_text
+
+TEMPLATE = "Dear Administrator, my name is {name} and I live in {city}. I {adverb}oppose this rule."
+
+
+def letter(name: str, city: str, adverb: str = "") -> str:
+    return TEMPLATE.format(name=name, city=city, adverb=adverb)
+
+
+def test_mail_merge_family():
+    reference = letter("John Smith", "Denver")
+    members = [
+        letter("John Smith", "Denver"),
+        letter("Jane Doe", "Austin"),
+        letter("Ann Lee", "Denver", "strongly "),
+        letter("Bob Ray", "Austin"),
+    ]
+
+    skeleton, slots, values = detect_slots(reference, members, [4, 3, 2, 1])
+
+    assert (
+        skeleton_text(skeleton)
+        == "Dear Administrator, my name is {{1}} and I live in {{2}} I {{3}} oppose this rule."
+    )
+    # First and last name merge into one slot
+    assert slots["reference_value"].to_list() == ["John Smith", "Denver.", ""]
+    assert slots["n_values"].to_list() == [4, 2, 2]
+    names = values.filter(slot=1)
+    assert names["value"].to_list() == ["John Smith", "Jane Doe", "Ann Lee", "Bob Ray"]
+    assert names["count"].to_list() == [4, 3, 2, 1]
+    assert values.filter(slot=3, value="strongly")["share"].item() == 0.2
+
+
+def test_rare_edits_are_not_slots():
+    reference = letter("John Smith", "Denver")
+    members = [reference] * 50 + [reference.replace("rule", "regulation")]
+
+    skeleton, slots, values = detect_slots(reference, members, min_share=0.05)
+
+    assert slots.is_empty()
+    assert values.is_empty()
+    assert skeleton_text(skeleton) == reference
+
+
+def test_empty_family():
+    skeleton, slots, values = detect_slots("a b c", [None])
+
+    assert skeleton == [("text", "a b c")]
+    assert slots.is_empty()
+    assert values.is_empty()
+
+
+def test_family_includes_single_copies():
+    reference = letter("John Smith", "Denver")
+    df = pl.DataFrame(
+        {
+            "comment": [reference] * 3
+            + [letter("Jane Doe", "Austin"), letter("Ann Lee", "Boulder")]
+            + ["An unrelated comment about something else entirely.", None],
+        }
+    )
+
+    family = near_duplicate_family(df, reference)
+
+    assert dict(family.iter_rows()) == {
+        reference: 3,
+        letter("Jane Doe", "Austin"): 1,
+        letter("Ann Lee", "Boulder"): 1,
+    }
@@ -2,13 +2,34 @@ from rich.console import Console
 from rich.text import Text
 from rich.columns import Columns
 from rich.panel import Panel
-import difflib
+from diff import diff_segments
 
+# Rich styles for (reference, compared) segments per diff tag
+DIFF_STYLES = {
+    "equal": ("dim", "dim"),
+    "delete": ("red strike", None),
+    "insert": (None, "orange1"),
+    "replace": ("red strike", "blue"),
+}
 
-def rich_diff_display(reference, comment, similarity_score):
-    console = Console()
 
-    # Create similarity indicator
+def segments_to_rich(segments):
+    """Build styled reference and comment Text objects from diff segments."""
+    reference_display = Text()
+    comment_display = Text()
+
+    for tag, ref_segment, comment_segment in segments:
+        ref_style, comment_style = DIFF_STYLES[tag]
+        if ref_segment:
+            reference_display.append(ref_segment, style=ref_style)
+        if comment_segment:
+            comment_display.append(comment_segment, style=comment_style)
+
+    return reference_display, comment_display
+
+
+def similarity_label(similarity_score):
+    """Create a colored similarity indicator."""
     similarity_color = "gray"
     similarity_text = Text("Similarity: not provided")
     if similarity_score:
@@ -22,23 +43,21 @@ def rich_diff_display(reference, comment, similarity_score):
             f"Similarity: {similarity_score}", style=f"bold {similarity_color}"
         )
 
-    # Create diff
-    matcher = difflib.SequenceMatcher(None, reference, comment)
+    return similarity_text
 
-    reference_display = Text()
-    comment_display = Text()
 
-    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-        if tag == "equal":
-            reference_display.append(reference[i1:i2], style="dim")
-            comment_display.append(comment[j1:j2], style="dim")
-        elif tag == "delete":
-            reference_display.append(reference[i1:i2], style="red strike")
-        elif tag == "insert":
-            comment_display.append(comment[j1:j2], style="orange1")
-        elif tag == "replace":
-            reference_display.append(reference[i1:i2], style="red strike")
-            comment_display.append(comment[j1:j2], style="blue")
+def rich_diff_display(
+    reference, comment, similarity_score, level="char", console=None, segments=None
+):
+    console = console or Console()
+
+    # Create similarity indicator
+    similarity_text = similarity_label(similarity_score)
+
+    # Create diff (unless precomputed by the caller)
+    if segments is None:
+        segments = diff_segments(reference, comment, level=level)
+    reference_display, comment_display = segments_to_rich(segments)
 
     # Create panels
     ref_panel = Panel(reference_display, title="Reference Comment", border_style="blue")
@@ -59,9 +78,13 @@ if __name__ == "__main__":
     parser.add_argument("reference", type=str)
     parser.add_argument("comment", type=str)
     parser.add_argument("similarity", type=float)
+    parser.add_argument("--level", choices=["char", "word"], default="char")
 
     args = parser.parse_args()
 
     rich_diff_display(
-        reference=args.reference, comment=args.comment, similarity_score=args.similarity
+        reference=args.reference,
+        comment=args.comment,
+        similarity_score=args.similarity,
+        level=args.level,
     )